@@ -3,24 +3,178 @@ Flask API Server for AI Exam Generator
 Provides REST endpoints for the frontend HTML application
 """
 
-from flask import Flask, request, jsonify, send_file
+import time
+from flask import Flask, Blueprint, request, jsonify, send_file, Response, stream_with_context, g
 from flask_cors import CORS
+from werkzeug.wsgi import ClosingIterator
 import os
-from generator import QuestionGenerator
-from formatter import Formatter
-from evaluator import Evaluator
-import re
+import json
+from io import BytesIO
+from formatter import Formatter, pdf_filename
+from parsing import parse_evaluation, parse_stats
+from registry import ComponentRegistry
+from jobs import PDFJobQueue
+from blob_store import BlobStore, PDFCache
+from sampler import ExamSampler, student_seed
+import bulk
+import async_client
+import metrics
+import prompts
+import resilience
+import similarity
+from cache import GenerationCache, EvaluationCache, make_backend, normalize_text
+from singleflight import SingleFlight
+from local_grader import LocalGrader, same_question
+from store import ResultsStore
+from question_bank import get_bank
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+# Routes live on a blueprint so create_app() can build the application for any server
+api = Blueprint('api', __name__)
 
-# Store API key in app config (can be set via environment variable)
-app.config['API_KEY'] = os.getenv('GOOGLE_API_KEY')
+# Cache of AI-generated questions (in memory, optionally persisted to SQLite)
+generation_cache = GenerationCache(make_backend(
+    max_size=int(os.getenv('GENERATION_CACHE_SIZE', '256')),
+    ttl=float(os.getenv('GENERATION_CACHE_TTL', '3600')) or None,
+    path=os.getenv('GENERATION_CACHE_PATH')
+))
 
-# Initialize components (will be initialized with API key when needed)
-generator = None
-evaluator = None
+# Cache of evaluations keyed by question + normalized student answer
+evaluation_cache = EvaluationCache(make_backend(
+    max_size=int(os.getenv('EVALUATION_CACHE_SIZE', '4096')),
+    ttl=float(os.getenv('EVALUATION_CACHE_TTL', '0')) or None,
+    path=os.getenv('EVALUATION_CACHE_PATH')
+))
+
+# Generator/evaluator pairs are built once per API key and shared between threads
+registry = ComponentRegistry(
+    max_size=int(os.getenv('REGISTRY_MAX_SIZE', '32')),
+    pinned_keys=[os.getenv('GOOGLE_API_KEY')],
+    generation_cache=generation_cache,
+    evaluation_cache=evaluation_cache,
+    structured_output=os.getenv('STRUCTURED_OUTPUT', '').lower() in ('1', 'true', 'yes')
+)
 formatter = Formatter()
+sampler = ExamSampler()
+
+# Rendered PDFs are kept in memory by content hash (PDF_STORAGE=disk writes to the working directory)
+pdf_store = None
+pdf_cache = None
+if os.getenv('PDF_STORAGE', 'memory').lower() == 'memory':
+    pdf_store = BlobStore(max_bytes=int(os.getenv('PDF_STORE_MAX_BYTES', str(64 * 1024 * 1024))))
+    # Identical papers (e.g. predefined subjects) reuse the stored render
+    pdf_cache = PDFCache(pdf_store, max_entries=int(os.getenv('PDF_CACHE_SIZE', '1024')))
+
+# PDFs are rendered in the background; clients poll /pdf/status/<job_id>
+pdf_jobs = PDFJobQueue(
+    formatter,
+    max_workers=int(os.getenv('PDF_WORKERS', '2')),
+    max_jobs=int(os.getenv('PDF_MAX_JOBS', '1000')),
+    blob_store=pdf_store,
+    pdf_cache=pdf_cache
+)
+
+# Identical concurrent requests share one generation, evaluation or render
+generation_flights = SingleFlight()
+evaluation_flights = SingleFlight()
+render_flights = SingleFlight()
+
+# Deadline and in-flight cap for every Gemini call
+async_client.configure(
+    timeout=float(os.getenv('LLM_TIMEOUT', '30')),
+    max_concurrency=int(os.getenv('LLM_MAX_CONCURRENCY', '16'))
+)
+
+# Per-key rate limit, retries with backoff, and circuit breaker for Gemini calls
+resilience.configure(
+    rate=float(os.getenv('LLM_RATE_LIMIT', '5')),
+    burst=int(os.getenv('LLM_RATE_BURST', '10')),
+    max_retries=int(os.getenv('LLM_MAX_RETRIES', '2')),
+    base_delay=float(os.getenv('LLM_RETRY_BASE_DELAY', '0.5')),
+    max_delay=float(os.getenv('LLM_RETRY_MAX_DELAY', '8')),
+    failure_threshold=int(os.getenv('LLM_BREAKER_THRESHOLD', '5')),
+    reset_timeout=float(os.getenv('LLM_BREAKER_RESET', '30')),
+    max_keys=int(os.getenv('LLM_MAX_KEYS', '256'))
+)
+
+# Answers to known questions are graded locally first; only unclear ones go to Gemini
+local_grader = None
+if os.getenv('LOCAL_GRADING', '1').lower() not in ('0', 'false', 'no'):
+    local_grader = LocalGrader(
+        high=float(os.getenv('LOCAL_GRADE_HIGH', '0.7')),
+        low=float(os.getenv('LOCAL_GRADE_LOW', '0.15'))
+    )
+
+# Generated papers and graded answers are recorded in SQLite (RESULTS_DB_PATH= disables it)
+results_store = None
+if os.getenv('RESULTS_DB_PATH', 'exam_results.db'):
+    results_store = ResultsStore(
+        os.getenv('RESULTS_DB_PATH', 'exam_results.db'),
+        batch_size=int(os.getenv('RESULTS_BATCH_SIZE', '200')),
+        flush_interval=float(os.getenv('RESULTS_FLUSH_INTERVAL', '0.5'))
+    )
+
+# Batch evaluation: pairs per prompt, prompts in flight, and items per request
+BATCH_EVAL_CHUNK_SIZE = int(os.getenv('BATCH_EVAL_CHUNK_SIZE', '10'))
+BATCH_EVAL_CONCURRENCY = int(os.getenv('BATCH_EVAL_CONCURRENCY', '4'))
+BATCH_EVAL_MAX_ITEMS = int(os.getenv('BATCH_EVAL_MAX_ITEMS', '500'))
+
+# Bulk cohort papers: maximum papers per request and render processes (0 = CPU count)
+BULK_MAX_VARIANTS = int(os.getenv('BULK_MAX_VARIANTS', '1000'))
+BULK_PROCESSES = int(os.getenv('BULK_PROCESSES', '0')) or None
+
+
+def create_app(config=None):
+    """
+    Build the Flask application.
+    
+    The caches, registry and job queue above are shared by every app built in the process.
+    
+    Args:
+        config (dict): Extra Flask config values
+    
+    Returns:
+        Flask: Application with all API routes registered
+    """
+    app = Flask(__name__)
+    CORS(app)  # Enable CORS for all routes
+    
+    # Store API key in app config (can be set via environment variable)
+    app.config['API_KEY'] = os.getenv('GOOGLE_API_KEY')
+    if config:
+        app.config.update(config)
+    
+    app.register_blueprint(api)
+    return app
+
+
+def preload():
+    """Build the question bank, similarity index, grading weights and PDF layout now (before a pre-fork server forks its workers)."""
+    bank = get_bank()
+    print(f"Question bank ready: {len(bank.subjects())} subjects")
+    index = similarity.get_index()
+    print(f"Similarity index ready: {len(index)} questions")
+    if local_grader is not None:
+        local_grader.prepare()
+    formatter.prepare()
+
+
+def shutdown(timeout=30):
+    """
+    Drain background work before the process exits.
+    
+    Waits for in-flight Gemini calls (cancelling any still running after `timeout` seconds),
+    for queued PDF renders and for queued result writes, and stops the cohort render processes.
+    
+    Args:
+        timeout (float): Longest wait for in-flight Gemini calls
+    """
+    cancelled = async_client.shutdown(timeout=timeout)
+    if cancelled:
+        print(f"Cancelled {cancelled} Gemini calls still running at shutdown")
+    pdf_jobs.shutdown(wait=True)
+    bulk.shutdown()
+    if results_store is not None:
+        results_store.close()
 
 
 def get_api_key():
@@ -35,31 +189,95 @@ def get_api_key():
     return api_key
 
 
-def initialize_components(api_key=None, use_predefined=False):
-    """Initialize generator and evaluator with API key"""
-    global generator, evaluator
-    
+def get_components(api_key=None):
+    """Get the shared (generator, evaluator) pair for an API key"""
     if not api_key:
         api_key = get_api_key()
     
-    # Use predefined questions if no API key (for Java, Python, ML, Database)
-    if not api_key:
-        use_predefined = True
-    
-    generator = QuestionGenerator(api_key=api_key, use_predefined=use_predefined)
+    # Without an API key the generator uses predefined questions and there is no evaluator
+    with metrics.timer('component_init'):
+        return registry.get(api_key)
+
+
+def valid_id(value):
+    """Whether value is absent or a string or integer (bools are rejected)"""
+    return value is None or (isinstance(value, (str, int)) and not isinstance(value, bool))
+
+
+def valid_mix(difficulty_mix):
+    """Whether difficulty_mix is absent or maps difficulties to non-negative weights"""
+    return difficulty_mix is None or (isinstance(difficulty_mix, dict) and all(
+        isinstance(w, (int, float)) and w >= 0 for w in difficulty_mix.values()))
+
+
+def collect_metrics():
+    """Report cache, parser, upstream, job and coalescing counters to /metrics at scrape time."""
+    caches = {'generation': generation_cache.stats(), 'evaluation': evaluation_cache.stats(),
+              'components': registry.stats(), 'pdf_layout': formatter.stats()}
+    if pdf_cache is not None:
+        caches['pdf'] = pdf_cache.stats()
+    keys = resilience.stats()['keys']
+    flights = {'generate': generation_flights.stats(), 'evaluate': evaluation_flights.stats(),
+               'render': render_flights.stats()}
+    job_counts = pdf_jobs.stats()
+    coalesced_jobs = job_counts.pop('coalesced')
+    tokens = prompts.token_stats.stats()
     
-    # Only initialize evaluator if we have API key
-    if api_key:
-        evaluator = Evaluator(api_key=api_key)
-    else:
-        evaluator = None
+    return [
+        ('exam_cache_hits_total', 'counter', 'Cache hits by cache',
+         [({'cache': name}, c['hits']) for name, c in caches.items()]),
+        ('exam_cache_misses_total', 'counter', 'Cache misses by cache',
+         [({'cache': name}, c['misses']) for name, c in caches.items()]),
+        ('exam_cache_entries', 'gauge', 'Entries held by each cache',
+         [({'cache': name}, c['size']) for name, c in caches.items()]),
+        ('exam_parse_events_total', 'counter', 'Model output parsing events (fallbacks, placeholders, repairs)',
+         [({'event': event}, count) for event, count in sorted(parse_stats.stats().items())]),
+        ('exam_upstream_calls_total', 'counter', 'Gemini calls per API key (short hash)',
+         [({'key': label}, k['calls']) for label, k in keys.items()]),
+        ('exam_upstream_retries_total', 'counter', 'Gemini call retries per API key',
+         [({'key': label}, k['retries']) for label, k in keys.items()]),
+        ('exam_upstream_throttled_total', 'counter', 'Gemini calls delayed by the rate limiter per API key',
+         [({'key': label}, k['throttled']) for label, k in keys.items()]),
+        ('exam_upstream_breaker_open', 'gauge', '1 while the circuit breaker for an API key is not closed',
+         [({'key': label}, int(k['state'] != 'closed')) for label, k in keys.items()]),
+        ('exam_llm_tokens_total', 'counter', 'Gemini tokens by operation (reported by the API, else estimated)',
+         [({'operation': name, 'kind': kind}, t[f'{kind}_tokens'])
+          for name, t in tokens['operations'].items() for kind in ('prompt', 'output')]),
+        ('exam_prompt_truncations_total', 'counter', 'Oversize inputs shortened before sending, by field',
+         [({'field': field}, count) for field, count in tokens['truncated'].items()]),
+        ('exam_pdf_jobs', 'gauge', 'Background PDF jobs by status',
+         [({'status': status}, count) for status, count in job_counts.items()]),
+        ('exam_coalesced_requests_total', 'counter', 'Requests that shared an identical in-flight call',
+         [({'operation': name}, f['coalesced']) for name, f in flights.items()] +
+         [({'operation': 'pdf_job'}, coalesced_jobs)]),
+    ]
+
+
+metrics.REGISTRY.register_collector(collect_metrics)
+
 
+@api.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
 
-@app.route('/generate', methods=['POST'])
+
+@api.after_request
+def record_request(response):
+    # Label by route pattern (not the raw path) so PDF names and job ids do not explode the series
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    start = g.get('request_start')
+    if start is not None:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, method=request.method)
+    metrics.REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+
+@api.route('/generate', methods=['POST'])
 def generate_exam():
     """Generate exam questions endpoint"""
     try:
-        data = request.get_json()
+        with metrics.timer('request_parse'):
+            data = request.get_json()
         
         if not data:
             return jsonify({'error': 'No JSON data provided'}), 400
@@ -73,27 +291,60 @@ def generate_exam():
         if not isinstance(num_questions, int) or num_questions < 1:
             num_questions = 5
         
-        # Initialize components (will use predefined questions if no API key)
-        api_key = get_api_key()
-        use_predefined = not bool(api_key)
-        initialize_components(api_key, use_predefined=use_predefined)
+        # Optional randomized paper from the bank: seed or student_id make it reproducible
+        seed = data.get('seed')
+        student_id = data.get('student_id')
+        exclude = data.get('exclude') or []
+        difficulty_mix = data.get('difficulty_mix')
         
-        # Generate questions with answers (will use predefined if available)
-        questions_data = generator.create_questions(subject, num_questions, include_answers=True)
+        if not isinstance(exclude, list) or not all(isinstance(text, str) for text in exclude):
+            return jsonify({'error': 'exclude must be a list of question texts'}), 400
         
-        # Create PDF (with answers) - pass full questions_data
-        try:
-            pdf_filename = formatter.make_pdf(subject, questions_data, include_answers=True)
-            pdf_url = f"/pdf/{pdf_filename}"
-        except Exception as e:
-            print(f"Error creating PDF: {e}")
-            pdf_url = None
+        if not valid_mix(difficulty_mix):
+            return jsonify({'error': 'difficulty_mix must map difficulties to non-negative weights'}), 400
+        
+        if not valid_id(seed) or not valid_id(student_id):
+            return jsonify({'error': 'seed and student_id must be strings or integers'}), 400
+        
+        questions_data = None
+        if (any(v is not None for v in (seed, student_id, difficulty_mix)) or exclude) and subject in get_bank():
+            sample_seed = student_seed(subject, student_id, seed) if student_id is not None else seed
+            questions_data = sampler.sample(subject, num_questions, mix=difficulty_mix,
+                                            seed=sample_seed, exclude=exclude)
+            # A bank subject never falls back to the unfiltered predefined list (it would
+            # hand back the excluded questions); a short paper is returned as it is
+            if not questions_data:
+                return jsonify({'error': 'Every bank question for this subject is excluded'}), 400
+            metrics.FALLBACKS.inc(source='sampled')
+        
+        if questions_data is None:
+            # Get components (will use predefined questions if no API key)
+            api_key = get_api_key()
+            generator, _ = get_components(api_key)
+            
+            # Generate questions with answers (will use predefined if available); clients asking
+            # for the same paper at the same moment share one generation
+            flight_key = (resilience.key_id(api_key), ' '.join(subject.lower().split()), num_questions)
+            questions_data = generation_flights.do(flight_key, generator.create_questions,
+                                                   subject, num_questions, include_answers=True)
+        
+        # Queue PDF (with answers) - pass full questions_data; the client polls for it
+        pdf_job_id = pdf_jobs.submit(subject, questions_data, include_answers=True)
+        
+        # Keep the paper so it can be re-opened and its answers graded later
+        exam_id = None
+        if results_store is not None:
+            exam_id = results_store.record_exam(subject, questions_data, seed=seed, student_id=student_id)
         
         return jsonify({
             'questions': questions_data,  # Return full data with answers
-            'pdf_url': pdf_url,
+            'pdf_url': None,
+            'pdf_job_id': pdf_job_id,
+            'pdf_status_url': f"/pdf/status/{pdf_job_id}",
             'subject': subject,
-            'num_questions': len(questions_data)
+            'num_questions': len(questions_data),
+            'seed': seed,
+            'exam_id': exam_id
         }), 200
         
     except ValueError as e:
@@ -102,11 +353,130 @@ def generate_exam():
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
 
-@app.route('/evaluate', methods=['POST'])
+@api.route('/generate/stream', methods=['POST'])
+def generate_exam_stream():
+    """Generate exam questions, streaming each one as soon as it is parsed"""
+    with metrics.timer('request_parse'):
+        data = request.get_json(silent=True)
+    
+    if not data:
+        return jsonify({'error': 'No JSON data provided'}), 400
+    
+    subject = str(data.get('subject') or '').strip()
+    num_questions = data.get('num_questions', 5)
+    
+    if not subject:
+        return jsonify({'error': 'Subject is required'}), 400
+    
+    if not isinstance(num_questions, int) or num_questions < 1:
+        num_questions = 5
+    
+    # NDJSON by default; Server-Sent Events when the client asks for them
+    use_sse = request.args.get('format') == 'sse' or \
+        request.accept_mimetypes.best == 'text/event-stream'
+    
+    def encode(event):
+        line = json.dumps(event)
+        return f"data: {line}\n\n" if use_sse else line + "\n"
+    
+    generator, _ = get_components()
+    
+    def events():
+        questions_data = []
+        try:
+            for item in generator.stream_questions(subject, num_questions, include_answers=True):
+                questions_data.append(item)
+                yield encode(dict(item, type='question', index=len(questions_data) - 1))
+        except Exception as e:
+            yield encode({'type': 'error', 'error': f'Server error: {str(e)}'})
+            return
+        
+        # The PDF needs the whole paper, so it is queued once the stream is complete
+        pdf_job_id = pdf_jobs.submit(subject, questions_data, include_answers=True)
+        exam_id = results_store.record_exam(subject, questions_data) if results_store is not None else None
+        yield encode({
+            'type': 'done',
+            'subject': subject,
+            'num_questions': len(questions_data),
+            'pdf_job_id': pdf_job_id,
+            'pdf_status_url': f"/pdf/status/{pdf_job_id}",
+            'exam_id': exam_id
+        })
+    
+    mimetype = 'text/event-stream' if use_sse else 'application/x-ndjson'
+    return Response(stream_with_context(events()), mimetype=mimetype,
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@api.route('/generate/bulk', methods=['POST'])
+def generate_bulk():
+    """Generate one variant paper per student and return them as a ZIP of PDFs"""
+    try:
+        with metrics.timer('request_parse'):
+            data = request.get_json()
+        
+        if not data:
+            return jsonify({'error': 'No JSON data provided'}), 400
+        
+        subject = str(data.get('subject') or '').strip()
+        num_questions = data.get('num_questions', 5)
+        variants = data.get('variants')
+        student_ids = data.get('student_ids')
+        difficulty_mix = data.get('difficulty_mix')
+        
+        if not subject:
+            return jsonify({'error': 'Subject is required'}), 400
+        
+        if not isinstance(num_questions, int) or num_questions < 1:
+            num_questions = 5
+        
+        if student_ids is not None:
+            if not isinstance(student_ids, list) or not student_ids:
+                return jsonify({'error': 'student_ids must be a non-empty list'}), 400
+            student_ids = [str(student_id) for student_id in student_ids]
+            if len(set(student_ids)) != len(student_ids):
+                return jsonify({'error': 'student_ids must be unique'}), 400
+            variants = len(student_ids)
+        elif not isinstance(variants, int) or isinstance(variants, bool) or variants < 1:
+            return jsonify({'error': 'variants (number of papers) or student_ids is required'}), 400
+        
+        if variants > BULK_MAX_VARIANTS:
+            return jsonify({'error': f'At most {BULK_MAX_VARIANTS} papers per request'}), 400
+        
+        if not valid_id(data.get('seed')):
+            return jsonify({'error': 'seed must be a string or integer'}), 400
+        
+        if not valid_mix(difficulty_mix):
+            return jsonify({'error': 'difficulty_mix must map difficulties to non-negative weights'}), 400
+        
+        generator, _ = get_components()
+        archive = bulk.generate_cohort(
+            subject, num_questions,
+            variants=variants,
+            student_ids=student_ids,
+            exam_seed=data.get('seed'),
+            mix=difficulty_mix,
+            include_answers=bool(data.get('include_answers', False)),
+            answer_keys=bool(data.get('answer_keys', False)),
+            generator=generator,
+            processes=BULK_PROCESSES
+        )
+        
+        return send_file(BytesIO(archive), mimetype='application/zip', as_attachment=True,
+                         download_name=pdf_filename(subject).replace('_Exam.pdf', '_Cohort.zip'))
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+
+@api.route('/evaluate', methods=['POST'])
 def evaluate_answer():
     """Evaluate student answer endpoint"""
     try:
-        data = request.get_json()
+        with metrics.timer('request_parse'):
+            data = request.get_json()
         
         if not data:
             return jsonify({'error': 'No JSON data provided'}), 400
@@ -120,39 +490,228 @@ def evaluate_answer():
         if not answer:
             return jsonify({'error': 'Answer is required'}), 400
         
-        # Initialize components (evaluation requires API key)
-        api_key = get_api_key()
-        if not api_key:
-            return jsonify({'error': 'API key required for evaluation. Set GOOGLE_API_KEY environment variable.'}), 500
+        exam_id, question_index, student_id, reference, subject = answer_fields(data)
+        stored = stored_question(exam_id, question_index, question)
         
-        initialize_components(api_key, use_predefined=False)
+        # Known questions (or a supplied reference answer) are graded locally when clearly wrong
+        reference = reference or (stored or {}).get('answer')
+        local = None
+        result = None
+        if local_grader is not None:
+            local = local_grader.grade(question, answer, reference=reference, subject=subject)
+            if local is not None and local['confident']:
+                result = local_grade(local, 'local')
         
-        if not evaluator:
-            return jsonify({'error': 'Evaluator not initialized. API key required.'}), 500
+        if result is None:
+            # Initialize components (evaluation requires API key)
+            api_key = get_api_key()
+            if not api_key:
+                if local is None:
+                    return jsonify({'error': 'API key required for evaluation. Set GOOGLE_API_KEY environment variable.'}), 500
+                # Offline: the local estimate is the best grade available
+                result = local_grade(local, 'local_estimate')
+            else:
+                _, evaluator = get_components(api_key)
+                
+                if not evaluator:
+                    return jsonify({'error': 'Evaluator not initialized. API key required.'}), 500
+                
+                # Evaluate answer (identical concurrent submissions share one evaluation)
+                flight_key = (resilience.key_id(api_key), normalize_text(question), normalize_text(answer))
+                evaluation_text = evaluation_flights.do(flight_key, evaluator.check_answer, question, answer)
+                
+                # Parse score and feedback from the evaluation text
+                score, feedback = parse_evaluation(evaluation_text)
+                if score is None and local is not None:
+                    # Gemini could not grade it (e.g. unavailable); fall back to the local estimate
+                    result = local_grade(local, 'local_estimate')
+                else:
+                    metrics.GRADES.inc(grader='model')
+                    result = {
+                        'score': score,
+                        'feedback': feedback,
+                        'evaluation': evaluation_text,
+                        'grader': 'model'
+                    }
         
-        # Evaluate answer
-        evaluation_text = evaluator.check_answer(question, answer)
+        result['submission_id'] = store_submission(question, answer, result, exam_id,
+                                                   question_index if stored else None, student_id)
+        return jsonify(result), 200
         
-        # Parse score and feedback from the evaluation text
-        score = None
-        feedback = evaluation_text
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+
+def local_grade(local, grader):
+    """Result for an answer graded by the local grader"""
+    metrics.GRADES.inc(grader=grader)
+    return {
+        'score': local['score'],
+        'feedback': local['feedback'],
+        'evaluation': local['evaluation'],
+        'grader': grader,
+        'similarity': local['similarity']
+    }
+
+
+def answer_fields(source, defaults=None):
+    """
+    Validated exam_id, question_index, student_id, reference_answer and subject sent with an answer.
+    
+    Raises:
+        ValueError: If one has the wrong type
+    """
+    defaults = defaults or {}
+    exam_id = source.get('exam_id', defaults.get('exam_id'))
+    student_id = source.get('student_id', defaults.get('student_id'))
+    question_index = source.get('question_index')
+    reference = source.get('reference_answer')
+    subject = source.get('subject', defaults.get('subject'))
+    for name, value in (('exam_id', exam_id), ('student_id', student_id)):
+        if not valid_id(value):
+            raise ValueError(f'{name} must be a string')
+    if question_index is not None and (isinstance(question_index, bool) or not isinstance(question_index, int)):
+        raise ValueError('question_index must be an integer')
+    if reference is not None and not isinstance(reference, str):
+        raise ValueError('reference_answer must be a string')
+    if subject is not None and not isinstance(subject, str):
+        raise ValueError('subject must be a string')
+    return (None if exam_id is None else str(exam_id), question_index,
+            None if student_id is None else str(student_id), reference, subject)
+
+
+def stored_question(exam_id, question_index, question):
+    """The stored paper's question at question_index if it is the question submitted, or None"""
+    if results_store is None or not exam_id or question_index is None:
+        return None
+    exam = results_store.get_exam(exam_id)
+    if exam is None or not 0 <= question_index < len(exam['questions']):
+        return None
+    stored = exam['questions'][question_index]
+    return stored if same_question(stored['question'], question) else None
+
+
+def store_submission(question, answer, result, exam_id=None, position=None, student_id=None):
+    """Record a graded answer; position is only set when it was checked against the stored paper"""
+    if results_store is None:
+        return None
+    return results_store.record_submission(
+        question, answer, result.get('score'),
+        feedback=result.get('feedback'),
+        evaluation=result.get('evaluation'),
+        grader=result.get('grader'),
+        exam_id=exam_id,
+        position=position,
+        student_id=student_id
+    )
+
+
+@api.route('/evaluate/batch', methods=['POST'])
+def evaluate_batch():
+    """Evaluate many student answers in a few packed model calls"""
+    try:
+        with metrics.timer('request_parse'):
+            data = request.get_json()
         
-        # Try to extract score from text (format: "Score: 8" or "Score: 8/10")
-        score_match = re.search(r'Score:\s*(\d+)', evaluation_text, re.IGNORECASE)
-        if score_match:
-            score = int(score_match.group(1))
-            # Remove score line from feedback
-            feedback = re.sub(r'Score:\s*\d+.*?\n', '', evaluation_text, flags=re.IGNORECASE).strip()
+        if not data:
+            return jsonify({'error': 'No JSON data provided'}), 400
+        
+        items = data.get('items')
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'items must be a non-empty list of {question, answer} objects'}), 400
+        
+        if len(items) > BATCH_EVAL_MAX_ITEMS:
+            return jsonify({'error': f'At most {BATCH_EVAL_MAX_ITEMS} items per batch'}), 400
+        
+        # exam_id, student_id and subject may be given once for the whole batch
+        defaults = dict(zip(('exam_id', 'question_index', 'student_id', 'reference_answer', 'subject'),
+                            answer_fields(data)))
+        
+        # Validate each item; invalid ones get a per-item error and are not sent
+        results = [None] * len(items)
+        refs = {}
+        pairs = []
+        positions = []
+        estimates = {}
+        texts = {}
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                results[index] = {'index': index, 'error': 'Item must be an object'}
+                continue
+            question = str(item.get('question') or '').strip()
+            answer = str(item.get('answer') or '').strip()
+            if not question:
+                results[index] = {'index': index, 'error': 'Question is required'}
+                continue
+            if not answer:
+                results[index] = {'index': index, 'error': 'Answer is required'}
+                continue
+            try:
+                exam_id, question_index, student_id, reference, subject = answer_fields(item, defaults)
+            except ValueError as e:
+                results[index] = {'index': index, 'error': str(e)}
+                continue
+            texts[index] = (question, answer)
+            stored = stored_question(exam_id, question_index, question)
+            refs[index] = (exam_id, question_index if stored else None, student_id)
+            
+            # Clearly wrong answers to known questions never reach the model
+            local = None
+            if local_grader is not None:
+                reference = reference or (stored or {}).get('answer')
+                local = local_grader.grade(question, answer, reference=reference, subject=subject)
+            if local is not None and local['confident']:
+                results[index] = dict(local_grade(local, 'local'), index=index)
+            else:
+                pairs.append((question, answer))
+                positions.append(index)
+                if local is not None:
+                    estimates[index] = local
         
-        # Try to extract feedback section
-        feedback_match = re.search(r'Feedback:\s*(.+)', evaluation_text, re.IGNORECASE | re.DOTALL)
-        if feedback_match:
-            feedback = feedback_match.group(1).strip()
+        evaluations = []
+        if pairs:
+            api_key = get_api_key()
+            evaluator = get_components(api_key)[1] if api_key else None
+            if evaluator is not None:
+                chunk_size = data.get('chunk_size', BATCH_EVAL_CHUNK_SIZE)
+                if not isinstance(chunk_size, int) or chunk_size < 1:
+                    chunk_size = BATCH_EVAL_CHUNK_SIZE
+                
+                evaluations = evaluator.check_answers(pairs, chunk_size=chunk_size,
+                                                      max_concurrency=BATCH_EVAL_CONCURRENCY)
+            else:
+                evaluations = [{'error': 'API key required for evaluation. Set GOOGLE_API_KEY environment variable.'}
+                               for _ in pairs]
+        
+        for index, result in zip(positions, evaluations):
+            if 'error' in result:
+                # Offline or failed items fall back to the local estimate when there is one
+                if index in estimates:
+                    results[index] = dict(local_grade(estimates[index], 'local_estimate'), index=index)
+                else:
+                    results[index] = {'index': index, 'error': result['error']}
+                continue
+            score, feedback = parse_evaluation(result['evaluation'])
+            metrics.GRADES.inc(grader='model')
+            results[index] = {
+                'index': index,
+                'score': score,
+                'feedback': feedback,
+                'evaluation': result['evaluation'],
+                'grader': 'model'
+            }
+        
+        # Record every graded item
+        for index, result in enumerate(results):
+            if 'error' not in result:
+                result['submission_id'] = store_submission(*texts[index], result, *refs[index])
         
         return jsonify({
-            'score': score,
-            'feedback': feedback,
-            'evaluation': evaluation_text
+            'results': results,
+            'count': len(results),
+            'errors': sum(1 for r in results if 'error' in r)
         }), 200
         
     except ValueError as e:
@@ -161,7 +720,174 @@ def evaluate_answer():
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
 
-@app.route('/pdf/<filename>', methods=['GET'])
+@api.route('/questions/similar', methods=['POST'])
+def similar_questions():
+    """Find bank or previously generated questions similar to a question"""
+    try:
+        with metrics.timer('request_parse'):
+            data = request.get_json()
+        
+        if not data:
+            return jsonify({'error': 'No JSON data provided'}), 400
+        
+        question = str(data.get('question') or '').strip()
+        if not question:
+            return jsonify({'error': 'Question is required'}), 400
+        
+        threshold = data.get('threshold', similarity.DUPLICATE_THRESHOLD)
+        if not isinstance(threshold, (int, float)) or not 0 < threshold <= 1:
+            return jsonify({'error': 'threshold must be a number in (0, 1]'}), 400
+        
+        limit = data.get('limit', 5)
+        if not isinstance(limit, int) or limit < 1:
+            limit = 5
+        
+        matches = similarity.lookup(question, subject=data.get('subject'), threshold=threshold, limit=limit)
+        
+        return jsonify({
+            'duplicate': bool(matches) and matches[0]['score'] >= similarity.DUPLICATE_THRESHOLD,
+            'matches': matches
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+
+@api.route('/exams', methods=['GET'])
+def list_exams():
+    """List stored papers, newest first"""
+    if results_store is None:
+        return jsonify({'error': 'Results store disabled (set RESULTS_DB_PATH)'}), 404
+    
+    limit = request.args.get('limit', 50, type=int)
+    exams = results_store.list_exams(subject=request.args.get('subject'), limit=max(1, min(limit, 500)))
+    return jsonify({'exams': exams, 'count': len(exams)}), 200
+
+
+@api.route('/exams/<exam_id>', methods=['GET'])
+def get_exam(exam_id):
+    """Re-open a stored paper with its questions and answers"""
+    exam = results_store.get_exam(exam_id) if results_store is not None else None
+    if exam is None:
+        return jsonify({'error': 'Exam not found'}), 404
+    
+    return jsonify(exam), 200
+
+
+@api.route('/exams/<exam_id>/results', methods=['GET'])
+def get_exam_results(exam_id):
+    """Recorded submissions for a paper and its score distribution"""
+    if results_store is None or results_store.get_exam(exam_id) is None:
+        return jsonify({'error': 'Exam not found'}), 404
+    
+    student_id = request.args.get('student_id')
+    return jsonify({
+        'exam_id': exam_id,
+        'submissions': results_store.submissions(exam_id=exam_id, student_id=student_id),
+        'distribution': results_store.score_distribution(exam_id)
+    }), 200
+
+
+@api.route('/exams/<exam_id>/regrade', methods=['POST'])
+def regrade_exam(exam_id):
+    """
+    Regrade a paper's recorded answers against its stored reference answers, without Gemini.
+    
+    Only clear misses are final locally, so an answer Gemini graded keeps its grade unless the
+    local grader is confident; other answers take the new local grade or estimate.
+    """
+    exam = results_store.get_exam(exam_id) if results_store is not None else None
+    if exam is None:
+        return jsonify({'error': 'Exam not found'}), 404
+    
+    grader = local_grader or LocalGrader()
+    references = [q['answer'] for q in exam['questions']]
+    regraded = 0
+    skipped = 0
+    kept = 0
+    for submission in results_store.submissions(exam_id=exam_id, limit=100000):
+        position = submission['position']
+        stored = exam['questions'][position] if position is not None and 0 <= position < len(references) else None
+        reference = references[position] if stored and same_question(stored['question'], submission['question']) else None
+        if not reference:
+            skipped += 1
+            continue
+        local = grader.grade(submission['question'], submission['answer'], reference=reference)
+        if submission['grader'] == 'model' and not local['confident']:
+            kept += 1
+            continue
+        label = 'local' if local['confident'] else 'local_estimate'
+        results_store.update_grade(submission['id'], local['score'], local['feedback'], local['evaluation'], label)
+        regraded += 1
+    
+    return jsonify({
+        'exam_id': exam_id,
+        'regraded': regraded,
+        'skipped': skipped,
+        'kept': kept,
+        'distribution': results_store.score_distribution(exam_id)
+    }), 200
+
+
+@api.route('/pdf/status/<job_id>', methods=['GET'])
+def get_pdf_status(job_id):
+    """Report progress of a background PDF render"""
+    job = pdf_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'PDF job not found'}), 404
+    
+    return jsonify({
+        'job_id': job['id'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'error': job['error'],
+        'pdf_url': f"/pdf/{job['filename']}" if job['filename'] else None
+    }), 200
+
+
+@api.route('/pdf', methods=['POST'])
+def render_pdf():
+    """Render questions to a PDF and stream it back directly"""
+    try:
+        with metrics.timer('request_parse'):
+            data = request.get_json()
+        
+        if not data:
+            return jsonify({'error': 'No JSON data provided'}), 400
+        
+        subject = str(data.get('subject') or '').strip()
+        questions = data.get('questions')
+        
+        if not subject:
+            return jsonify({'error': 'Subject is required'}), 400
+        
+        if not isinstance(questions, list) or not questions:
+            return jsonify({'error': 'questions must be a non-empty list'}), 400
+        
+        include_answers = bool(data.get('include_answers', True))
+        
+        # Reuse a stored render of the identical paper when there is one
+        render_key = PDFCache.make_key(subject, questions, include_answers)
+        if pdf_cache is not None:
+            digest = pdf_cache.get(render_key)
+            blob = pdf_store.get(digest) if digest else None
+            if blob is not None:
+                return send_file(BytesIO(blob[0]), mimetype='application/pdf', as_attachment=True,
+                                 download_name=blob[1])
+        
+        with metrics.timer('pdf_render'):
+            pdf_bytes = render_flights.do(render_key, formatter.make_pdf_bytes, subject, questions,
+                                          include_answers=include_answers)
+        if pdf_cache is not None:
+            pdf_cache.put(render_key, pdf_store.put(pdf_bytes, pdf_filename(subject)))
+        return send_file(BytesIO(pdf_bytes), mimetype='application/pdf', as_attachment=True,
+                         download_name=pdf_filename(subject))
+        
+    except Exception as e:
+        return jsonify({'error': f'Error creating PDF: {str(e)}'}), 500
+
+
+@api.route('/pdf/<filename>', methods=['GET'])
 def get_pdf(filename):
     """Serve PDF files"""
     try:
@@ -169,6 +895,15 @@ def get_pdf(filename):
         if not filename.endswith('.pdf'):
             return jsonify({'error': 'Invalid file type'}), 400
         
+        # In-memory PDFs are addressed by content hash
+        if pdf_store is not None:
+            blob = pdf_store.get(filename[:-len('.pdf')])
+            if blob is not None:
+                pdf_bytes, download_name = blob
+                start = time.perf_counter()
+                return timed_send(send_file(BytesIO(pdf_bytes), mimetype='application/pdf', as_attachment=True,
+                                            download_name=download_name), start)
+        
         # Remove any path traversal attempts
         filename = os.path.basename(filename)
         filepath = os.path.join(os.getcwd(), filename)
@@ -176,31 +911,89 @@ def get_pdf(filename):
         if not os.path.exists(filepath):
             return jsonify({'error': 'PDF file not found'}), 404
         
-        return send_file(filepath, mimetype='application/pdf', as_attachment=True)
+        start = time.perf_counter()
+        return timed_send(send_file(filepath, mimetype='application/pdf', as_attachment=True), start)
         
     except Exception as e:
         return jsonify({'error': f'Error serving PDF: {str(e)}'}), 500
 
 
-@app.route('/health', methods=['GET'])
+def timed_send(response, start):
+    """
+    Record the pdf_serve stage once the server has finished sending the file.
+    
+    send_file() only builds the response; the body is streamed after the view returns, and
+    its call_on_close() hooks do not run for file responses, so the body itself is wrapped.
+    
+    Args:
+        response (Response): send_file() response
+        start (float): time.perf_counter() when serving began
+    
+    Returns:
+        Response: The same response
+    """
+    def observe():
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage='pdf_serve')
+    
+    response.response = ClosingIterator(response.response, observe)
+    return response
+
+
+@api.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
-        'api_key_configured': bool(get_api_key())
+        'api_key_configured': bool(get_api_key()),
+        'components': registry.stats(),
+        'generation_cache': generation_cache.stats(),
+        'evaluation_cache': evaluation_cache.stats(),
+        'pdf_jobs': pdf_jobs.stats(),
+        'pdf_store': pdf_store.stats() if pdf_store is not None else None,
+        'pdf_cache': pdf_cache.stats() if pdf_cache is not None else None,
+        'pdf_layout': formatter.stats(),
+        'parsing': parse_stats.stats(),
+        'tokens': prompts.token_stats.stats(),
+        'similarity': similarity.stats(),
+        'local_grading': local_grader.stats() if local_grader is not None else None,
+        'results_store': results_store.stats() if results_store is not None else None,
+        'upstream': resilience.stats(),
+        'coalescing': {
+            'generate': generation_flights.stats(),
+            'evaluate': evaluation_flights.stats(),
+            'render': render_flights.stats()
+        }
     }), 200
 
 
+@api.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint (text exposition format)"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+# Module-level app for `python api_server.py`, `flask --app api_server` and wsgi.py
+app = create_app()
+
+
 if __name__ == '__main__':
+    import atexit
+    
+    port = int(os.getenv('PORT', '5000'))
+    debug = os.getenv('FLASK_DEBUG', '0').lower() in ('1', 'true', 'yes')
+    
     print("=" * 50)
     print("AI Exam Generator API Server")
     print("=" * 50)
-    print("\nStarting server on http://localhost:5000")
+    print(f"\nStarting development server on http://localhost:{port}")
+    print("For production use: gunicorn -c gunicorn.conf.py wsgi:app")
     print("\nMake sure to set GOOGLE_API_KEY environment variable")
     print("Example: set GOOGLE_API_KEY=your_api_key_here")
     print("\nPress Ctrl+C to stop the server")
     print("=" * 50)
     print()
     
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    preload()
+    atexit.register(shutdown)
+    app.run(host=os.getenv('HOST', '0.0.0.0'), port=port, debug=debug, threaded=True)
 
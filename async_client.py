@@ -0,0 +1,355 @@
+"""
+Asyncio client layer for Gemini calls
+Runs model calls on one shared background event loop with per-call deadlines and a
+process-wide cap on the number of calls in flight
+"""
+
+import asyncio
+import functools
+import threading
+import time
+
+import metrics
+import prompts
+import resilience
+
+# Optional import - only needed to build models (see create_model())
+try:
+    import google.generativeai as genai
+except ImportError:
+    genai = None
+try:
+    from google.generativeai import client as genai_client
+except ImportError:
+    genai_client = None
+
+# Defaults used by every client unless overridden (see configure())
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_MAX_CONCURRENCY = 16
+
+# Marks the end of a synchronous stream iterator
+_END = object()
+
+_loop = None
+_loop_lock = threading.Lock()
+_semaphore = None
+# genai.configure() sets one key for the whole process
+_configure_lock = threading.Lock()
+
+
+class SlotTimeoutError(asyncio.TimeoutError):
+    """Raised when no concurrency slot frees up before the deadline (local congestion, not the upstream)."""
+
+
+def _remaining(timeout, start):
+    # Deadline left after waiting since start (never zero, so a deadline stays a deadline)
+    return max(0.001, timeout - (time.monotonic() - start)) if timeout else timeout
+
+
+def configure(timeout=None, max_concurrency=None):
+    """
+    Set the default deadline and concurrency cap for model calls.
+
+    Args:
+        timeout (float): Seconds before a model call is abandoned (None/0 = no deadline)
+        max_concurrency (int): Maximum model calls in flight across the process
+    """
+    global DEFAULT_TIMEOUT, DEFAULT_MAX_CONCURRENCY, _semaphore
+    if timeout is not None:
+        DEFAULT_TIMEOUT = timeout or None
+    if max_concurrency is not None:
+        DEFAULT_MAX_CONCURRENCY = max(1, int(max_concurrency))
+        _semaphore = None
+
+
+def create_model(api_key, model_name):
+    """
+    Build a GenerativeModel that always calls with api_key.
+
+    genai.configure() sets a process-wide key, and a model only picks up its clients on its
+    first call, from whichever key was configured last. Both clients are attached here, under
+    the configure lock, so models built for different keys never share credentials.
+
+    Args:
+        api_key (str): Google Generative AI API key
+        model_name (str): Gemini model name
+
+    Returns:
+        genai.GenerativeModel: Model bound to the key
+    """
+    with _configure_lock:
+        genai.configure(api_key=api_key)
+        model = genai.GenerativeModel(model_name)
+        if genai_client is not None:
+            if getattr(model, '_client', False) is None:
+                model._client = genai_client.get_default_generative_client()
+            if getattr(model, '_async_client', False) is None:
+                # gRPC asyncio channels belong to the loop they are created on: the shared one
+                model._async_client = run_sync(_default_async_client())
+    return model
+
+
+async def _default_async_client():
+    return genai_client.get_default_generative_async_client()
+
+
+def get_loop():
+    """Get the shared background event loop, starting its thread on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True)
+            thread.start()
+            _loop = loop
+        return _loop
+
+
+def run_sync(coro):
+    """
+    Run a coroutine on the shared loop and block the calling thread until it finishes.
+
+    Args:
+        coro: Coroutine to run
+
+    Returns:
+        The coroutine's result (its exception is re-raised in the caller)
+
+    Raises:
+        RuntimeError: If called from the shared loop's own thread (it would wait on itself forever)
+    """
+    loop = get_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("run_sync() called on the model event loop; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+def shutdown(timeout=None):
+    """
+    Let in-flight model calls finish, then stop the shared loop.
+
+    Args:
+        timeout (float): Longest wait for in-flight calls in seconds (None = wait for all);
+            calls still running after it are cancelled
+
+    Returns:
+        int: Number of calls that had to be cancelled
+    """
+    global _loop, _semaphore
+    with _loop_lock:
+        loop, _loop = _loop, None
+    if loop is None or loop.is_closed():
+        return 0
+
+    async def drain():
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        if not tasks:
+            return 0
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        return len(pending)
+
+    cancelled = asyncio.run_coroutine_threadsafe(drain(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    _semaphore = None
+    return cancelled
+
+
+def _text(response):
+    # .text raises on replies without a usable candidate (e.g. blocked by safety filters)
+    try:
+        return response.text or ''
+    except Exception:
+        return ''
+
+
+def _get_semaphore():
+    # Created lazily so it binds to whichever loop first awaits it
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(DEFAULT_MAX_CONCURRENCY)
+    return _semaphore
+
+
+class AsyncModelClient:
+    def __init__(self, model, timeout=None, api_key=None, operation='generate'):
+        """
+        Wrap a GenerativeModel with deadlines and bounded concurrency.
+
+        Calls are also rate limited, retried and circuit-broken per API key (see resilience.py).
+
+        Args:
+            model: google.generativeai GenerativeModel (or anything with generate_content)
+            timeout (float): Per-call deadline in seconds (default: module DEFAULT_TIMEOUT)
+            api_key (str): Key the calls are billed to, which selects the rate limit and breaker
+            operation (str): 'generate' or 'evaluate'; labels this client's latency and error metrics
+        """
+        self.model = model
+        self.timeout = timeout
+        self.api_key = api_key
+        self.operation = operation
+
+    async def generate(self, prompt, timeout=None, **kwargs):
+        """
+        Call the model without blocking the event loop.
+
+        Args:
+            prompt (str): Prompt text
+            timeout (float): Deadline for this call (default: client/module timeout)
+            **kwargs: Passed through to generate_content
+
+        Returns:
+            The model response
+
+        Raises:
+            asyncio.TimeoutError: If the deadline expires (the pending call is cancelled);
+                SlotTimeoutError if it expired before a concurrency slot was free
+            resilience.CircuitOpenError: If the upstream is marked unhealthy for this key
+            resilience.RateLimitedError: If the key's rate limit leaves no slot before the deadline
+        """
+        if timeout is None:
+            timeout = self.timeout if self.timeout is not None else DEFAULT_TIMEOUT
+        semaphore = _get_semaphore()
+        start = time.monotonic()
+        await self._acquire_slot(semaphore, timeout)
+
+        async def attempt(remaining):
+            with metrics.timer(f"llm_{self.operation}"):
+                return await asyncio.wait_for(self._call(prompt, **kwargs), remaining)
+
+        try:
+            response = await resilience.get_guard(self.api_key).call(attempt, timeout=_remaining(timeout, start))
+        except Exception as e:
+            self._count_error(e)
+            raise
+        finally:
+            semaphore.release()
+        prompts.token_stats.record(self.operation, prompt, _text(response), getattr(response, 'usage_metadata', None))
+        return response
+
+    def generate_sync(self, prompt, timeout=None, **kwargs):
+        """Blocking form of generate() for use from request threads."""
+        return run_sync(self.generate(prompt, timeout=timeout, **kwargs))
+
+    async def stream(self, prompt, timeout=None, **kwargs):
+        """
+        Stream response chunks as the model produces them.
+
+        The deadline applies to getting a concurrency slot, to the first response and to the
+        wait for each later chunk; the slot is held until the stream finishes or is closed.
+
+        Args:
+            prompt (str): Prompt text
+            timeout (float): Deadline per wait (default: client/module timeout)
+            **kwargs: Passed through to generate_content
+
+        Yields:
+            Response chunks (each has a .text attribute)
+        """
+        if timeout is None:
+            timeout = self.timeout if self.timeout is not None else DEFAULT_TIMEOUT
+        semaphore = _get_semaphore()
+        start = time.monotonic()
+        await self._acquire_slot(semaphore, timeout)
+        try:
+            # Only opening the stream is retried; a failure mid-stream ends it
+            try:
+                next_chunk = await resilience.get_guard(self.api_key).call(
+                    lambda remaining: self._open_stream(prompt, remaining, **kwargs),
+                    timeout=_remaining(timeout, start))
+            except Exception as e:
+                self._count_error(e)
+                raise
+            # Usage is reported on the last chunk (when the API reports it at all)
+            text = []
+            usage = None
+            try:
+                async for chunk in self._with_deadline(next_chunk, timeout):
+                    text.append(_text(chunk))
+                    usage = getattr(chunk, 'usage_metadata', None) or usage
+                    yield chunk
+            finally:
+                prompts.token_stats.record(self.operation, prompt, ''.join(text), usage)
+        finally:
+            semaphore.release()
+
+    def stream_sync(self, prompt, timeout=None, **kwargs):
+        """
+        Blocking form of stream() for use from request threads.
+
+        Yields:
+            Response chunks
+        """
+        chunks = self.stream(prompt, timeout=timeout, **kwargs)
+        try:
+            while True:
+                try:
+                    yield run_sync(chunks.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            # Release the concurrency slot even if the consumer stops early
+            run_sync(chunks.aclose())
+
+    @staticmethod
+    async def _with_deadline(next_chunk, timeout):
+        while True:
+            try:
+                chunk = await asyncio.wait_for(next_chunk(), timeout)
+            except StopAsyncIteration:
+                return
+            if chunk is _END:
+                return
+            yield chunk
+
+    async def _acquire_slot(self, semaphore, timeout):
+        # The wait counts against the deadline, but stays outside the key's guard: a local burst
+        # of calls must not count as upstream failures and trip the circuit breaker
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout)
+        except asyncio.TimeoutError:
+            error = SlotTimeoutError("no concurrency slot before the deadline")
+            self._count_error(error)
+            raise error from None
+
+    def _count_error(self, error):
+        if isinstance(error, SlotTimeoutError):
+            kind = 'slot_timeout'
+        elif isinstance(error, resilience.CircuitOpenError):
+            kind = 'circuit_open'
+        elif isinstance(error, resilience.RateLimitedError):
+            kind = 'rate_limited'
+        elif isinstance(error, asyncio.TimeoutError):
+            kind = 'timeout'
+        elif resilience.is_transient(error):
+            kind = 'transient'
+        else:
+            kind = 'error'
+        metrics.UPSTREAM_ERRORS.inc(operation=self.operation, kind=kind)
+
+    async def _open_stream(self, prompt, timeout, **kwargs):
+        """Start a streaming call and return a coroutine function that fetches the next chunk."""
+        if hasattr(self.model, 'generate_content_async'):
+            # Timed to the first response only; later chunks arrive while the client consumes them
+            with metrics.timer(f"llm_{self.operation}"):
+                response = await asyncio.wait_for(
+                    self.model.generate_content_async(prompt, stream=True, **kwargs), timeout)
+            return response.__aiter__().__anext__
+        loop = asyncio.get_running_loop()
+        with metrics.timer(f"llm_{self.operation}"):
+            response = await asyncio.wait_for(loop.run_in_executor(
+                None, functools.partial(self.model.generate_content, prompt, stream=True, **kwargs)), timeout)
+        return functools.partial(loop.run_in_executor, None, next, iter(response), _END)
+
+    async def _call(self, prompt, **kwargs):
+        if hasattr(self.model, 'generate_content_async'):
+            return await self.model.generate_content_async(prompt, **kwargs)
+        # Models without a native async API run on the loop's default thread pool
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(self.model.generate_content, prompt, **kwargs))
@@ -0,0 +1,236 @@
+"""
+External question bank files
+A JSONL bank is memory-mapped and indexed by byte offset per subject, difficulty and topic;
+questions are only parsed when they are actually requested.
+
+Bank format, one JSON object per line:
+    {"subject": "Python", "question": "...", "answer": "...", "topic": "Functions", "difficulty": "easy"}
+    {"subject": "Operating Systems", "aliases": ["os", "operating system"]}
+
+The offset index is saved next to the bank as <bank>.idx and rebuilt when the bank changes.
+It also holds the number of answers each grading term appears in, so the local grader's term
+weights need no pass over the bank.
+"""
+
+import json
+import mmap
+import os
+import threading
+from array import array
+
+# Bump when the index layout or local_grader.terms() changes, so saved indexes are rebuilt
+INDEX_VERSION = 2
+
+
+class LazyQuestions:
+    def __init__(self, bank_file, offsets, lengths):
+        """
+        Read-only sequence of questions backed by byte ranges in a bank file.
+
+        Args:
+            bank_file (BankFile): File the ranges point into
+            offsets (array): Start offset of each question's line
+            lengths (array): Length in bytes of each question's line
+        """
+        self._bank_file = bank_file
+        self._offsets = offsets
+        self._lengths = lengths
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._bank_file.read(self._offsets[i], self._lengths[i])
+                    for i in range(*index.indices(len(self._offsets)))]
+        return self._bank_file.read(self._offsets[index], self._lengths[index])
+
+    def __iter__(self):
+        for i in range(len(self._offsets)):
+            yield self._bank_file.read(self._offsets[i], self._lengths[i])
+
+
+class BankFile:
+    def __init__(self, path):
+        """
+        Open a JSONL bank lazily: nothing is read until the first index() call.
+
+        Args:
+            path (str): Path to the .jsonl bank
+        """
+        self.path = path
+        self.index_path = path + '.idx'
+        self._mmap = None
+        self._file = None
+        self._index = None
+        self._lock = threading.Lock()
+        # Separate from _lock: index() holds that one while building, which opens the file
+        self._open_lock = threading.Lock()
+
+    def _open(self):
+        data = self._mmap
+        if data is not None:
+            return data
+        with self._open_lock:
+            if self._mmap is None:
+                self._file = open(self.path, 'rb')
+                size = os.fstat(self._file.fileno()).st_size
+                # mmap cannot map an empty file; an empty bytes object behaves the same for reads
+                self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+            return self._mmap
+
+    def read(self, offset, length):
+        """Parse the question stored at a byte range."""
+        record = json.loads(self._open()[offset:offset + length])
+        record.pop('subject', None)
+        return record
+
+    def index(self):
+        """
+        Load (or build and save) the offset index.
+
+        Returns:
+            dict: {'subjects': {subject: [[offset, length, difficulty, topic], ...]}, 'aliases': {alias: subject},
+                'answers': number of questions, 'answer_terms': {term: answers containing it}}
+        """
+        with self._lock:
+            if self._index is None:
+                self._index = self._load_index() or self._build_index()
+            return self._index
+
+    def _signature(self):
+        stat = os.stat(self.path)
+        return {'version': INDEX_VERSION, 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return index if index.get('signature') == self._signature() else None
+
+    def _build_index(self):
+        # Imported here: only needed while building, and the grader imports the bank lazily too
+        from local_grader import terms
+
+        data = self._open()
+        subjects = {}
+        aliases = {}
+        answer_terms = {}
+        answers = 0
+        offset = 0
+        size = len(data)
+        while offset < size:
+            end = data.find(b'\n', offset)
+            if end == -1:
+                end = size
+            line = data[offset:end]
+            if line.strip():
+                record = json.loads(line)
+                subject = record.get('subject')
+                if subject and 'question' in record:
+                    subjects.setdefault(subject, []).append(
+                        [offset, end - offset, record.get('difficulty', 'medium'), record.get('topic', subject)]
+                    )
+                    answers += 1
+                    for term in set(terms(record.get('answer') or '')):
+                        answer_terms[term] = answer_terms.get(term, 0) + 1
+                elif subject:
+                    for alias in record.get('aliases', ()):
+                        aliases[alias] = subject
+            offset = end + 1
+
+        index = {'signature': self._signature(), 'subjects': subjects, 'aliases': aliases,
+                 'answers': answers, 'answer_terms': answer_terms}
+        # Written aside and renamed into place, so other processes never load a partial index
+        temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f, separators=(',', ':'))
+            os.replace(temp_path, self.index_path)
+        except OSError as e:
+            print(f"Could not save question bank index {self.index_path}: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+        return index
+
+    def load_into(self, bank):
+        """
+        Register this file's subjects and aliases with a QuestionBank without parsing any questions.
+
+        Args:
+            bank (QuestionBank): Bank to extend
+        """
+        index = self.index()
+        for subject, entries in index['subjects'].items():
+            offsets = array('Q', (e[0] for e in entries))
+            lengths = array('I', (e[1] for e in entries))
+            by_difficulty = {}
+            by_topic = {}
+            for position, entry in enumerate(entries):
+                by_difficulty.setdefault(entry[2], array('I')).append(position)
+                by_topic.setdefault(entry[3], array('I')).append(position)
+            bank.add_indexed_subject(
+                subject,
+                LazyQuestions(self, offsets, lengths),
+                {k: self._subset(offsets, lengths, v) for k, v in by_difficulty.items()},
+                {k: self._subset(offsets, lengths, v) for k, v in by_topic.items()}
+            )
+        for alias, subject in index['aliases'].items():
+            bank.add_alias(alias, subject)
+        bank.add_answer_terms(index['answer_terms'], index['answers'])
+
+    def _subset(self, offsets, lengths, positions):
+        return LazyQuestions(self, array('Q', (offsets[i] for i in positions)),
+                             array('I', (lengths[i] for i in positions)))
+
+    def close(self):
+        with self._open_lock:
+            if isinstance(self._mmap, mmap.mmap):
+                self._mmap.close()
+            if self._file is not None:
+                self._file.close()
+            self._mmap = None
+            self._file = None
+
+
+def export_bank(subjects, path, aliases=None):
+    """
+    Write questions to a JSONL bank file.
+
+    Args:
+        subjects (dict): Subject name -> list of question dicts
+        path (str): Output .jsonl path
+        aliases (dict): Optional alias -> subject mappings
+    """
+    by_subject = {}
+    for alias, subject in (aliases or {}).items():
+        by_subject.setdefault(subject, []).append(alias)
+    with open(path, 'w', encoding='utf-8') as f:
+        for subject, names in by_subject.items():
+            f.write(json.dumps({'subject': subject, 'aliases': names}) + '\n')
+        for subject, questions in subjects.items():
+            for q in questions:
+                f.write(json.dumps(dict(q, subject=subject)) + '\n')
+
+
+if __name__ == '__main__':
+    import sys
+    from predefined_questions import PREDEFINED_QUESTIONS, SUBJECT_ALIASES
+
+    if len(sys.argv) != 3 or sys.argv[1] not in ('export', 'index'):
+        print("Usage: python bank_file.py export <bank.jsonl>   (write the predefined questions)")
+        print("       python bank_file.py index <bank.jsonl>    (build the offset index)")
+        sys.exit(1)
+
+    if sys.argv[1] == 'export':
+        export_bank(PREDEFINED_QUESTIONS, sys.argv[2], SUBJECT_ALIASES)
+        print(f"Wrote {sys.argv[2]}")
+    else:
+        bank_file = BankFile(sys.argv[2])
+        index = bank_file.index()
+        print(f"Indexed {sum(len(v) for v in index['subjects'].values())} questions "
+              f"in {len(index['subjects'])} subjects -> {bank_file.index_path}")
@@ -0,0 +1,4 @@
+"""
+Benchmark suite for the exam generator
+Run with: python -m benchmarks.run  (see README.md, "Benchmarks")
+"""
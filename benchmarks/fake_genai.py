@@ -0,0 +1,176 @@
+"""
+Local stand-in for google.generativeai
+Simulates Gemini latency, jitter, errors and reply formats without any network access,
+so the API and generator can be benchmarked offline
+"""
+
+import asyncio
+import json
+import random
+import re
+import time
+
+import async_client
+import evaluator
+import generator
+
+SHAPES = ('qa', 'markdown', 'numbered', 'truncated', 'json', 'mixed')
+
+_COUNT = re.compile(r'Generate (\d+)')
+_TOPICS = ('variables', 'loops', 'recursion', 'memory', 'testing', 'concurrency', 'types', 'errors')
+
+
+class FakeQuotaError(Exception):
+    """Looks like a Gemini 429 to resilience.is_transient()."""
+    code = 429
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeStream:
+    def __init__(self, chunks, delay):
+        self._chunks = chunks
+        self._delay = delay
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for chunk in self._chunks:
+            if self._delay:
+                await asyncio.sleep(self._delay)
+            yield chunk
+
+
+class FakeGenerativeModel:
+    # Shared settings, changed through configure_fake()
+    latency = 0.2
+    jitter = 0.05
+    error_rate = 0.0
+    shape = 'qa'
+    chunk_size = 40
+    seed = None
+    _rng = random.Random()
+
+    def __init__(self, model_name=None, **kwargs):
+        self.model_name = model_name
+
+    @classmethod
+    def _delay(cls):
+        return max(0.0, cls.latency + cls._rng.uniform(-cls.jitter, cls.jitter))
+
+    def _reply(self, prompt):
+        if self._rng.random() < self.error_rate:
+            raise FakeQuotaError("429 Resource has been exhausted (e.g. check quota)")
+        if 'Student Answer' in prompt:
+            return self._evaluation(prompt)
+        match = _COUNT.search(prompt)
+        return self._questions(int(match.group(1)) if match else 5, prompt)
+
+    def _evaluation(self, prompt):
+        structured = 'JSON' in prompt
+        items = prompt.count('Student Answer')
+        if 'Item 1' in prompt:
+            if structured:
+                return json.dumps([{'item': i, 'score': self._rng.randint(1, 10), 'feedback': f"Feedback {i}."}
+                                   for i in range(1, items + 1)])
+            return "\n".join(f"Item {i}:\nScore: {self._rng.randint(1, 10)}\nFeedback: Feedback {i}."
+                             for i in range(1, items + 1))
+        score = self._rng.randint(1, 10)
+        if structured:
+            return json.dumps({'score': score, 'feedback': "Mostly correct, add an example."})
+        return f"Score: {score}\nFeedback: Mostly correct, add an example."
+
+    def _questions(self, count, prompt):
+        shape = self.shape
+        if 'JSON' in prompt:
+            shape = 'json'
+        elif shape == 'mixed':
+            shape = self._rng.choice(('qa', 'markdown', 'numbered', 'truncated'))
+        # Distinct wording per call so de-duplication has real work to do
+        tag = self._rng.randrange(10 ** 6)
+        pairs = [(f"Explain {self._rng.choice(_TOPICS)} case {tag}-{i} in detail?",
+                  f"An answer covering point {i} with a short example.") for i in range(1, count + 1)]
+
+        if shape == 'json':
+            return json.dumps([{'question': q, 'answer': a} for q, a in pairs])
+        if shape == 'numbered':
+            return "\n".join(f"{i}. {q}" for i, (q, _) in enumerate(pairs, 1))
+        if shape == 'markdown':
+            return "\n".join(f"**Q{i}:** {q}\n**A{i}:** {a}" for i, (q, a) in enumerate(pairs, 1))
+        text = "\n".join(f"Q{i}: {q}\nA{i}: {a}" for i, (q, a) in enumerate(pairs, 1))
+        if shape == 'truncated':
+            # Cut off like a reply that hit the output limit: the last answer is missing
+            text = text[:text.rfind('\nA')]
+        return text
+
+    def _chunks(self, text):
+        return [FakeResponse(text[i:i + self.chunk_size]) for i in range(0, len(text), self.chunk_size)]
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        time.sleep(self._delay())
+        text = self._reply(prompt)
+        return self._chunks(text) if stream else FakeResponse(text)
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        delay = self._delay()
+        if stream:
+            # Time to first chunk is a fraction of the full reply time
+            await asyncio.sleep(delay / 4)
+            chunks = self._chunks(self._reply(prompt))
+            return FakeStream(chunks, delay * 0.75 / max(1, len(chunks)))
+        await asyncio.sleep(delay)
+        return FakeResponse(self._reply(prompt))
+
+
+class FakeGenAI:
+    """Module-shaped object standing in for google.generativeai."""
+    GenerativeModel = FakeGenerativeModel
+
+    @staticmethod
+    def configure(api_key=None, **kwargs):
+        pass
+
+
+def configure_fake(latency=None, jitter=None, error_rate=None, shape=None, seed=None):
+    """
+    Change the simulated model's behaviour.
+
+    Args:
+        latency (float): Mean seconds per call
+        jitter (float): Latency varies uniformly by +/- this many seconds
+        error_rate (float): Fraction of calls that fail with a quota (429) error
+        shape (str): Reply format, one of SHAPES
+        seed: Seed for reproducible replies and errors
+    """
+    if latency is not None:
+        FakeGenerativeModel.latency = max(0.0, float(latency))
+    if jitter is not None:
+        FakeGenerativeModel.jitter = max(0.0, float(jitter))
+    if error_rate is not None:
+        FakeGenerativeModel.error_rate = min(1.0, max(0.0, float(error_rate)))
+    if shape is not None:
+        if shape not in SHAPES:
+            raise ValueError(f"shape must be one of {', '.join(SHAPES)}")
+        FakeGenerativeModel.shape = shape
+    if seed is not None:
+        FakeGenerativeModel._rng = random.Random(seed)
+
+
+def install(**options):
+    """
+    Make the generator and evaluator use the fake model (components built afterwards only).
+
+    Args:
+        **options: Passed to configure_fake()
+    """
+    configure_fake(**options)
+    for module in (generator, evaluator):
+        module.genai = FakeGenAI
+        module.GENAI_AVAILABLE = True
+    # Models are built by async_client.create_model(); the fake has no per-key clients to attach
+    async_client.genai = FakeGenAI
+    async_client.genai_client = None
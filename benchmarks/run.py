@@ -0,0 +1,366 @@
+"""
+Benchmark runner
+Times the API endpoints, PDF rendering, predefined-question lookup and the output parser
+against the local fake model, reports latency percentiles, throughput and memory, and
+compares each run with a saved baseline.
+
+    python -m benchmarks.run                          # run all, compare with the baseline
+    python -m benchmarks.run --save                   # ... and save this run as the baseline
+    python -m benchmarks.run --only api_generate parser --latency 0.5 --error-rate 0.05
+    python -m benchmarks.run --url http://localhost:5000 --only api_generate --requests 2000 --concurrency 32
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# Optional import - peak RSS is only available on Unix
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from benchmarks import fake_genai
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# A result is a regression when p95 latency rises or throughput falls by more than this
+REGRESSION_THRESHOLD = 0.2
+
+PDF_QUESTION_COUNTS = (5, 20, 50)
+
+
+def percentile(sorted_values, pct):
+    """Linear-interpolated percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def measure(name, fn, iterations, concurrency=1, trace_memory=False):
+    """
+    Call fn(i) for i in range(iterations) and summarize the timings.
+
+    Args:
+        name (str): Benchmark name
+        fn: Callable taking the iteration number; returning False counts as an error
+        iterations (int): Number of calls
+        concurrency (int): Calls run in parallel from this many threads
+        trace_memory (bool): Record the Python allocation peak (slows the run down)
+
+    Returns:
+        dict: Latency percentiles (ms), requests per second, errors and memory
+    """
+    latencies = []
+    errors = []
+
+    def call(i):
+        start = time.perf_counter()
+        try:
+            ok = fn(i) is not False
+        except Exception as e:
+            ok = False
+            if not errors:
+                print(f"  {name}: {e}")
+        latencies.append(time.perf_counter() - start)
+        if not ok:
+            errors.append(i)
+
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    if concurrency <= 1:
+        for i in range(iterations):
+            call(i)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(call, range(iterations)))
+    wall = time.perf_counter() - start
+    alloc_peak = None
+    if trace_memory:
+        alloc_peak = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 2)
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'name': name,
+        'iterations': iterations,
+        'concurrency': concurrency,
+        'errors': len(errors),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'rps': round(iterations / wall, 1) if wall else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'alloc_peak_mb': alloc_peak
+    }
+
+
+class HttpClient:
+    """Minimal stand-in for the Flask test client that posts to a running server."""
+
+    def __init__(self, url, timeout=60):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def post(self, path, json=None):
+        request = urllib.request.Request(self.url + path, data=_json_bytes(json), method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+                response.status_code = response.status
+                return response
+        except urllib.error.HTTPError as e:
+            e.status_code = e.code
+            return e
+
+
+def _json_bytes(body):
+    return json.dumps(body).encode('utf-8')
+
+
+def _api_client(args):
+    if args.url:
+        return HttpClient(args.url)
+    # The server reads its settings at import: use the fake model, no rate limit
+    os.environ.setdefault('GOOGLE_API_KEY', 'benchmark-key')
+    os.environ.setdefault('LLM_RATE_LIMIT', '0')
+    os.environ.setdefault('PDF_STORAGE', 'memory')
+    os.environ.setdefault('RESULTS_DB_PATH', os.path.join(tempfile.mkdtemp(prefix='exam-bench-'), 'results.db'))
+    import api_server
+    return api_server.app.test_client()
+
+
+def _questions(count, tag=''):
+    return [{'question': f"{i}. Explain concept {i}{tag} with an example?",
+             'answer': f"Concept {i} is explained here with a short example and a caveat."}
+            for i in range(1, count + 1)]
+
+
+def bench_api_generate(args):
+    client = _api_client(args)
+
+    def generate(i):
+        # A new subject each time so every request reaches the (fake) model
+        response = client.post('/generate', json={'subject': f"Benchmark Subject {i}",
+                                                  'num_questions': args.questions})
+        return response.status_code == 200
+
+    def generate_predefined(i):
+        response = client.post('/generate', json={'subject': 'Python', 'num_questions': args.questions})
+        return response.status_code == 200
+
+    results = []
+    # A live server would send every new subject to the real Gemini API
+    if not args.url:
+        results.append(measure('api_generate', generate, args.requests, args.concurrency, args.trace_memory))
+    results.append(measure('api_generate_predefined', generate_predefined, args.requests, args.concurrency,
+                           args.trace_memory))
+    return results
+
+
+def bench_api_evaluate(args):
+    client = _api_client(args)
+
+    def evaluate(i):
+        response = client.post('/evaluate', json={'question': 'What is a closure?',
+                                                  'answer': f"A function that captures variables, take {i}"})
+        return response.status_code == 200
+
+    return [measure('api_evaluate', evaluate, args.requests, args.concurrency, args.trace_memory)]
+
+
+def bench_api_pdf(args):
+    client = _api_client(args)
+
+    def render(i):
+        # Distinct papers so the render cache does not answer
+        response = client.post('/pdf', json={'subject': 'Benchmark', 'include_answers': True,
+                                             'questions': _questions(args.questions, f"-{i}")})
+        return response.status_code == 200
+
+    return [measure('api_pdf', render, args.requests, args.concurrency, args.trace_memory)]
+
+
+def bench_formatter(args):
+    from formatter import Formatter
+
+    formatter = Formatter()
+    results = []
+    cwd = os.getcwd()
+    # make_pdf() writes into the working directory
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            for count in PDF_QUESTION_COUNTS:
+                questions = _questions(count)
+                results.append(measure(
+                    f"formatter_make_pdf_{count}",
+                    lambda i: formatter.make_pdf('Benchmark', questions, include_answers=True),
+                    args.pdf_iterations, 1, args.trace_memory))
+                results.append(measure(
+                    f"formatter_versions_{count}",
+                    lambda i: formatter.make_pdf_versions('Benchmark', questions),
+                    args.pdf_iterations, 1, args.trace_memory))
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def bench_predefined(args):
+    from predefined_questions import get_predefined_questions
+
+    subjects = ('Python', 'java', 'Machine-Learning', 'DBMS', 'Python 3', 'Unknown Subject')
+    return [measure('predefined_lookup',
+                    lambda i: get_predefined_questions(subjects[i % len(subjects)], 5) is not None,
+                    args.iterations, 1, args.trace_memory)]
+
+
+def bench_parser(args):
+    from parsing import parse_questions
+
+    model = fake_genai.FakeGenerativeModel()
+    results = []
+    for shape in ('qa', 'markdown', 'truncated', 'numbered', 'json'):
+        fake_genai.configure_fake(shape=shape)
+        text = model._questions(args.questions * 4, '')
+        structured = shape == 'json'
+        results.append(measure(f"parser_{shape}",
+                               lambda i: parse_questions(text, True, structured=structured),
+                               args.iterations, 1, args.trace_memory))
+    fake_genai.configure_fake(shape=args.shape)
+    return results
+
+
+# Benchmarks that can run against a live server (--url)
+API_BENCHMARKS = ('api_generate', 'api_evaluate', 'api_pdf')
+
+BENCHMARKS = {
+    'api_generate': bench_api_generate,
+    'api_evaluate': bench_api_evaluate,
+    'api_pdf': bench_api_pdf,
+    'formatter': bench_formatter,
+    'predefined': bench_predefined,
+    'parser': bench_parser,
+}
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    Compare results with a baseline.
+
+    Returns:
+        list: (name, description) for every regression beyond the threshold
+    """
+    previous = {r['name']: r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        base = previous.get(result['name'])
+        if base is None:
+            continue
+        if base.get('p95_ms') and result['p95_ms'] > base['p95_ms'] * (1 + threshold):
+            regressions.append((result['name'], f"p95 {base['p95_ms']:.2f}ms -> {result['p95_ms']:.2f}ms"))
+        if base.get('rps') and result['rps'] is not None and result['rps'] < base['rps'] * (1 - threshold):
+            regressions.append((result['name'], f"rps {base['rps']:.1f} -> {result['rps']:.1f}"))
+    return regressions
+
+
+def print_table(results, baseline=None):
+    previous = {r['name']: r for r in (baseline or {}).get('results', [])}
+    header = f"{'benchmark':<28}{'n':>6}{'conc':>6}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'rss MB':>9}{'vs base':>10}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        base = previous.get(r['name'])
+        change = ''
+        if base and base.get('p95_ms'):
+            change = f"{(r['p95_ms'] / base['p95_ms'] - 1) * 100:+.0f}%"
+        rss = r['peak_rss_mb'] if r['peak_rss_mb'] is not None else '-'
+        print(f"{r['name']:<28}{r['iterations']:>6}{r['concurrency']:>6}{r['errors']:>5}"
+              f"{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['rps']:>10.1f}{rss:>9}{change:>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the exam generator against a local fake Gemini model")
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help="Benchmarks to run (default: all)")
+    parser.add_argument('--requests', type=int, default=200, help="Requests per API benchmark")
+    parser.add_argument('--concurrency', type=int, default=16, help="Concurrent clients for API benchmarks")
+    parser.add_argument('--iterations', type=int, default=2000, help="Calls per in-process micro-benchmark")
+    parser.add_argument('--pdf-iterations', type=int, default=30, help="Renders per PDF size")
+    parser.add_argument('--questions', type=int, default=5, help="Questions per request")
+    parser.add_argument('--latency', type=float, default=0.2, help="Fake model mean latency in seconds")
+    parser.add_argument('--jitter', type=float, default=0.05, help="Fake model latency jitter in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of fake model calls that fail (429)")
+    parser.add_argument('--shape', choices=fake_genai.SHAPES, default='qa', help="Fake model reply format")
+    parser.add_argument('--seed', type=int, default=1234, help="Seed for the fake model")
+    parser.add_argument('--url', help="Send the API benchmarks to a running server at this base URL "
+                                      "instead of the in-process app (not compared with the baseline)")
+    parser.add_argument('--trace-memory', action='store_true', help="Also record Python allocation peaks (slower)")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="Baseline file")
+    parser.add_argument('--save', action='store_true', help="Save this run as the baseline")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="Relative change counted as a regression (default 0.2 = 20%%)")
+    args = parser.parse_args(argv)
+    if args.url:
+        if args.save:
+            parser.error("--save cannot be used with --url")
+        if args.only and set(args.only) - set(API_BENCHMARKS):
+            parser.error(f"--url only applies to {', '.join(API_BENCHMARKS)}")
+
+    fake_genai.install(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                       shape=args.shape, seed=args.seed)
+
+    results = []
+    for name in args.only or (API_BENCHMARKS if args.url else BENCHMARKS):
+        print(f"Running {name}...")
+        results.extend(BENCHMARKS[name](args))
+
+    baseline = None
+    # Live-server numbers include the server and network, so they are not comparable
+    if not args.url and os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    print()
+    print_table(results, baseline)
+
+    regressions = compare(results, baseline, args.threshold) if baseline else []
+    if regressions:
+        print(f"\nRegressions against {args.baseline}:")
+        for name, description in regressions:
+            print(f"  {name}: {description}")
+
+    if args.save:
+        settings = {k: getattr(args, k) for k in ('requests', 'concurrency', 'iterations', 'pdf_iterations',
+                                                  'questions', 'latency', 'jitter', 'error_rate', 'shape', 'seed')}
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                       'platform': platform.platform(), 'settings': settings, 'results': results}, f, indent=2)
+        print(f"\nSaved baseline to {args.baseline}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""
+Bounded in-memory store and render cache for PDFs
+Blobs are addressed by the SHA-256 of their content; PDFCache maps a hash of the render
+inputs (subject, questions, include_answers) to the blob so repeat papers are not re-rendered
+"""
+
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+
+_LEADING_NUMBER = re.compile(r'^\d+[\.\)]\s*')
+
+
+class BlobStore:
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        """
+        Initialize an empty store.
+
+        Args:
+            max_bytes (int): Total size kept in memory; least recently used blobs are evicted first
+        """
+        self.max_bytes = max(1, int(max_bytes))
+        self._blobs = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def put(self, data, filename):
+        """
+        Store a blob.
+
+        Args:
+            data (bytes): Blob content
+            filename (str): Download filename served with the blob
+
+        Returns:
+            str: Content hash used to fetch the blob
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if digest in self._blobs:
+                self._blobs.move_to_end(digest)
+                return digest
+            self._blobs[digest] = (data, filename)
+            self._size += len(data)
+            # Always keep the newest blob, even if it alone exceeds the limit
+            while self._size > self.max_bytes and len(self._blobs) > 1:
+                _, (old, _) = self._blobs.popitem(last=False)
+                self._size -= len(old)
+                self.evictions += 1
+        return digest
+
+    def get(self, digest):
+        """
+        Fetch a blob.
+
+        Args:
+            digest (str): Content hash returned by put()
+
+        Returns:
+            tuple: (data, filename), or None if unknown or evicted
+        """
+        with self._lock:
+            blob = self._blobs.get(digest)
+            if blob is not None:
+                self._blobs.move_to_end(digest)
+            return blob
+
+    def __contains__(self, digest):
+        with self._lock:
+            return digest in self._blobs
+
+    def stats(self):
+        """
+        Get store counters.
+
+        Returns:
+            dict: count, bytes, max_bytes and evictions
+        """
+        with self._lock:
+            return {
+                'count': len(self._blobs),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions
+            }
+
+
+class PDFCache:
+    def __init__(self, blob_store, max_entries=1024):
+        """
+        Maps a hash of the render inputs to the blob holding the rendered PDF,
+        so identical papers skip rendering entirely.
+
+        Args:
+            blob_store (BlobStore): Store the rendered PDFs live in
+            max_entries (int): Number of render keys remembered
+        """
+        self.blob_store = blob_store
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(subject, questions, include_answers):
+        """
+        Hash the normalized render inputs.
+
+        Args:
+            subject (str): Subject name
+            questions (list): Questions (strings or dicts with 'question' and 'answer')
+            include_answers (bool): Whether answers are rendered
+
+        Returns:
+            str: Hex digest identifying the rendered paper
+        """
+        items = []
+        for q in questions:
+            if isinstance(q, dict):
+                question_text, answer_text = str(q.get('question', q)), str(q.get('answer') or '')
+            else:
+                question_text, answer_text = str(q), ''
+            # Formatter strips leading numbering, so "1. X" and "X" render identically
+            item = [_LEADING_NUMBER.sub('', question_text.strip())]
+            if include_answers:
+                item.append(answer_text.strip())
+            items.append(item)
+        payload = json.dumps([subject.strip(), bool(include_answers), items], separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Look up a rendered paper.
+
+        Args:
+            key (str): Render key from make_key()
+
+        Returns:
+            str: Blob digest of the cached PDF, or None if not cached or evicted from the store
+        """
+        with self._lock:
+            digest = self._entries.get(key)
+            if digest is not None and digest not in self.blob_store:
+                del self._entries[key]
+                digest = None
+            if digest is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return digest
+
+    def put(self, key, digest):
+        with self._lock:
+            self._entries[key] = digest
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        """
+        Get cache counters.
+
+        Returns:
+            dict: size, hits, misses, hit_rate and evictions
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,236 @@
+"""
+Bulk cohort paper generation
+Builds one variant paper per student and renders the PDFs across a process pool
+(fpdf layout is CPU-bound and holds the GIL), returning everything as a single ZIP
+"""
+
+import io
+import json
+import multiprocessing
+import os
+import random
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from formatter import Formatter, pdf_filename
+from question_bank import get_bank
+from sampler import ExamSampler, student_seed
+
+# Below this many papers the process pool costs more than it saves
+MIN_PARALLEL_VARIANTS = 4
+
+# Generated questions shared out between papers (never fewer than one paper's worth)
+MAX_GENERATED_POOL = 50
+
+# One per process: variants share most questions, so their layouts are reused across papers
+_formatter = Formatter()
+
+# Render processes shared by every cohort request, started on first use
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+def _render_variant(args):
+    # Top-level so it can be pickled into worker processes
+    subject, questions, include_answers, answer_key = args
+    if answer_key:
+        return _formatter.make_pdf_versions(subject, questions)
+    return _formatter.make_pdf_bytes(subject, questions, include_answers=include_answers)
+
+
+def _mp_context():
+    # Forking a threaded server copies locks other threads hold; start workers from a clean
+    # forkserver (which imports this module once) or, where that is unavailable, spawn them
+    try:
+        context = multiprocessing.get_context('forkserver')
+    except ValueError:
+        return multiprocessing.get_context('spawn')
+    context.set_forkserver_preload(['bulk'])
+    return context
+
+
+def _get_pool(workers):
+    # Created lazily so the pool is never inherited across a fork; replaced if the size changes
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=_mp_context())
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown(wait=True):
+    """Stop the shared render processes (a later render starts new ones)."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=wait)
+
+
+def build_variants(subject, count, student_ids, exam_seed=None, mix=None, generator=None):
+    """
+    Assemble one paper per student.
+
+    Bank subjects are sampled per student with reproducible seeds. Other subjects need a
+    generator: one question pool is generated and each student gets a seeded shuffle of it.
+
+    Args:
+        subject (str): Subject name
+        count (int): Questions per paper
+        student_ids (list): One identifier per paper
+        exam_seed: Per-exam value mixed into every seed
+        mix (dict): Difficulty weights for bank subjects
+        generator (QuestionGenerator): Used when the subject is not in the bank
+
+    Returns:
+        dict: Student id -> list of question dicts
+    """
+    if subject in get_bank():
+        return ExamSampler().sample_many(subject, count, student_ids, mix=mix, exam_seed=exam_seed)
+
+    if generator is None:
+        raise ValueError(f"No questions for '{subject}' in the bank and no generator available")
+
+    # A larger pool than one paper so the variants actually differ
+    pool_size = max(count, min(count * 2, MAX_GENERATED_POOL))
+    pool = generator.create_questions(subject, pool_size, include_answers=True)
+    papers = {}
+    for student_id in student_ids:
+        rng = random.Random(student_seed(subject, student_id, exam_seed))
+        papers[student_id] = rng.sample(pool, min(count, len(pool)))
+    return papers
+
+
+def render_papers(subject, papers, include_answers=False, processes=None, answer_keys=False):
+    """
+    Render every paper to PDF bytes.
+
+    Args:
+        subject (str): Subject name
+        papers (dict): Student id -> list of question dicts
+        include_answers (bool): Whether answers are printed on the papers
+        processes (int): Worker processes (default: CPU count)
+        answer_keys (bool): Also render each paper's answer key (in the same pass; the paper
+            itself then has no answers)
+
+    Returns:
+        dict: Student id -> PDF bytes, or (paper, answer key) PDF bytes with answer_keys
+    """
+    student_ids = list(papers)
+    jobs = [(subject, papers[student_id], include_answers, answer_keys) for student_id in student_ids]
+    if len(jobs) < MIN_PARALLEL_VARIANTS or processes == 1:
+        return dict(zip(student_ids, map(_render_variant, jobs)))
+
+    workers = processes or os.cpu_count() or 1
+    chunksize = max(1, len(jobs) // (workers * 4))
+    try:
+        return dict(zip(student_ids, _get_pool(workers).map(_render_variant, jobs, chunksize=chunksize)))
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory): drop the pool so the next request starts afresh
+        shutdown(wait=False)
+        raise
+
+
+def cohort_zip(subject, papers, pdfs):
+    """
+    Pack rendered papers into a ZIP.
+
+    The archive holds one PDF per student (plus <name>_Key.pdf when answer keys were
+    rendered) and manifest.json with every paper's questions and answers. Ids that reduce to
+    the same file name (e.g. "a.b" and "ab") get a numeric suffix, and the manifest records
+    which file belongs to which student.
+
+    Args:
+        subject (str): Subject name
+        papers (dict): Student id -> list of question dicts
+        pdfs (dict): Student id -> PDF bytes, or (paper, answer key) PDF bytes
+
+    Returns:
+        bytes: ZIP archive
+    """
+    base = pdf_filename(subject)[:-len('.pdf')]
+    buffer = io.BytesIO()
+    # PDFs are already compressed; storing them avoids burning CPU for nothing
+    files = {}
+    used = set()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for student_id, data in pdfs.items():
+            safe_id = "".join(c for c in str(student_id) if c.isalnum() or c in ('-', '_')) or 'paper'
+            name = safe_id
+            suffix = 1
+            # Each paper claims its own name and its key's; compared case-insensitively since
+            # archives are often unpacked on case-insensitive filesystems
+            while name.lower() in used or f"{name}_Key".lower() in used:
+                suffix += 1
+                name = f"{safe_id}_{suffix}"
+            used.update((name.lower(), f"{name}_Key".lower()))
+            files[str(student_id)] = f"{base}_{name}.pdf"
+            if isinstance(data, tuple):
+                data, key = data
+                archive.writestr(f"{base}_{name}_Key.pdf", key)
+            archive.writestr(f"{base}_{name}.pdf", data)
+        manifest = {'subject': subject, 'papers': {str(k): v for k, v in papers.items()}, 'files': files}
+        archive.writestr('manifest.json', json.dumps(manifest, indent=2), compress_type=zipfile.ZIP_DEFLATED)
+    return buffer.getvalue()
+
+
+def generate_cohort(subject, count, variants=None, student_ids=None, exam_seed=None, mix=None,
+                    include_answers=False, generator=None, processes=None, answer_keys=False):
+    """
+    Build, render and zip a whole cohort's papers.
+
+    Args:
+        subject (str): Subject name
+        count (int): Questions per paper
+        variants (int): Number of papers (ignored when student_ids is given)
+        student_ids (list): Explicit student identifiers, one paper each
+        exam_seed: Per-exam value mixed into every seed
+        mix (dict): Difficulty weights for bank subjects
+        include_answers (bool): Whether answers are printed on the papers
+        generator (QuestionGenerator): Used when the subject is not in the bank
+        processes (int): Render worker processes (default: CPU count)
+        answer_keys (bool): Add an answer key PDF for every paper
+
+    Returns:
+        bytes: ZIP archive with one PDF per paper and manifest.json
+    """
+    if student_ids is None:
+        width = len(str(variants))
+        student_ids = [str(i).zfill(width) for i in range(1, variants + 1)]
+    papers = build_variants(subject, count, student_ids, exam_seed=exam_seed, mix=mix, generator=generator)
+    pdfs = render_papers(subject, papers, include_answers=include_answers, processes=processes,
+                         answer_keys=answer_keys)
+    return cohort_zip(subject, papers, pdfs)
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    from generator import QuestionGenerator
+
+    parser = argparse.ArgumentParser(description="Generate one exam paper per student as a ZIP of PDFs")
+    parser.add_argument('subject', help="Subject name, e.g. Python")
+    parser.add_argument('num_questions', type=int, help="Questions per paper")
+    parser.add_argument('variants', type=int, help="Number of papers")
+    parser.add_argument('-o', '--output', help="Output ZIP (default: <Subject>_Cohort.zip)")
+    parser.add_argument('--seed', help="Exam seed; the same seed reproduces the same papers")
+    parser.add_argument('--answers', action='store_true', help="Print answers on the papers")
+    parser.add_argument('--answer-keys', action='store_true', help="Add an answer key PDF for every paper")
+    parser.add_argument('--processes', type=int, help="Render worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    output = args.output or pdf_filename(args.subject).replace('_Exam.pdf', '_Cohort.zip')
+    start = time.time()
+    data = generate_cohort(args.subject, args.num_questions, variants=args.variants, exam_seed=args.seed,
+                           include_answers=args.answers, answer_keys=args.answer_keys,
+                           generator=QuestionGenerator(os.getenv("GOOGLE_API_KEY")), processes=args.processes)
+    with open(output, 'wb') as f:
+        f.write(data)
+    print(f"Wrote {args.variants} papers to {output} in {time.time() - start:.2f}s")
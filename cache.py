@@ -0,0 +1,349 @@
+"""
+Response caches for AI question generation and answer evaluation
+Pluggable backends: a size-bounded in-memory LRU and an optional SQLite file that survives restarts
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Only sentence-ending punctuation is folded: "a<b" vs "a>b" or "==" vs "!=" are different answers
+_TRAILING_PUNCTUATION = ".!?,;: "
+
+
+class MemoryBackend:
+    def __init__(self, max_size=256, ttl=None):
+        """
+        In-memory LRU backend.
+
+        Args:
+            max_size (int): Maximum number of entries kept
+            ttl (float): Seconds before an entry expires (None = never)
+        """
+        self.max_size = max(1, int(max_size))
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, created = item
+            if self.ttl is not None and time.time() - created > self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, created=None):
+        with self._lock:
+            self._data[key] = (value, created if created is not None else time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteBackend:
+    def __init__(self, path, max_size=10000, ttl=None):
+        """
+        On-disk backend stored in a single SQLite file. Values must be JSON serializable.
+
+        Args:
+            path (str): Database file path
+            max_size (int): Maximum number of rows kept (least recently used evicted first)
+            ttl (float): Seconds before an entry expires (None = never)
+        """
+        self.path = path
+        self.max_size = max(1, int(max_size))
+        self.ttl = ttl
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._db = None
+        self._connect()
+
+    def _connect(self):
+        self._pid = os.getpid()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+        self._db.commit()
+
+    @property
+    def _conn(self):
+        # A connection must not be shared across fork (e.g. gunicorn preload); reopen in the child
+        if self._pid != os.getpid():
+            self._connect()
+        return self._db
+
+    def get(self, key):
+        return self.get_with_created(key)[0]
+
+    def get_with_created(self, key):
+        """Like get() but also returns the entry's creation time (used to warm the memory tier)."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None, None
+            if self.ttl is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None, None
+            self._conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, created=None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), created if created is not None else now, now)
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            if count > self.max_size:
+                self._conn.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                    (count - self.max_size,)
+                )
+                self.evictions += count - self.max_size
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class TieredBackend:
+    def __init__(self, memory, disk):
+        """
+        Memory LRU in front of a persistent backend. Hits are served from memory;
+        misses fall through to disk and are promoted.
+
+        Args:
+            memory (MemoryBackend): Fast first tier
+            disk (SQLiteBackend): Persistent second tier
+        """
+        self.memory = memory
+        self.disk = disk
+
+    @property
+    def evictions(self):
+        return self.memory.evictions + self.disk.evictions
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        value, created = self.disk.get_with_created(key)
+        if value is not None:
+            self.memory.set(key, value, created=created)
+        return value
+
+    def set(self, key, value, created=None):
+        self.memory.set(key, value, created=created)
+        self.disk.set(key, value, created=created)
+
+    def clear(self):
+        self.memory.clear()
+        self.disk.clear()
+
+    def __len__(self):
+        return len(self.disk)
+
+
+def make_backend(max_size=256, ttl=None, path=None):
+    """
+    Build a cache backend from simple settings.
+
+    Args:
+        max_size (int): In-memory entry limit
+        ttl (float): Entry lifetime in seconds (None = never expire)
+        path (str): Optional SQLite file for persistence across restarts
+
+    Returns:
+        MemoryBackend or TieredBackend
+    """
+    memory = MemoryBackend(max_size=max_size, ttl=ttl)
+    if not path:
+        return memory
+    return TieredBackend(memory, SQLiteBackend(path, max_size=max(max_size, 10000), ttl=ttl))
+
+
+class GenerationCache:
+    def __init__(self, backend=None):
+        """
+        Cache of generated question lists keyed by (subject, include_answers, model).
+
+        Only the largest list seen for a key is kept, so a request for N questions is
+        served by slicing any cached list of N or more.
+
+        Args:
+            backend: MemoryBackend, SQLiteBackend or TieredBackend (default: in-memory LRU)
+        """
+        self.backend = backend if backend is not None else MemoryBackend()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(subject, include_answers, model):
+        subject = " ".join(subject.lower().split())
+        return f"{model}|{int(bool(include_answers))}|{subject}"
+
+    def get(self, subject, count, include_answers, model, partial=False):
+        """
+        Get cached questions.
+
+        Args:
+            subject (str): Subject name
+            count (int): Number of questions wanted
+            include_answers (bool): Whether answers were requested
+            model (str): Model name the questions came from
+            partial (bool): Also return a cached list shorter than `count`
+
+        Returns:
+            list: Copies of the first `count` cached questions, or None on a miss
+        """
+        questions = self.backend.get(self.make_key(subject, include_answers, model))
+        hit = questions is not None and (partial or len(questions) >= count)
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if not hit:
+            return None
+        return [dict(q) for q in questions[:count]]
+
+    def put(self, subject, include_answers, model, questions):
+        """Store questions unless a larger list is already cached for the same key."""
+        if not questions:
+            return
+        key = self.make_key(subject, include_answers, model)
+        existing = self.backend.get(key)
+        if existing is not None and len(existing) >= len(questions):
+            return
+        self.backend.set(key, [dict(q) for q in questions])
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        """
+        Get cache counters.
+
+        Returns:
+            dict: size, hits, misses, hit_rate and evictions
+        """
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            'size': len(self.backend),
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / total, 4) if total else 0.0,
+            'evictions': self.backend.evictions
+        }
+
+
+def normalize_text(text):
+    """
+    Fold case, whitespace and trailing punctuation so trivially different answers compare equal.
+
+    Args:
+        text (str): Raw question or answer text
+
+    Returns:
+        str: Normalized text
+    """
+    return " ".join(text.lower().split()).rstrip(_TRAILING_PUNCTUATION)
+
+
+class EvaluationCache:
+    def __init__(self, backend=None):
+        """
+        Content-addressed cache of evaluation text keyed by a hash of the
+        normalized question and student answer.
+
+        Args:
+            backend: MemoryBackend, SQLiteBackend or TieredBackend (default: in-memory LRU)
+        """
+        self.backend = backend if backend is not None else MemoryBackend(max_size=4096)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(question, answer, model):
+        payload = "\0".join((model, normalize_text(question), normalize_text(answer)))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, question, answer, model):
+        """
+        Get a cached evaluation.
+
+        Args:
+            question (str): The exam question
+            answer (str): Student's answer
+            model (str): Model name that produced the evaluation
+
+        Returns:
+            str: Cached evaluation text, or None on a miss
+        """
+        evaluation = self.backend.get(self.make_key(question, answer, model))
+        with self._lock:
+            if evaluation is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return evaluation
+
+    def put(self, question, answer, model, evaluation):
+        self.backend.set(self.make_key(question, answer, model), evaluation)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        """
+        Get cache counters.
+
+        Returns:
+            dict: size, hits, misses, hit_rate and evictions
+        """
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            'size': len(self.backend),
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / total, 4) if total else 0.0,
+            'evictions': self.backend.evictions
+        }
@@ -1,5 +1,12 @@
+import asyncio
 import os
 
+import prompts
+from async_client import AsyncModelClient, create_model, run_sync
+from cache import normalize_text
+from parsing import (format_evaluation, parse_evaluation, parse_evaluation_json,
+                     parse_stats, split_batch_evaluation)
+
 # Optional import - only needed if using AI evaluation
 try:
     import google.generativeai as genai
@@ -8,14 +15,23 @@ except ImportError:
     GENAI_AVAILABLE = False
     genai = None
 
+MODEL_NAME = "gemini-1.5-pro"
+
+
 class Evaluator:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, cache=None, structured=False):
         """
         Initialize the Evaluator with API key.
         
         Args:
             api_key (str): Google Generative AI API key. If None, reads from GOOGLE_API_KEY env var.
+            cache (EvaluationCache): Optional cache of previous evaluations
+            structured (bool): Ask the model for JSON output and validate it; replies are
+                still returned in the "Score:/Feedback:" text format
         """
+        self.cache = cache
+        self.structured = structured
+        
         if api_key is None:
             api_key = os.getenv("GOOGLE_API_KEY")
         
@@ -25,8 +41,8 @@ class Evaluator:
         if not GENAI_AVAILABLE:
             raise ValueError("google-generativeai package not installed. Install it with: pip install google-generativeai")
         
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel("gemini-1.5-pro")
+        self.model = create_model(api_key, MODEL_NAME)
+        self.client = AsyncModelClient(self.model, api_key=api_key, operation='evaluate')
     
     def check_answer(self, question, student_answer):
         """
@@ -39,19 +55,114 @@ class Evaluator:
         Returns:
             str: Evaluation with score and feedback
         """
-        prompt = f"""
-        Question: {question}
-        Student Answer: {student_answer}
-
-        Give a score from 1 to 10.
-        Give very short feedback.
-        Format:
-        Score: <number>
-        Feedback: <short text>
+        return run_sync(self.acheck_answer(question, student_answer))
+    
+    async def acheck_answer(self, question, student_answer, timeout=None):
         """
+        Async form of check_answer() for use on an event loop.
+        
+        Args:
+            question (str): The exam question
+            student_answer (str): Student's answer
+            timeout (float): Deadline for the model call (default: client timeout)
+        
+        Returns:
+            str: Evaluation with score and feedback
+        """
+        # Identical (after normalization) answers to the same question reuse the earlier evaluation
+        if self.cache is not None:
+            cached = self.cache.get(question, student_answer, MODEL_NAME)
+            if cached is not None:
+                return cached
+        
+        prompt, config = prompts.evaluation_prompt(question, student_answer, structured=self.structured)
 
         try:
-            response = self.model.generate_content(prompt)
-            return response.text
+            response = await self.client.generate(prompt, timeout=timeout, generation_config=config)
+            evaluation = response.text
+            if self.structured:
+                evaluation = self._from_json(evaluation)
+            if self.cache is not None:
+                self.cache.put(question, student_answer, MODEL_NAME, evaluation)
+            return evaluation
+        except asyncio.TimeoutError:
+            return "Error evaluating answer: timed out\nScore: N/A\nFeedback: Unable to evaluate at this time."
         except Exception as e:
             return f"Error evaluating answer: {e}\nScore: N/A\nFeedback: Unable to evaluate at this time."
+    
+    def check_answers(self, pairs, chunk_size=10, max_concurrency=4):
+        """
+        Evaluate many (question, answer) pairs, packing several pairs into each model call.
+        
+        Pairs that only differ in case, whitespace or trailing punctuation are graded once and
+        share the evaluation.
+        
+        Args:
+            pairs (list): List of (question, student_answer) tuples
+            chunk_size (int): Number of pairs sent in one prompt
+            max_concurrency (int): Maximum number of prompts in flight at once
+        
+        Returns:
+            list: One dict per pair, in input order, with either an 'evaluation' or an 'error' key
+        """
+        return run_sync(self.acheck_answers(pairs, chunk_size, max_concurrency))
+    
+    async def acheck_answers(self, pairs, chunk_size=10, max_concurrency=4):
+        """Async form of check_answers()."""
+        results = [None] * len(pairs)
+        # Normalized pair -> indices of the uncached pairs with that text
+        pending = {}
+        for index, (question, answer) in enumerate(pairs):
+            cached = self.cache.get(question, answer, MODEL_NAME) if self.cache is not None else None
+            if cached is not None:
+                results[index] = {'evaluation': cached}
+            else:
+                pending.setdefault((normalize_text(question), normalize_text(answer)), []).append(index)
+        
+        groups = list(pending.values())
+        chunk_size = max(1, int(chunk_size))
+        chunks = [groups[i:i + chunk_size] for i in range(0, len(groups), chunk_size)]
+        limit = asyncio.Semaphore(max(1, int(max_concurrency)))
+        
+        async def run_chunk(chunk):
+            async with limit:
+                return await self._check_chunk([pairs[group[0]] for group in chunk])
+        
+        for chunk, chunk_results in zip(chunks, await asyncio.gather(*(run_chunk(c) for c in chunks))):
+            for group, result in zip(chunk, chunk_results):
+                for index in group:
+                    results[index] = dict(result)
+        return results
+    
+    async def _check_chunk(self, pairs):
+        """Evaluate one chunk of pairs with a single model call."""
+        prompt, config = prompts.batch_evaluation_prompt(pairs, structured=self.structured)
+        
+        try:
+            response = await self.client.generate(prompt, generation_config=config)
+            blocks = split_batch_evaluation(response.text, structured=self.structured)
+        except asyncio.TimeoutError:
+            return [{'error': "Error evaluating answer: timed out"} for _ in pairs]
+        except Exception as e:
+            return [{'error': f"Error evaluating answer: {e}"} for _ in pairs]
+        
+        results = []
+        for i, (question, answer) in enumerate(pairs, 1):
+            evaluation = blocks.get(i)
+            if not evaluation or parse_evaluation(evaluation)[0] is None:
+                parse_stats.increment('batch_items_missing')
+                results.append({'error': f"No evaluation returned for item {i}"})
+                continue
+            if self.cache is not None:
+                self.cache.put(question, answer, MODEL_NAME, evaluation)
+            results.append({'evaluation': evaluation})
+        return results
+    
+    @staticmethod
+    def _from_json(text):
+        """Convert a structured reply to the text format, keeping the raw text if it is invalid."""
+        try:
+            return format_evaluation(*parse_evaluation_json(text))
+        except ValueError:
+            parse_stats.increment('json_invalid')
+            return text
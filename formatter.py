@@ -1,57 +1,246 @@
 from fpdf import FPDF
-import os
 import re
+import threading
+from collections import OrderedDict
+
+# Wrapped questions and answers kept for reuse across renders
+BLOCK_CACHE_SIZE = 4096
+
+FONT = "Arial"
+TITLE_SIZE = 12
+QUESTION_STYLE, QUESTION_SIZE, QUESTION_LINE = 'B', 12, 10
+ANSWER_STYLE, ANSWER_SIZE, ANSWER_LINE = 'I', 11, 8
+ANSWER_COLOR = (0, 100, 0)  # Green color for answers
+
+
+def pdf_filename(subject):
+    """Download filename for a subject's exam paper."""
+    # Clean filename for subject
+    clean_subject = "".join(c for c in subject if c.isalnum() or c in (' ', '-', '_')).strip()
+    return f"{clean_subject.replace(' ', '_')}_Exam.pdf"
+
+
+def _pdf_bytes(pdf):
+    data = pdf.output(dest='S')
+    # PyFPDF returns a latin-1 str, fpdf2 returns a bytearray
+    if isinstance(data, str):
+        return data.encode('latin-1')
+    return bytes(data)
+
+
+def _question_parts(q):
+    # Handle both string and dict formats
+    if isinstance(q, dict):
+        question_text = q.get('question', str(q))
+        answer_text = q.get('answer', '')
+    else:
+        question_text = str(q)
+        answer_text = ''
+    # Remove leading numbers if present
+    return re.sub(r'^\d+[\.\)]\s*', '', question_text).strip(), answer_text
+
+
+class PaperTemplate:
+    def __init__(self):
+        """
+        Page geometry and font metrics for exam papers, measured once.
+
+        Character widths for each font used on the paper are read from fpdf a single time, so
+        wrapping text needs no fpdf calls.
+        """
+        pdf = FPDF()
+        pdf.add_page()
+        # Text width available to a full-width cell (what multi_cell(0, ...) wraps to)
+        self.text_width = pdf.w - pdf.r_margin - pdf.l_margin - 2 * pdf.c_margin
+        self.widths = {}
+        for style, size in ((QUESTION_STYLE, QUESTION_SIZE), (ANSWER_STYLE, ANSWER_SIZE)):
+            pdf.set_font(FONT, size=size, style=style)
+            self.widths[style, size] = {chr(c): pdf.get_string_width(chr(c)) for c in range(256)}
+
+    def wrap(self, text, style, size):
+        """
+        Break text into lines that fit the page width, the way fpdf's multi_cell() does.
+
+        Args:
+            text (str): Text to wrap (newlines force a break)
+            style (str): Font style ('B', 'I' or '')
+            size (int): Font size in points
+
+        Returns:
+            tuple: Lines of text
+        """
+        widths = self.widths[style, size]
+        limit = self.text_width
+        lines = []
+        for paragraph in text.replace('\r', '').rstrip('\n').split('\n'):
+            start = 0
+            space = -1
+            width = 0.0
+            i = 0
+            while i < len(paragraph):
+                c = paragraph[i]
+                if c == ' ':
+                    space = i
+                width += widths.get(c, 0)
+                if width > limit:
+                    if space == -1:
+                        # One word wider than the page: break inside it
+                        if i == start:
+                            i += 1
+                        lines.append(paragraph[start:i])
+                    else:
+                        lines.append(paragraph[start:space])
+                        i = space + 1
+                    start = i
+                    space = -1
+                    width = 0.0
+                else:
+                    i += 1
+            lines.append(paragraph[start:])
+        return tuple(lines)
+
 
 class Formatter:
+    def __init__(self, block_cache_size=BLOCK_CACHE_SIZE):
+        """
+        Exam paper renderer.
+
+        Page layout and font metrics are measured on first use and shared by every render.
+        Each question and answer is wrapped once and the lines are cached by their text, so
+        re-rendering a paper only lays out the questions that changed.
+
+        Args:
+            block_cache_size (int): Wrapped questions and answers kept (least recently used dropped first)
+        """
+        self.block_cache_size = max(1, int(block_cache_size))
+        self._template = None
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
     def make_pdf(self, subject, questions, include_answers=False):
         """
         Create a PDF file with exam questions.
-        
+
         Args:
             subject (str): Subject name
             questions (list): List of questions (strings or dicts with 'question' and 'answer')
             include_answers (bool): Whether to include answers in PDF
-        
+
         Returns:
             str: Filename of the generated PDF
         """
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_font("Arial", size=12)
+        pdf = self._build_pdfs(subject, questions, (include_answers,))[0]
+        filename = pdf_filename(subject)
+        pdf.output(filename)
+        return filename
+
+    def make_pdf_bytes(self, subject, questions, include_answers=False):
+        """
+        Create an exam PDF in memory without touching the filesystem.
+
+        Args:
+            subject (str): Subject name
+            questions (list): List of questions (strings or dicts with 'question' and 'answer')
+            include_answers (bool): Whether to include answers in PDF
+
+        Returns:
+            bytes: The PDF document
+        """
+        return _pdf_bytes(self._build_pdfs(subject, questions, (include_answers,))[0])
+
+    def make_pdf_versions(self, subject, questions):
+        """
+        Create the student paper and its answer key in one pass over the questions.
+
+        Args:
+            subject (str): Subject name
+            questions (list): List of questions (strings or dicts with 'question' and 'answer')
 
-        # Title
-        pdf.cell(200, 10, f"Exam Paper - {subject}", ln=True, align="C")
-        pdf.ln(10)
+        Returns:
+            tuple: (student PDF bytes without answers, answer key PDF bytes)
+        """
+        student, key = self._build_pdfs(subject, questions, (False, True))
+        return _pdf_bytes(student), _pdf_bytes(key)
+
+    def prepare(self):
+        """Measure the page layout and fonts now (e.g. before a pre-fork server forks its workers)."""
+        self._get_template()
+
+    def _get_template(self):
+        if self._template is None:
+            with self._lock:
+                if self._template is None:
+                    self._template = PaperTemplate()
+        return self._template
+
+    def _wrapped(self, text, style, size):
+        # Keyed by the text itself: the same answer under another number reuses its lines
+        key = (text, style, size)
+        with self._lock:
+            lines = self._blocks.get(key)
+            if lines is not None:
+                self._blocks.move_to_end(key)
+                self.hits += 1
+                return lines
+            self.misses += 1
 
-        # Clean filename for subject
-        clean_subject = "".join(c for c in subject if c.isalnum() or c in (' ', '-', '_')).strip()
+        lines = self._get_template().wrap(text, style, size)
+        with self._lock:
+            self._blocks[key] = lines
+            if len(self._blocks) > self.block_cache_size:
+                self._blocks.popitem(last=False)
+        return lines
+
+    def _layout(self, number, question_text, answer_text, answers):
+        question_lines = self._wrapped(f"Q{number}. {question_text}", QUESTION_STYLE, QUESTION_SIZE)
+        if not (answers and answer_text):
+            return question_lines, ()
+        return question_lines, self._wrapped(f"Answer: {answer_text}", ANSWER_STYLE, ANSWER_SIZE)
+
+    def _build_pdfs(self, subject, questions, versions):
+        # One document per entry of versions (whether it prints answers), filled in a single pass
+        self._get_template()
+        answers = any(versions)
+        documents = []
+        for _ in versions:
+            pdf = FPDF()
+            pdf.add_page()
+            pdf.set_font(FONT, size=TITLE_SIZE)
+
+            # Title
+            pdf.cell(200, 10, f"Exam Paper - {subject}", ln=True, align="C")
+            pdf.ln(10)
+            documents.append(pdf)
 
         # Questions
         for i, q in enumerate(questions, 1):
-            # Handle both string and dict formats
-            if isinstance(q, dict):
-                question_text = q.get('question', str(q))
-                answer_text = q.get('answer', '')
-            else:
-                question_text = str(q)
-                answer_text = ''
-            
-            # Remove leading numbers if present
-            question_text = re.sub(r'^\d+[\.\)]\s*', '', question_text).strip()
-            
-            pdf.set_font("Arial", size=12, style='B')
-            pdf.multi_cell(0, 10, f"Q{i}. {question_text}")
-            pdf.ln(3)
-            
-            if include_answers and answer_text:
-                pdf.set_font("Arial", size=11, style='I')
-                pdf.set_text_color(0, 100, 0)  # Green color for answers
-                pdf.multi_cell(0, 8, f"Answer: {answer_text}")
-                pdf.set_text_color(0, 0, 0)  # Reset to black
+            question_lines, answer_lines = self._layout(i, *_question_parts(q), answers)
+            for pdf, include_answers in zip(documents, versions):
+                pdf.set_font(FONT, size=QUESTION_SIZE, style=QUESTION_STYLE)
+                for line in question_lines:
+                    pdf.cell(0, QUESTION_LINE, line, ln=1)
                 pdf.ln(3)
-            
-            pdf.ln(5)
 
-        filename = f"{clean_subject.replace(' ', '_')}_Exam.pdf"
-        pdf.output(filename)
-        return filename
+                if include_answers and answer_lines:
+                    pdf.set_font(FONT, size=ANSWER_SIZE, style=ANSWER_STYLE)
+                    pdf.set_text_color(*ANSWER_COLOR)
+                    for line in answer_lines:
+                        pdf.cell(0, ANSWER_LINE, line, ln=1)
+                    pdf.set_text_color(0, 0, 0)  # Reset to black
+                    pdf.ln(3)
+
+                pdf.ln(5)
+
+        return documents
+
+    def stats(self):
+        """
+        Get layout cache counters.
+
+        Returns:
+            dict: hits, misses and size (wrapped questions and answers kept)
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._blocks)}
@@ -1,5 +1,11 @@
+import asyncio
 import os
 from predefined_questions import get_predefined_questions
+from async_client import AsyncModelClient, create_model, run_sync
+import metrics
+import prompts
+import similarity
+from parsing import QAStreamParser, parse_questions, parse_stats
 
 # Optional import - only needed if using AI generation
 try:
@@ -9,17 +15,40 @@ except ImportError:
     GENAI_AVAILABLE = False
     genai = None
 
+MODEL_NAME = "gemini-1.5-pro"
+
+# Requests for more questions than this are split into concurrent smaller calls
+FANOUT_CHUNK_SIZE = max(1, int(os.getenv("GENERATION_CHUNK_SIZE", "10")))
+
+# Steers that make each fan-out chunk ask for different questions
+CHUNK_FOCUS = [
+    "easy questions on fundamental concepts and definitions",
+    "medium questions on practical applications and examples",
+    "hard questions on problem solving and analysis",
+    "medium questions comparing related concepts and their trade-offs",
+    "hard questions on advanced topics and edge cases",
+]
+
+# Steer for the follow-up call that replaces near-duplicates dropped from a small paper
+REPLACEMENT_FOCUS = "less common concepts that a typical exam on this subject would not already cover"
+
+
 class QuestionGenerator:
-    def __init__(self, api_key=None, use_predefined=False):
+    def __init__(self, api_key=None, use_predefined=False, cache=None, structured=False):
         """
         Initialize the QuestionGenerator with API key.
         
         Args:
             api_key (str): Google Generative AI API key. If None, reads from GOOGLE_API_KEY env var.
             use_predefined (bool): If True, use predefined questions instead of AI generation
+            cache (GenerationCache): Optional cache for AI-generated questions
+            structured (bool): Ask the model for JSON output and validate it (streaming
+                always uses the line format)
         """
         self.use_predefined = use_predefined
+        self.structured = structured
         self.api_key = api_key
+        self.cache = cache
         
         if not use_predefined:
             if api_key is None:
@@ -34,8 +63,8 @@ class QuestionGenerator:
                     self.use_predefined = True
                 else:
                     self.api_key = api_key
-                    genai.configure(api_key=api_key)
-                    self.model = genai.GenerativeModel("gemini-1.5-pro")
+                    self.model = create_model(api_key, MODEL_NAME)
+                    self.client = AsyncModelClient(self.model, api_key=api_key)
     
     def create_questions(self, subject, count, include_answers=True):
         """
@@ -49,115 +78,232 @@ class QuestionGenerator:
         Returns:
             list: List of dictionaries with 'question' and 'answer' keys
         """
-        # Try predefined questions first (for Java, Python, ML, Database)
-        predefined = get_predefined_questions(subject, count)
-        if predefined:
-            return predefined
+        local = self._local_questions(subject, count, include_answers)
+        if local is not None:
+            return local
+        
+        # Large papers are split into concurrent smaller calls
+        if count > FANOUT_CHUNK_SIZE:
+            return run_sync(self._fan_out(subject, count, include_answers))
         
-        # If using predefined mode or no API key, return predefined if available
-        if self.use_predefined:
-            predefined = get_predefined_questions(subject, count)
-            if predefined:
-                return predefined
-            # If no predefined found, return sample questions
-            return [{'question': f"{i+1}. Sample question about {subject}?", 'answer': f"Sample answer for question {i+1}"} for i in range(count)]
-        
-        # Use AI generation if API key is available and genai is installed
-        if not GENAI_AVAILABLE or not hasattr(self, 'model'):
-            # Fall back to predefined questions
-            predefined = get_predefined_questions(subject, count)
-            if predefined:
-                return predefined
-            return [{'question': f"{i+1}. Sample question about {subject}?", 'answer': f"Sample answer for question {i+1}"} for i in range(count)]
-        
-        if include_answers:
-            prompt = f"""
-            Generate {count} exam questions with answers for the subject: {subject}.
-            Give easy, medium, and hard mixed questions.
-            Format each question and answer pair as:
-            Q1: <question>
-            A1: <answer>
-            Q2: <question>
-            A2: <answer>
-            etc.
-            Make sure answers are clear and concise.
-            """
+        return run_sync(self._generate_paper(subject, count, include_answers))
+    
+    async def acreate_questions(self, subject, count, include_answers=True, timeout=None):
+        """
+        Async form of create_questions() for use on an event loop.
+        
+        Args:
+            subject (str): The subject/topic for questions
+            count (int): Number of questions to generate
+            include_answers (bool): Whether to include answers
+            timeout (float): Deadline for the model call (default: client timeout)
+        
+        Returns:
+            list: List of dictionaries with 'question' and 'answer' keys
+        """
+        local = self._local_questions(subject, count, include_answers)
+        if local is not None:
+            return local
+        
+        if count > FANOUT_CHUNK_SIZE:
+            return await self._fan_out(subject, count, include_answers, timeout=timeout)
+        
+        return await self._generate_paper(subject, count, include_answers, timeout=timeout)
+    
+    def stream_questions(self, subject, count, include_answers=True):
+        """
+        Generate questions, yielding each one as soon as the model has produced it.
+        
+        Args:
+            subject (str): The subject/topic for questions
+            count (int): Number of questions to generate
+            include_answers (bool): Whether to include answers
+        
+        Yields:
+            dict: Question dicts with 'question' and 'answer' keys
+        """
+        local = self._local_questions(subject, count, include_answers)
+        if local is not None:
+            yield from local
+            return
+        
+        parser = QAStreamParser(include_answers)
+        # Near-duplicates of an already streamed question are skipped as they arrive
+        seen = similarity.SimilarityIndex()
+        produced = []
+        try:
+            # Streaming always uses the line format
+            prompt, config = prompts.question_prompt(subject, count, include_answers)
+            for chunk in self.client.stream_sync(prompt, generation_config=config):
+                for item in parser.feed(chunk.text):
+                    if len(produced) < count and seen.find(item['question']) is None:
+                        seen.add(item['question'])
+                        produced.append(item)
+                        yield item
+                if len(produced) >= count:
+                    break
+            for item in parser.close():
+                if len(produced) < count and seen.find(item['question']) is None:
+                    seen.add(item['question'])
+                    produced.append(item)
+                    yield item
+        except asyncio.TimeoutError:
+            print(f"Timed out streaming questions for {subject}")
+        except Exception as e:
+            print(f"Error streaming questions: {e}")
+        
+        if len(produced) >= count:
+            self._store(subject, include_answers, produced)
+            return
+        
+        # Fill any shortfall the same way create_questions() falls back
+        if produced:
+            metrics.FALLBACKS.inc(source='sample')
+            fallback = self._sample_questions(subject, count)
         else:
-            prompt = f"""
-            Generate {count} simple exam questions for the subject: {subject}.
-            Give easy, medium, and hard mixed questions.
-            Format each question on a new line starting with a number:
-            1. <question>
-            2. <question>
-            etc.
-            """
-
+            fallback = self._fallback_questions(subject, count, include_answers)
+        for item in fallback[len(produced):]:
+            yield item
+    
+    async def _generate_paper(self, subject, count, include_answers, timeout=None):
+        """
+        Generate a small paper in one call.
+        
+        Near-duplicate questions are dropped, and one follow-up call replaces them.
+        """
         try:
-            response = self.model.generate_content(prompt)
-            text = response.text.strip()
-            
-            if include_answers:
-                # Parse questions and answers
-                questions_with_answers = []
-                lines = text.split('\n')
-                current_question = None
-                current_answer = None
-                
-                for line in lines:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    
-                    # Check if line starts with Q or Question
-                    if line.upper().startswith('Q') and ':' in line:
-                        # Save previous pair if exists
-                        if current_question and current_answer:
-                            questions_with_answers.append({
-                                'question': current_question,
-                                'answer': current_answer
-                            })
-                        # Extract question
-                        current_question = line.split(':', 1)[1].strip() if ':' in line else line[1:].strip()
-                        current_answer = None
-                    # Check if line starts with A or Answer
-                    elif line.upper().startswith('A') and ':' in line:
-                        current_answer = line.split(':', 1)[1].strip() if ':' in line else line[1:].strip()
-                    # If we have a question but no answer marker, might be continuation
-                    elif current_question and not current_answer:
-                        current_question += " " + line
-                    elif current_question and current_answer:
-                        current_answer += " " + line
-                
-                # Add last pair
-                if current_question:
-                    if current_answer:
-                        questions_with_answers.append({
-                            'question': current_question,
-                            'answer': current_answer
-                        })
-                    else:
-                        # If no answer found, create a placeholder
-                        questions_with_answers.append({
-                            'question': current_question,
-                            'answer': f"Answer for: {current_question}"
-                        })
-                
-                # If parsing failed, try alternative format
-                if not questions_with_answers:
-                    # Fallback: split by numbered questions
-                    questions = [q.strip() for q in text.split('\n') if q.strip() and (q.strip()[0].isdigit() or q.strip().upper().startswith('Q'))]
-                    questions_with_answers = [{'question': q, 'answer': f'Answer for question {i+1}'} for i, q in enumerate(questions[:count])]
-                
-                return questions_with_answers[:count] if questions_with_answers else [{'question': f"Question about {subject}?", 'answer': f"Answer about {subject}"} for _ in range(count)]
-            else:
-                # Original format without answers
-                questions = text.split("\n")
-                questions = [q.strip() for q in questions if q.strip() and q.strip()[0].isdigit()]
-                return [{'question': q, 'answer': ''} for q in questions] if questions else [{'question': f"Question about {subject}?", 'answer': ''} for _ in range(count)]
-                
+            text = await self._generate_text(subject, count, include_answers, timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"Timed out generating questions for {subject}")
+            return self._fallback_questions(subject, count, include_answers)
         except Exception as e:
             print(f"Error generating questions: {e}")
-            # Return sample questions as fallback
-            return [{'question': f"{i+1}. Sample question about {subject}?", 'answer': f"Sample answer for question {i+1}"} for i in range(count)]
-
-
+            # Return cached or sample questions as fallback
+            return self._fallback_questions(subject, count, include_answers)
+        
+        questions, duplicates = self._parse_response(text, subject, count, include_answers)
+        if duplicates and len(questions) < count:
+            extra = await self._generate_chunk(subject, count - len(questions), include_answers,
+                                               REPLACEMENT_FOCUS, timeout)
+            questions = similarity.dedupe(questions + extra)[:count]
+            if len(questions) == count:
+                self._store(subject, include_answers, questions)
+        return questions
+    
+    async def _fan_out(self, subject, count, include_answers, timeout=None):
+        """
+        Generate a large paper as concurrent chunks with distinct focus steers.
+        
+        Chunks that come back short are retried once on their own, and the merged
+        result is de-duplicated.
+        """
+        sizes = [FANOUT_CHUNK_SIZE] * (count // FANOUT_CHUNK_SIZE)
+        if count % FANOUT_CHUNK_SIZE:
+            sizes.append(count % FANOUT_CHUNK_SIZE)
+        
+        async def run_chunk(index, size):
+            focus = CHUNK_FOCUS[index % len(CHUNK_FOCUS)]
+            items = await self._generate_chunk(subject, size, include_answers, focus, timeout)
+            if len(items) < size:
+                # Retry just this chunk for what it is missing
+                items += await self._generate_chunk(subject, size - len(items), include_answers, focus, timeout)
+            return items
+        
+        chunks = await asyncio.gather(*(run_chunk(i, size) for i, size in enumerate(sizes)))
+        questions = similarity.dedupe([item for chunk in chunks for item in chunk])
+        
+        # Duplicates across chunks leave a gap; one extra call with a fresh steer fills it
+        if questions and len(questions) < count:
+            extra = await run_chunk(len(sizes), count - len(questions))
+            questions = similarity.dedupe(questions + extra)
+        questions = questions[:count]
+        
+        if not questions:
+            return self._fallback_questions(subject, count, include_answers)
+        if len(questions) == count:
+            self._store(subject, include_answers, questions)
+        return questions
+    
+    async def _generate_chunk(self, subject, count, include_answers, focus, timeout):
+        """One fan-out call; returns only cleanly parsed questions (possibly fewer than asked)."""
+        try:
+            text = await self._generate_text(subject, count, include_answers, focus=focus, timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"Timed out generating questions for {subject} ({focus})")
+            return []
+        except Exception as e:
+            print(f"Error generating questions: {e}")
+            return []
+        
+        questions, _ = parse_questions(text, include_answers, structured=self.structured, placeholder=False)
+        return questions[:count]
+    
+    async def _generate_text(self, subject, count, include_answers, focus=None, timeout=None):
+        """Make one model call for questions and return the reply text."""
+        prompt, config = prompts.question_prompt(subject, count, include_answers, focus=focus,
+                                                 structured=self.structured)
+        response = await self.client.generate(prompt, timeout=timeout, generation_config=config)
+        return response.text.strip()
+    
+    def _local_questions(self, subject, count, include_answers):
+        """Questions that can be served without a model call, or None."""
+        # Try predefined questions first (for Java, Python, ML, Database)
+        predefined = get_predefined_questions(subject, count)
+        if predefined:
+            metrics.FALLBACKS.inc(source='predefined')
+            return predefined
+        
+        # If using predefined mode, no API key or genai not installed, return sample questions
+        if self.use_predefined or not GENAI_AVAILABLE or not hasattr(self, 'model'):
+            metrics.FALLBACKS.inc(source='sample')
+            return self._sample_questions(subject, count)
+        
+        # Serve repeat requests from the cache (a larger cached list is sliced down)
+        if self.cache is not None:
+            return self.cache.get(subject, count, include_answers, MODEL_NAME)
+        return None
+    
+    def _fallback_questions(self, subject, count, include_answers):
+        """Questions to serve when the model cannot be reached: cached ones first, then samples."""
+        cached = None
+        if self.cache is not None:
+            cached = self.cache.get(subject, count, include_answers, MODEL_NAME, partial=True)
+        cached = cached or []
+        metrics.FALLBACKS.inc(source='cached' if cached else 'sample')
+        return cached + self._sample_questions(subject, count)[len(cached):]
+    
+    @staticmethod
+    def _sample_questions(subject, count):
+        return [{'question': f"{i+1}. Sample question about {subject}?", 'answer': f"Sample answer for question {i+1}"} for i in range(count)]
+    
+    def _parse_response(self, text, subject, count, include_answers):
+        """
+        Parse model output into question/answer dicts, caching clean parses.
+        
+        Returns:
+            tuple: (questions, number of near-duplicates dropped)
+        """
+        questions, placeholders = parse_questions(text, include_answers, structured=self.structured)
+        unique = similarity.dedupe(questions)
+        duplicates = len(questions) - len(unique)
+        if duplicates:
+            parse_stats.increment('duplicates_dropped', duplicates)
+        questions = unique[:count]
+        
+        # Only cache output that parsed cleanly (no placeholder answers); a paper left short by
+        # duplicates is cached once the caller has replaced them
+        if questions and not placeholders and (not duplicates or len(questions) == count):
+            self._store(subject, include_answers, questions)
+        if questions:
+            return questions, duplicates
+        
+        parse_stats.increment('unparsed_responses')
+        metrics.FALLBACKS.inc(source='placeholder')
+        answer = f"Answer about {subject}" if include_answers else ''
+        return [{'question': f"Question about {subject}?", 'answer': answer} for _ in range(count)], 0
+    
+    def _store(self, subject, include_answers, questions):
+        """Cache a generated paper and add its questions to the shared similarity index."""
+        if self.cache is not None:
+            self.cache.put(subject, include_answers, MODEL_NAME, questions)
+        similarity.remember(subject, questions)
@@ -0,0 +1,35 @@
+"""
+Gunicorn settings for the API server
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Every setting can be overridden from the environment (see "Production deployment" in README.md).
+"""
+
+import os
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '5000')}"
+
+# Requests mostly wait on Gemini, so threads (not processes) provide the concurrency.
+# Caches, PDF jobs and rendered PDFs live in each worker's memory: with more than one
+# worker, PDF status polling needs sticky sessions.
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_WORKERS', '1'))
+threads = int(os.getenv('WEB_THREADS', '32'))
+
+# Bulk cohort requests render many PDFs; give them time before the worker is recycled
+timeout = int(os.getenv('WEB_TIMEOUT', '120'))
+# How long a stopping worker may keep serving in-flight requests (and their Gemini calls)
+graceful_timeout = int(os.getenv('WEB_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('WEB_KEEPALIVE', '5'))
+
+# Import the app (and build the question bank) once in the master before forking
+preload_app = True
+
+accesslog = os.getenv('WEB_ACCESS_LOG', '-') or None
+errorlog = '-'
+
+
+def worker_exit(server, worker):
+    # Requests have drained; let remaining Gemini calls and PDF renders finish
+    from api_server import shutdown
+    shutdown(timeout=graceful_timeout)
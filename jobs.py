@@ -0,0 +1,178 @@
+"""
+Background PDF rendering jobs
+Runs Formatter renders on a worker pool so /generate can return before the PDF is ready
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from blob_store import PDFCache
+from formatter import pdf_filename
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class PDFJobQueue:
+    def __init__(self, formatter, max_workers=2, max_jobs=1000, blob_store=None, pdf_cache=None):
+        """
+        Initialize the job queue.
+
+        Args:
+            formatter (Formatter): Formatter used to render PDFs
+            max_workers (int): Number of render threads
+            max_jobs (int): Finished jobs kept for status polling (oldest dropped first)
+            blob_store (BlobStore): Keep PDFs in memory under their content hash instead of
+                writing <Subject>_Exam.pdf to the working directory
+            pdf_cache (PDFCache): Reuse earlier renders of identical papers (needs blob_store)
+        """
+        self.formatter = formatter
+        self.blob_store = blob_store
+        self.pdf_cache = pdf_cache if blob_store is not None else None
+        self.max_workers = max(1, int(max_workers))
+        self.max_jobs = max(1, int(max_jobs))
+        self._jobs = OrderedDict()
+        # Render key -> id of the queued/running job for that paper
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+        self._executor = None
+
+    def _get_executor(self):
+        # Created on first submit so the pool is never inherited across a fork
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pdf-render")
+        return self._executor
+
+    def submit(self, subject, questions, include_answers=False):
+        """
+        Queue a PDF render.
+
+        Submitting a paper identical to one still being rendered returns that job's id
+        instead of rendering it twice.
+
+        Args:
+            subject (str): Subject name
+            questions (list): Questions to render
+            include_answers (bool): Whether to include answers in the PDF
+
+        Returns:
+            str: Job id for status polling
+        """
+        job_id = uuid.uuid4().hex
+        render_key = PDFCache.make_key(subject, questions, include_answers)
+        if self.pdf_cache is not None:
+            digest = self.pdf_cache.get(render_key)
+            if digest is not None:
+                # Identical paper already rendered: finish the job without queueing work
+                now = time.time()
+                with self._lock:
+                    self._jobs[job_id] = {
+                        'id': job_id,
+                        'status': DONE,
+                        'progress': 100,
+                        'subject': subject,
+                        'filename': f"{digest}.pdf",
+                        'error': None,
+                        'created': now,
+                        'finished': now
+                    }
+                    self._trim()
+                return job_id
+        
+        job = {
+            'id': job_id,
+            'status': QUEUED,
+            'progress': 0,
+            'subject': subject,
+            'filename': None,
+            'error': None,
+            'created': time.time(),
+            'finished': None
+        }
+        with self._lock:
+            running = self._in_flight.get(render_key)
+            if running is not None:
+                self.coalesced += 1
+                return running
+            self._in_flight[render_key] = job_id
+            self._jobs[job_id] = job
+            self._trim()
+            executor = self._get_executor()
+        executor.submit(self._run, job, subject, list(questions), include_answers, render_key)
+        return job_id
+
+    def _run(self, job, subject, questions, include_answers, render_key):
+        self._update(job, status=RUNNING, progress=10)
+        try:
+            if self.blob_store is not None:
+                with metrics.timer('pdf_render'):
+                    data = self.formatter.make_pdf_bytes(subject, questions, include_answers=include_answers)
+                digest = self.blob_store.put(data, pdf_filename(subject))
+                if self.pdf_cache is not None:
+                    self.pdf_cache.put(render_key, digest)
+                filename = f"{digest}.pdf"
+            else:
+                with metrics.timer('pdf_render'):
+                    filename = self.formatter.make_pdf(subject, questions, include_answers=include_answers)
+        except Exception as e:
+            print(f"Error creating PDF: {e}")
+            self._finish(job, render_key, status=FAILED, error=str(e), finished=time.time())
+            return
+        self._finish(job, render_key, status=DONE, progress=100, filename=filename, finished=time.time())
+
+    def _update(self, job, **fields):
+        with self._lock:
+            job.update(fields)
+
+    def _finish(self, job, render_key, **fields):
+        with self._lock:
+            job.update(fields)
+            if self._in_flight.get(render_key) == job['id']:
+                del self._in_flight[render_key]
+
+    def _trim(self):
+        # Drop the oldest finished jobs once over the limit; in-flight jobs are kept
+        if len(self._jobs) <= self.max_jobs:
+            return
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.max_jobs:
+                break
+            if self._jobs[job_id]['status'] in (DONE, FAILED):
+                del self._jobs[job_id]
+
+    def get(self, job_id):
+        """
+        Get a snapshot of a job.
+
+        Args:
+            job_id (str): Id returned by submit()
+
+        Returns:
+            dict: Copy of the job record, or None if unknown
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def stats(self):
+        """Count jobs by status, plus submits that joined an identical in-flight render."""
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self._jobs.values():
+                counts[job['status']] += 1
+            counts['coalesced'] = self.coalesced
+            return counts
+
+    def shutdown(self, wait=True):
+        """Stop accepting work and optionally wait for queued renders to finish."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
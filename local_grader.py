@@ -0,0 +1,229 @@
+"""
+Local answer grading
+Scores a student answer against a reference answer (from the question bank, a generated paper,
+or the request) by IDF-weighted key-term coverage and TF-IDF cosine similarity. Clear misses are
+graded locally; everything else needs the model (term overlap cannot tell "X is mutable" from
+"X is not mutable"), and the local score is only an estimate for when the model is unavailable.
+"""
+
+import math
+import re
+import threading
+from collections import Counter
+
+import similarity
+from parsing import format_evaluation
+
+# Similarity at or above which the local estimate scores an answer as correct (8-10); never final
+HIGH_CONFIDENCE = 0.7
+
+# Similarity at or below which an answer is graded locally as wrong (scores 1-3), without the model
+LOW_CONFIDENCE = 0.15
+
+# How closely the submitted question must match a known question to use its reference answer
+REFERENCE_MATCH_THRESHOLD = 0.8
+
+# Weight of key-term coverage against cosine similarity in the combined score
+COVERAGE_WEIGHT = 0.6
+
+_LEADING_NUMBER = re.compile(r'^\s*(?:Q\s*)?\d+[\.\):]\s*', re.IGNORECASE)
+# Common answer words that carry no key point (negations are kept: they flip the meaning)
+_FILLER = frozenset({
+    'they', 'them', 'their', 'there', 'these', 'those', 'could', 'would', 'should', 'will', 'may',
+    'has', 'have', 'had', 'from', 'as', 'at', 'than', 'then', 'also', 'into', 'such',
+    'more', 'most', 'only', 'other', 'all', 'each', 'so', 'some', 'because', 'if', 'but', 'i', 'we'
+})
+# "isn't" is read as "isn" + "t"
+_NEGATIONS = frozenset({'not', 'no', 'never', 'cannot', 'without', 'isn', 'aren', 'doesn', 'don'})
+_SUFFIXES = ('ations', 'ation', 'ically', 'ing', 'ed', 'er', 'ly', 'ic', 'e')
+
+
+def _stem(word):
+    # Enough folding for "typed"/"typing"/"type" or "dynamic"/"dynamically" to meet
+    for suffix in _SUFFIXES:
+        if len(word) - len(suffix) >= 3 and word.endswith(suffix):
+            return word[:-len(suffix)]
+    return word
+
+
+def terms(text):
+    """Stemmed content words of an answer, in order (repeats kept for term frequency)."""
+    return [_stem(w) for w in similarity.content_words(text) if w not in _FILLER]
+
+
+def same_question(a, b):
+    """Whether two question texts ask the same thing (a leading "1." or "Q1:" is ignored)."""
+    return similarity.jaccard(similarity.word_shingles(_LEADING_NUMBER.sub('', a)),
+                              similarity.word_shingles(_LEADING_NUMBER.sub('', b))) >= REFERENCE_MATCH_THRESHOLD
+
+
+def _negations(text):
+    return _NEGATIONS.intersection(similarity.content_words(text))
+
+
+class LocalGrader:
+    def __init__(self, high=HIGH_CONFIDENCE, low=LOW_CONFIDENCE):
+        """
+        Offline first-pass grader.
+
+        Term weights (IDF) come from the question bank's answers and are computed on first use;
+        a bank file's answers are counted once, when its index is built (see bank_file.py).
+
+        Args:
+            high (float): Combined similarity at or above which the local estimate is a pass
+            low (float): Combined similarity at or below which the local grade is final (fail)
+        """
+        if not 0 <= low < high <= 1:
+            raise ValueError("Expected 0 <= low < high <= 1")
+        self.high = high
+        self.low = low
+        self._idf = None
+        self._default_idf = 1.0
+        self._lock = threading.Lock()
+        self.graded = 0
+        self.confident = 0
+
+    def _weights(self):
+        if self._idf is None:
+            with self._lock:
+                if self._idf is None:
+                    # Imported here: the bank is only needed once, to count document frequencies
+                    from question_bank import get_bank
+
+                    bank = get_bank()
+                    documents = [set(terms(q.get('answer') or '')) for subject in bank.subjects()
+                                 if not bank.is_file_backed(subject) for q in bank.get(subject)]
+                    frequency = Counter(term for document in documents for term in document)
+                    file_terms, file_answers = bank.answer_terms()
+                    frequency.update(file_terms)
+                    total = len(documents) + file_answers + 1
+                    # Terms never seen in the bank are the most specific of all
+                    self._default_idf = math.log(total) + 1
+                    self._idf = {term: math.log(total / (count + 1)) + 1 for term, count in frequency.items()}
+        return self._idf
+
+    def prepare(self):
+        """Compute the term weights now (e.g. before a pre-fork server forks its workers)."""
+        self._weights()
+
+    def reference_answer(self, question, subject=None):
+        """
+        Find the reference answer for a question in the bank or in generated papers.
+
+        Args:
+            question (str): Question text (a leading "1." or "Q1:" is ignored)
+            subject (str): Subject of the question; needed to search a bank file subject that
+                has not been looked up yet
+
+        Returns:
+            str: Reference answer, or None if the question is not known
+        """
+        text = _LEADING_NUMBER.sub('', question)
+        match = similarity.get_index(subject).find(text, threshold=REFERENCE_MATCH_THRESHOLD,
+                                            where=lambda entry: bool(entry.get('answer')))
+        return match[1]['answer'] if match else None
+
+    def similarity(self, reference, answer):
+        """
+        Combined similarity of an answer to the reference answer.
+
+        Args:
+            reference (str): Reference answer
+            answer (str): Student's answer
+
+        Returns:
+            tuple: (similarity in [0, 1], reference terms missing from the answer, most important first)
+        """
+        idf = self._weights()
+        default = self._default_idf
+        # Feedback names missing terms as the reference spells them, not as stems
+        spelling = {}
+        for word in similarity.content_words(reference):
+            if word in _FILLER:
+                continue
+            spelling.setdefault(_stem(word), word)
+        reference_counts = Counter(terms(reference))
+        answer_counts = Counter(terms(answer))
+        if not reference_counts or not answer_counts:
+            return 0.0, [spelling[t] for t in sorted(reference_counts, key=lambda t: -idf.get(t, default))]
+
+        # Share of the reference's key terms (weighted by specificity) the answer mentions
+        total = sum(idf.get(t, default) for t in reference_counts)
+        covered = sum(idf.get(t, default) for t in reference_counts if t in answer_counts)
+        coverage = covered / total
+
+        # TF-IDF cosine: penalizes answers padded with unrelated text
+        dot = sum(count * answer_counts[t] * idf.get(t, default) ** 2
+                  for t, count in reference_counts.items() if t in answer_counts)
+        norm_reference = math.sqrt(sum((c * idf.get(t, default)) ** 2 for t, c in reference_counts.items()))
+        norm_answer = math.sqrt(sum((c * idf.get(t, default)) ** 2 for t, c in answer_counts.items()))
+        cosine = dot / (norm_reference * norm_answer)
+
+        missing = [spelling[t] for t in sorted((t for t in reference_counts if t not in answer_counts),
+                                               key=lambda t: -idf.get(t, default))]
+        return COVERAGE_WEIGHT * coverage + (1 - COVERAGE_WEIGHT) * cosine, missing
+
+    def grade(self, question, answer, reference=None, subject=None):
+        """
+        Grade an answer locally.
+
+        Args:
+            question (str): The exam question
+            answer (str): Student's answer
+            reference (str): Reference answer (default: looked up by question)
+            subject (str): Subject of the question (helps find its reference answer)
+
+        Returns:
+            dict: score, feedback, evaluation (in the "Score:/Feedback:" format), similarity and
+                confident (only clear misses are; False means the model should decide); None if there
+                is no reference answer
+        """
+        reference = reference or self.reference_answer(question, subject)
+        if not reference:
+            return None
+
+        value, missing = self.similarity(reference, answer)
+        negated = _negations(answer) != _negations(reference)
+        if negated and value > self.low:
+            # Same terms, opposite claim: at best a partial match until the model has looked
+            value = min(value, (self.low + self.high) / 2)
+        # Each band maps linearly onto its score range: fail 1-3, unsure 4-7, pass 8-10
+        if value >= self.high:
+            score = 8 + round(2 * (value - self.high) / (1 - self.high)) if self.high < 1 else 10
+            feedback = "Covers the key points of the reference answer."
+        elif value <= self.low:
+            score = 1 + round(2 * value / self.low) if self.low > 0 else 1
+            feedback = "Does not address the key points of the question."
+            if missing:
+                feedback += f" Expected to mention: {', '.join(missing[:3])}."
+        else:
+            score = 4 + round(3 * (value - self.low) / (self.high - self.low))
+            feedback = "Partly matches the reference answer."
+            if negated:
+                feedback += " Check the negation against the reference answer."
+            elif missing:
+                feedback += f" Missing: {', '.join(missing[:3])}."
+
+        # A close match may still be negated or reordered, so only a clear miss is final
+        confident = value <= self.low
+        with self._lock:
+            self.graded += 1
+            if confident:
+                self.confident += 1
+        return {
+            'score': score,
+            'feedback': feedback,
+            'evaluation': format_evaluation(score, feedback),
+            'similarity': round(value, 4),
+            'confident': confident
+        }
+
+    def stats(self):
+        """
+        Get grading counters.
+
+        Returns:
+            dict: graded (answers with a reference), confident (graded without the model) and thresholds
+        """
+        with self._lock:
+            return {'graded': self.graded, 'confident': self.confident, 'high': self.high, 'low': self.low}
@@ -0,0 +1,223 @@
+"""
+Prometheus-style metrics
+Counters and histograms kept in process, per-stage timers, and rendering in the Prometheus
+text exposition format for the /metrics endpoint (no client library needed)
+"""
+
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers in-process stages (ms) through slow Gemini calls (tens of seconds)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        """
+        Monotonic counter.
+
+        Args:
+            name (str): Metric name (conventionally ending in _total)
+            help_text (str): One-line description
+            labelnames (tuple): Label names every sample must provide
+        """
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            values = dict(self._values)
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(zip(self.labelnames, key))} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """
+        Distribution of observed values (cumulative buckets, sum and count).
+
+        Args:
+            name (str): Metric name (conventionally ending in _seconds)
+            help_text (str): One-line description
+            labelnames (tuple): Label names every observation must provide
+            buckets (tuple): Upper bounds, ascending
+        """
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a with-block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def collect(self):
+        with self._lock:
+            series = {k: (list(v[0]), v[1], v[2]) for k, v in self._series.items()}
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(series.items()):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', _format_value(float(bound)))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        """Metrics plus collectors that report other components' counters at scrape time."""
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        """
+        Add a scrape-time collector.
+
+        Args:
+            collector: Callable returning (name, type, help, samples) tuples, where type is
+                'counter' or 'gauge' and samples is a list of (labels dict, value)
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text format.
+
+        Returns:
+            str: Exposition text
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        for collector in collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    if value is None:
+                        continue
+                    lines.append(f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+# Shared by the whole process
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'exam_stage_seconds', 'Time spent in each processing stage', ('stage',))
+REQUEST_SECONDS = REGISTRY.histogram(
+    'exam_http_request_seconds', 'HTTP request latency by endpoint', ('endpoint', 'method'))
+REQUESTS = REGISTRY.counter(
+    'exam_http_requests_total', 'HTTP requests by endpoint and status code', ('endpoint', 'method', 'status'))
+FALLBACKS = REGISTRY.counter(
+    'exam_question_fallbacks_total',
+    'Question lists served without a (usable) model reply, by source (predefined and sampled come from the bank)',
+    ('source',))
+GRADES = REGISTRY.counter(
+    'exam_grades_total', 'Answers graded, by grader (local, local_estimate or model)', ('grader',))
+UPSTREAM_ERRORS = REGISTRY.counter(
+    'exam_upstream_errors_total', 'Failed Gemini calls by operation and error kind', ('operation', 'kind'))
+
+
+def timer(stage):
+    """
+    Time a with-block as one processing stage.
+
+    Stages: request_parse, component_init, llm_generate, llm_evaluate, output_parse,
+    pdf_render, pdf_serve (observed once the file has been sent, not with this timer).
+    """
+    return STAGE_SECONDS.time(stage=stage)
+
+
+def timed(stage):
+    """Decorator form of timer() for functions that are a stage on their own."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def render():
+    """Render the shared registry (see Registry.render())."""
+    return REGISTRY.render()
@@ -0,0 +1,375 @@
+"""
+Parsing of model output
+Precompiled, single-pass extraction of questions/answers and scores/feedback from Gemini
+replies, an optional validated JSON mode, and counters for output that did not parse cleanly
+"""
+
+import json
+import re
+import threading
+
+import metrics
+
+# "Q1: ...", "Question 2: ...", "**Q3.** ..." / the same with A/Answer
+_QA_LINE = re.compile(
+    r'^\**\s*(?:(?P<q>Q(?:uestion)?)|(?P<a>A(?:ns(?:wer)?)?))\s*(?:\d+\s*\**\s*[:.)]|\**\s*:)\s*\**\s*(?P<text>.*)$',
+    re.IGNORECASE
+)
+# "Score: 8" (optionally followed by the rest of its line, unless a "Feedback:" starts on it)
+# or the start of "Feedback: ..."
+_EVALUATION = re.compile(r'Score:\s*(?P<score>\d+)(?P<rest>(?:(?!Feedback:)[^\n])*\n)?|(?P<feedback>Feedback:\s*)',
+                         re.IGNORECASE)
+# Splits a batched evaluation reply into its "Item N:" blocks; the header either ends its line
+# or has a colon and is followed by the block's first line ("**Item 1:** Score: 8")
+ITEM_PATTERN = re.compile(r'^[ \t]*\**[ \t]*Item[ \t]+(\d+)[ \t]*(?:\**[ \t]*:[ \t]*\**|\**[ \t]*$)[ \t]*',
+                          re.IGNORECASE | re.MULTILINE)
+# Markdown code fence some models wrap JSON in
+_CODE_FENCE = re.compile(r'^\s*```(?:json)?\s*(.*?)\s*```\s*$', re.DOTALL | re.IGNORECASE)
+
+# Passed as generate_content(generation_config=...) in structured mode
+JSON_GENERATION_CONFIG = {'response_mime_type': 'application/json'}
+
+
+class ParseStats:
+    def __init__(self):
+        """Thread-safe counters of how model output was parsed."""
+        self._lock = threading.Lock()
+        self._counts = {
+            'questions_parsed': 0,
+            'placeholder_answers': 0,
+            'fallback_format': 0,
+            'unparsed_responses': 0,
+            'duplicates_dropped': 0,
+            'evaluations_parsed': 0,
+            'evaluations_unscored': 0,
+            'batch_items_missing': 0,
+            'json_invalid': 0
+        }
+
+    def increment(self, name, amount=1):
+        if amount:
+            with self._lock:
+                self._counts[name] = self._counts.get(name, 0) + amount
+
+    def stats(self):
+        """Snapshot of the counters."""
+        with self._lock:
+            return dict(self._counts)
+
+
+# Shared by every parser in the process (reported on /health)
+parse_stats = ParseStats()
+
+
+class QAStreamParser:
+    def __init__(self, include_answers=True):
+        """
+        Incremental, single-pass question parser.
+
+        Feed it model output as it arrives; it returns each question as soon as it is complete
+        (a Q/A pair is complete when the next question starts, or when the stream ends). Lines
+        that could be questions in a plain numbered list are collected in the same pass, so a
+        reply that ignored the Q/A format can still be used without re-scanning it.
+
+        Args:
+            include_answers (bool): Parse "Qn:/An:" pairs (True) or numbered questions only (False)
+        """
+        self.include_answers = include_answers
+        self.fallback = []
+        self.placeholders = 0
+        self._buffer = ''
+        self._question = None
+        self._answer = None
+
+    def feed(self, text):
+        """
+        Add a chunk of model output.
+
+        Args:
+            text (str): Next piece of the response
+
+        Returns:
+            list: Question dicts completed by this chunk
+        """
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split('\n')
+        completed = []
+        for line in lines:
+            item = self._parse_line(line)
+            if item is not None:
+                completed.append(item)
+        parse_stats.increment('questions_parsed', len(completed))
+        return completed
+
+    def close(self, placeholder=True):
+        """
+        Finish the stream.
+
+        Args:
+            placeholder (bool): Emit a trailing question that has no answer with a
+                placeholder answer (True) or drop it (False)
+
+        Returns:
+            list: Question dicts still pending at the end of the output
+        """
+        completed = []
+        if self._buffer:
+            item = self._parse_line(self._buffer)
+            if item is not None:
+                completed.append(item)
+            self._buffer = ''
+        if self._question:
+            if self._answer:
+                completed.append({'question': self._question, 'answer': self._answer})
+            elif placeholder:
+                completed.append({'question': self._question, 'answer': f"Answer for: {self._question}"})
+                self.placeholders += 1
+                parse_stats.increment('placeholder_answers')
+        self._question = None
+        self._answer = None
+        parse_stats.increment('questions_parsed', len(completed))
+        return completed
+
+    def _parse_line(self, line):
+        line = line.strip()
+        if not line:
+            return None
+
+        if not self.include_answers:
+            return {'question': line, 'answer': ''} if line[0].isdigit() else None
+
+        if line[0].isdigit() or line[0] in 'Qq':
+            self.fallback.append(line)
+
+        match = _QA_LINE.match(line)
+        completed = None
+        if match and match.group('q'):
+            # Previous pair is finished
+            if self._question and self._answer:
+                completed = {'question': self._question, 'answer': self._answer}
+            self._question = match.group('text').strip()
+            self._answer = None
+        elif match:
+            self._answer = match.group('text').strip()
+        # Lines without a marker continue whichever part is open
+        elif self._question and not self._answer:
+            self._question += " " + line
+        elif self._question and self._answer:
+            self._answer += " " + line
+        return completed
+
+
+def _load_json(text):
+    fenced = _CODE_FENCE.match(text)
+    return json.loads(fenced.group(1) if fenced else text)
+
+
+def parse_questions_json(text, include_answers=True):
+    """
+    Parse and validate a structured (JSON) question reply.
+
+    Accepts a list of {"question": ..., "answer": ...} objects, or an object holding that
+    list under "questions".
+
+    Args:
+        text (str): Model reply
+        include_answers (bool): Whether every item must carry a non-empty answer
+
+    Returns:
+        list: Question dicts
+
+    Raises:
+        ValueError: If the reply is not valid JSON of that shape
+    """
+    data = _load_json(text)
+    if isinstance(data, dict):
+        data = data.get('questions')
+    if not isinstance(data, list) or not data:
+        raise ValueError("expected a non-empty list of questions")
+
+    questions = []
+    for item in data:
+        if not isinstance(item, dict) or not isinstance(item.get('question'), str) or not item['question'].strip():
+            raise ValueError("every item needs a non-empty 'question' string")
+        answer = item.get('answer', '')
+        if not isinstance(answer, str) or (include_answers and not answer.strip()):
+            raise ValueError("every item needs a non-empty 'answer' string")
+        questions.append({'question': item['question'].strip(),
+                          'answer': answer.strip() if include_answers else ''})
+    return questions
+
+
+@metrics.timed('output_parse')
+def parse_questions(text, include_answers=True, structured=False, placeholder=True):
+    """
+    Parse a complete question reply.
+
+    Args:
+        text (str): Model reply
+        include_answers (bool): Parse Q/A pairs (True) or numbered questions only (False)
+        structured (bool): The reply was requested as JSON; the line format is only used
+            if it fails validation
+        placeholder (bool): Fill in missing answers with placeholders (True) or drop
+            questions that have no answer (False)
+
+    Returns:
+        tuple: (list of question dicts, number of answers filled in with placeholders)
+    """
+    if structured:
+        try:
+            questions = parse_questions_json(text, include_answers)
+            parse_stats.increment('questions_parsed', len(questions))
+            return questions, 0
+        except ValueError:
+            parse_stats.increment('json_invalid')
+
+    parser = QAStreamParser(include_answers)
+    questions = parser.feed(text) + parser.close(placeholder)
+    if questions or not include_answers or not placeholder:
+        return questions, parser.placeholders
+
+    # Not in Q/A format: use numbered/"Q" lines seen during the same pass
+    if parser.fallback:
+        parse_stats.increment('fallback_format')
+        parse_stats.increment('placeholder_answers', len(parser.fallback))
+    return [{'question': q, 'answer': f'Answer for question {i+1}'}
+            for i, q in enumerate(parser.fallback)], len(parser.fallback)
+
+
+@metrics.timed('output_parse')
+def parse_evaluation(evaluation_text):
+    """
+    Extract score and feedback from an evaluation in one pass.
+
+    Args:
+        evaluation_text (str): Evaluation text in "Score: <n>" / "Feedback: <text>" format
+
+    Returns:
+        tuple: (score as int or None, feedback str)
+
+    Examples (run with python -m doctest parsing.py):
+
+    >>> parse_evaluation("Score: 8\\nFeedback: Good answer.")
+    (8, 'Good answer.')
+    >>> parse_evaluation("Score: 8/10 Feedback: Good answer.\\n")
+    (8, 'Good answer.')
+    >>> parse_evaluation("Score: 7, Feedback: ok\\nMore detail.")
+    (7, 'ok\\nMore detail.')
+    >>> parse_evaluation("Score: 6/10\\nClear, but no example.")
+    (6, 'Clear, but no example.')
+    """
+    score = None
+    feedback = None
+    removed = []
+    for match in _EVALUATION.finditer(evaluation_text):
+        if match.group('feedback') is not None:
+            # Feedback runs to the end of the text
+            if feedback is None:
+                feedback = evaluation_text[match.end():].strip()
+            if score is not None:
+                break
+        elif score is None:
+            score = int(match.group('score'))
+            if feedback is not None:
+                break
+        if match.group('rest') is not None:
+            removed.append(match.span())
+
+    if score is None:
+        parse_stats.increment('evaluations_unscored')
+    else:
+        parse_stats.increment('evaluations_parsed')
+
+    if feedback is None:
+        feedback = evaluation_text
+        if score is not None:
+            # No feedback section: everything except the score line(s)
+            kept = []
+            start = 0
+            for begin, end in removed:
+                kept.append(evaluation_text[start:begin])
+                start = end
+            kept.append(evaluation_text[start:])
+            feedback = ''.join(kept).strip()
+    return score, feedback
+
+
+def parse_evaluation_json(text):
+    """
+    Parse and validate a structured (JSON) evaluation: {"score": 1-10, "feedback": "..."}.
+
+    Returns:
+        tuple: (score int, feedback str)
+
+    Raises:
+        ValueError: If the reply is not valid JSON of that shape
+    """
+    data = _load_json(text)
+    if not isinstance(data, dict):
+        raise ValueError("expected an object with 'score' and 'feedback'")
+    return _validate_evaluation(data)
+
+
+def _validate_evaluation(data):
+    score = data.get('score')
+    if isinstance(score, float) and score.is_integer():
+        score = int(score)
+    if isinstance(score, bool) or not isinstance(score, int) or not 0 <= score <= 10:
+        raise ValueError("'score' must be an integer from 0 to 10")
+    feedback = data.get('feedback')
+    if not isinstance(feedback, str):
+        raise ValueError("'feedback' must be a string")
+    return score, feedback.strip()
+
+
+def format_evaluation(score, feedback):
+    """Render a score and feedback in the line format parse_evaluation() reads."""
+    return f"Score: {score}\nFeedback: {feedback}"
+
+
+@metrics.timed('output_parse')
+def split_batch_evaluation(text, structured=False):
+    """
+    Split a batched evaluation reply into per-item evaluation texts.
+
+    Args:
+        text (str): Model reply containing "Item N:" headed blocks, or in structured mode
+            a JSON list of {"item": n, "score": ..., "feedback": ...}
+        structured (bool): The reply was requested as JSON; the line format is only used
+            if it fails validation
+
+    Returns:
+        dict: Item number (1-based) -> evaluation text for that item
+
+    >>> split_batch_evaluation("Item 1:\\nScore: 8\\nFeedback: Good.\\n\\n**Item 2:** Score: 5\\nFeedback: Vague.")
+    {1: 'Score: 8\\nFeedback: Good.', 2: 'Score: 5\\nFeedback: Vague.'}
+    """
+    if structured:
+        try:
+            return _split_batch_json(text)
+        except ValueError:
+            parse_stats.increment('json_invalid')
+
+    blocks = {}
+    matches = list(ITEM_PATTERN.finditer(text))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        blocks[int(match.group(1))] = text[match.end():end].strip()
+    return blocks
+
+
+def _split_batch_json(text):
+    data = _load_json(text)
+    if isinstance(data, dict):
+        data = data.get('items')
+    if not isinstance(data, list):
+        raise ValueError("expected a list of evaluations")
+    blocks = {}
+    for position, item in enumerate(data, 1):
+        if not isinstance(item, dict):
+            raise ValueError("every evaluation must be an object")
+        number = item.get('item', position)
+        if isinstance(number, bool) or not isinstance(number, int):
+            raise ValueError("'item' must be an integer")
+        blocks[number] = format_evaluation(*_validate_evaluation(item))
+    return blocks
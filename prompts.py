@@ -0,0 +1,226 @@
+"""
+Prompt building and token budgeting
+Compact prompts for question generation and answer evaluation, local token estimates,
+truncation of oversize inputs, output-token limits scaled to the work asked for, and
+per-operation token counters
+"""
+
+import os
+import threading
+
+from parsing import JSON_GENERATION_CONFIG
+
+# Rough size of a Gemini token in English text (used when the API reports no usage)
+CHARS_PER_TOKEN = 4
+
+# Inputs longer than this (estimated tokens) are cut down before they are sent
+MAX_SUBJECT_TOKENS = int(os.getenv("MAX_SUBJECT_TOKENS", "32"))
+MAX_QUESTION_TOKENS = int(os.getenv("MAX_QUESTION_TOKENS", "300"))
+MAX_ANSWER_TOKENS = int(os.getenv("MAX_ANSWER_TOKENS", "1000"))
+
+# Output budget per generated question/answer, per evaluation, and for the rest of a reply
+QUESTION_OUTPUT_TOKENS = 48
+ANSWER_OUTPUT_TOKENS = 96
+EVALUATION_OUTPUT_TOKENS = 64
+JSON_ITEM_TOKENS = 16
+OUTPUT_BASE_TOKENS = 64
+MAX_OUTPUT_TOKENS = 8192
+
+# Answers are asked to stay under this many words so the output budget holds them
+ANSWER_WORDS = 50
+
+# Print one line per model call with its token counts
+LOG_TOKENS = os.getenv("LOG_TOKENS", "").lower() in ('1', 'true', 'yes')
+
+TRUNCATION_MARK = " [...] "
+
+
+def estimate_tokens(text):
+    """Estimated token count of text (about four characters per token, at least one per word)."""
+    if not text:
+        return 0
+    return max(-(-len(text) // CHARS_PER_TOKEN), len(text.split()))
+
+
+def truncate(text, max_tokens, field='text'):
+    """
+    Shorten text to about max_tokens, keeping its start and end.
+
+    The beginning (two thirds of the budget) and the end (the rest) are kept, cut at word
+    boundaries and joined by " [...] ", so the conclusion of a long answer is still graded.
+
+    Args:
+        text (str): Input text
+        max_tokens (int): Token budget
+        field (str): Name counted in token_stats when text is cut
+
+    Returns:
+        str: text unchanged if it fits, otherwise the shortened text
+    """
+    text = text or ''
+    if max_tokens <= 0 or estimate_tokens(text) <= max_tokens:
+        return text
+    budget = max_tokens * CHARS_PER_TOKEN - len(TRUNCATION_MARK)
+    head = text[:budget * 2 // 3]
+    tail = text[len(text) - budget // 3:]
+    # Drop the partial words at the cut points
+    if ' ' in head:
+        head = head[:head.rfind(' ')]
+    if ' ' in tail:
+        tail = tail[tail.find(' ') + 1:]
+    token_stats.truncated(field)
+    return head.rstrip() + TRUNCATION_MARK + tail.lstrip()
+
+
+def generation_config(max_output_tokens, structured=False):
+    """
+    generate_content(generation_config=...) for a call.
+
+    Args:
+        max_output_tokens (int): Output limit
+        structured (bool): Also request a JSON reply
+
+    Returns:
+        dict: Generation config
+    """
+    config = dict(JSON_GENERATION_CONFIG) if structured else {}
+    config['max_output_tokens'] = min(MAX_OUTPUT_TOKENS, int(max_output_tokens))
+    return config
+
+
+def question_output_tokens(count, include_answers, structured=False):
+    """Output limit for a reply with count questions (and answers)."""
+    per_item = QUESTION_OUTPUT_TOKENS + (ANSWER_OUTPUT_TOKENS if include_answers else 0)
+    if structured:
+        per_item += JSON_ITEM_TOKENS
+    return OUTPUT_BASE_TOKENS + count * per_item
+
+
+def evaluation_output_tokens(count=1, structured=False):
+    """Output limit for a reply grading count answers."""
+    per_item = EVALUATION_OUTPUT_TOKENS + (JSON_ITEM_TOKENS if structured else 0)
+    return OUTPUT_BASE_TOKENS + count * per_item
+
+
+def question_prompt(subject, count, include_answers, focus=None, structured=False):
+    """
+    Prompt asking for count exam questions.
+
+    Returns:
+        tuple: (prompt, generation config with the output limit)
+    """
+    subject = truncate(subject, MAX_SUBJECT_TOKENS, 'subject')
+    lines = []
+    if structured:
+        fields = '{"question": "<question>", "answer": "<answer>"}' if include_answers else '{"question": "<question>"}'
+        lines.append(f"Generate {count} exam questions{' with answers' if include_answers else ''} for the subject: {subject}.")
+        lines.append("Mix easy, medium and hard questions.")
+        lines.append(f"Respond with JSON only: a list of {count} objects of the form {fields}")
+    elif include_answers:
+        lines.append(f"Generate {count} exam questions with answers for the subject: {subject}.")
+        lines.append("Mix easy, medium and hard questions.")
+        lines.append("Format:\nQ1: <question>\nA1: <answer>\nQ2: <question>\nA2: <answer>\netc.")
+    else:
+        lines.append(f"Generate {count} simple exam questions for the subject: {subject}.")
+        lines.append("Mix easy, medium and hard questions.")
+        lines.append("Format, one per line:\n1. <question>\n2. <question>\netc.")
+    if include_answers:
+        lines.append(f"Keep each answer clear, concise and under {ANSWER_WORDS} words.")
+    if focus:
+        lines.append(f"Focus on {focus}.")
+    config = generation_config(question_output_tokens(count, include_answers, structured), structured)
+    return '\n'.join(lines), config
+
+
+def evaluation_prompt(question, answer, structured=False):
+    """
+    Prompt asking for a score and short feedback on one answer.
+
+    Returns:
+        tuple: (prompt, generation config with the output limit)
+    """
+    if structured:
+        output_format = 'Respond with JSON only:\n{"score": <number>, "feedback": "<short text>"}'
+    else:
+        output_format = "Format:\nScore: <number>\nFeedback: <short text>"
+    prompt = (f"Question: {truncate(question, MAX_QUESTION_TOKENS, 'question')}\n"
+              f"Student Answer: {truncate(answer, MAX_ANSWER_TOKENS, 'answer')}\n\n"
+              f"Give a score from 1 to 10 and very short feedback.\n{output_format}")
+    return prompt, generation_config(evaluation_output_tokens(1, structured), structured)
+
+
+def batch_evaluation_prompt(pairs, structured=False):
+    """
+    Prompt grading several (question, answer) pairs as numbered items.
+
+    Returns:
+        tuple: (prompt, generation config with the output limit)
+    """
+    items = "\n\n".join(
+        f"Item {i}:\nQuestion: {truncate(question, MAX_QUESTION_TOKENS, 'question')}\n"
+        f"Student Answer: {truncate(answer, MAX_ANSWER_TOKENS, 'answer')}"
+        for i, (question, answer) in enumerate(pairs, 1)
+    )
+    if structured:
+        output_format = ("Respond with JSON only, one object per item with the same item numbers:\n"
+                         '[{"item": <n>, "score": <number>, "feedback": "<short text>"}, ...]')
+    else:
+        output_format = ("Format (one block per item, same item numbers):\n"
+                         "Item <n>:\nScore: <number>\nFeedback: <short text>")
+    prompt = (f"Evaluate each student answer below.\n"
+              f"For every item give a score from 1 to 10 and very short feedback.\n\n"
+              f"{items}\n\n{output_format}")
+    return prompt, generation_config(evaluation_output_tokens(len(pairs), structured), structured)
+
+
+class TokenStats:
+    def __init__(self):
+        """Thread-safe token counters per operation, plus inputs truncated per field."""
+        self._lock = threading.Lock()
+        self._operations = {}
+        self._truncated = {}
+
+    def record(self, operation, prompt, output_text='', usage=None):
+        """
+        Count the tokens of one model call (and print them when LOG_TOKENS is set).
+
+        Args:
+            operation (str): 'generate' or 'evaluate'
+            prompt (str): Prompt sent
+            output_text (str): Reply text (used when usage is missing)
+            usage: Response usage_metadata (prompt_token_count, candidates_token_count), if any
+        """
+        prompt_tokens = getattr(usage, 'prompt_token_count', None)
+        output_tokens = getattr(usage, 'candidates_token_count', None)
+        estimated = prompt_tokens is None or output_tokens is None
+        if prompt_tokens is None:
+            prompt_tokens = estimate_tokens(prompt)
+        if output_tokens is None:
+            output_tokens = estimate_tokens(output_text)
+        with self._lock:
+            counts = self._operations.setdefault(operation, {'calls': 0, 'prompt_tokens': 0, 'output_tokens': 0})
+            counts['calls'] += 1
+            counts['prompt_tokens'] += prompt_tokens
+            counts['output_tokens'] += output_tokens
+        if LOG_TOKENS:
+            print(f"Tokens ({operation}): prompt={prompt_tokens} output={output_tokens}"
+                  f"{' (estimated)' if estimated else ''}")
+
+    def truncated(self, field):
+        with self._lock:
+            self._truncated[field] = self._truncated.get(field, 0) + 1
+
+    def stats(self):
+        """
+        Snapshot of the counters.
+
+        Returns:
+            dict: operations (operation -> calls, prompt_tokens, output_tokens) and truncated (field -> count)
+        """
+        with self._lock:
+            return {'operations': {operation: dict(counts) for operation, counts in self._operations.items()},
+                    'truncated': dict(self._truncated)}
+
+
+# Shared by every model client in the process (reported on /health and /metrics)
+token_stats = TokenStats()
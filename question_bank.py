@@ -0,0 +1,258 @@
+"""
+Indexed question bank
+Subject, alias, topic and difficulty indexes built once on first use, with normalized
+alias resolution so "machine-learning" or "Python 3" find the predefined questions
+"""
+
+import os
+import re
+import threading
+
+from predefined_questions import PREDEFINED_QUESTIONS, SUBJECT_ALIASES
+from bank_file import BankFile, LazyQuestions
+from similarity import SimilarityIndex, char_shingles
+
+DIFFICULTIES = ('easy', 'medium', 'hard')
+
+# Words that do not change which subject is meant ("Python Programming" -> "python")
+_FILLER_WORDS = frozenset({
+    'programming', 'language', 'lang', 'basics', 'basic', 'fundamentals', 'intro',
+    'introduction', 'to', 'of', 'the', 'and', 'course', 'exam', 'questions', 'systems', 'system'
+})
+# Unknown names at least this similar (character bigram Jaccard) to a known alias resolve to it,
+# e.g. "Pythn" or "Databse"; shorter names than FUZZY_MIN_LENGTH are never guessed
+FUZZY_SUBJECT_THRESHOLD = 0.6
+FUZZY_MIN_LENGTH = 4
+
+_NON_ALNUM = re.compile(r'[^a-z0-9+#]+')
+_VERSION = re.compile(r'^v?\d+(\.\d+)*$')
+
+
+def normalize_subject(name):
+    """
+    Reduce a subject name to its lookup form.
+
+    Lowercases, turns punctuation into spaces, and drops version numbers and
+    filler words, e.g. "Python 3" -> "python", "Machine-Learning" -> "machine learning".
+
+    Args:
+        name (str): Subject name as typed by the user
+
+    Returns:
+        str: Normalized subject key
+    """
+    words = _NON_ALNUM.sub(' ', name.lower()).split()
+    kept = [w for w in words if w not in _FILLER_WORDS and not _VERSION.match(w)]
+    # Keep the original words if everything was filtered ("Systems" alone is still a subject)
+    return ' '.join(kept or words)
+
+
+class QuestionBank:
+    def __init__(self, subjects, aliases=None):
+        """
+        Build the bank indexes.
+
+        Args:
+            subjects (dict): Subject name -> list of question dicts. Each dict has 'question'
+                and 'answer', and optionally 'topic' and 'difficulty' (default 'medium').
+            aliases (dict): Extra alias -> subject name mappings
+        """
+        self._questions = {}
+        self._by_difficulty = {}
+        self._by_topic = {}
+        self._aliases = {}
+        self._fuzzy = None
+        # Grading-term document frequencies of bank file answers (see add_answer_terms())
+        self._file_terms = {}
+        self._file_answers = 0
+
+        for subject, questions in subjects.items():
+            self.add_subject(subject, questions)
+        for alias, subject in (aliases or {}).items():
+            self.add_alias(alias, subject)
+
+    def add_subject(self, subject, questions):
+        """
+        Index a subject's questions (replaces any existing entry for that subject).
+
+        Args:
+            subject (str): Canonical subject name
+            questions (list): Question dicts
+        """
+        questions = tuple(questions)
+        by_difficulty = {}
+        by_topic = {}
+        for q in questions:
+            by_difficulty.setdefault(q.get('difficulty', 'medium'), []).append(q)
+            by_topic.setdefault(q.get('topic', subject), []).append(q)
+
+        self.add_indexed_subject(
+            subject,
+            questions,
+            {k: tuple(v) for k, v in by_difficulty.items()},
+            {k: tuple(v) for k, v in by_topic.items()}
+        )
+
+    def add_indexed_subject(self, subject, questions, by_difficulty, by_topic):
+        """
+        Register a subject whose indexes are already built (e.g. from a bank file's offset index).
+
+        Args:
+            subject (str): Canonical subject name
+            questions (sequence): All questions, supporting len() and slicing
+            by_difficulty (dict): Difficulty -> sequence of questions
+            by_topic (dict): Topic -> sequence of questions
+        """
+        self._questions[subject] = questions
+        self._by_difficulty[subject] = by_difficulty
+        self._by_topic[subject] = by_topic
+        self.add_alias(subject, subject)
+
+    def add_answer_terms(self, counts, answers):
+        """
+        Add precomputed grading-term counts for file-backed subjects' answers.
+
+        Args:
+            counts (dict): Term -> number of answers containing it
+            answers (int): Number of answers counted
+        """
+        for term, count in counts.items():
+            self._file_terms[term] = self._file_terms.get(term, 0) + count
+        self._file_answers += answers
+
+    def answer_terms(self):
+        """
+        Grading-term counts of the file-backed subjects' answers.
+
+        Returns:
+            tuple: (term -> number of answers containing it, number of answers)
+        """
+        return self._file_terms, self._file_answers
+
+    def add_alias(self, alias, subject):
+        """Map an alternative name onto a subject (both spaced and compact forms)."""
+        key = normalize_subject(alias)
+        self._aliases[key] = subject
+        self._aliases.setdefault(key.replace(' ', ''), subject)
+        self._fuzzy = None
+
+    def resolve_subject(self, name):
+        """
+        Find the canonical subject for a user-supplied name.
+
+        Exact aliases are tried first, then the closest alias by spelling (see FUZZY_SUBJECT_THRESHOLD).
+
+        Args:
+            name (str): Subject name, alias or variant spelling
+
+        Returns:
+            str: Canonical subject name, or None if the bank has no such subject
+        """
+        if name in self._questions:
+            return name
+        key = normalize_subject(name)
+        subject = self._aliases.get(key) or self._aliases.get(key.replace(' ', ''))
+        if subject is None and len(key) >= FUZZY_MIN_LENGTH:
+            subject = self._fuzzy_match(key)
+        return subject
+
+    def _fuzzy_match(self, key):
+        index = self._fuzzy
+        if index is None:
+            # Rebuilt after aliases change; a handful of names, so every one is scored
+            index = SimilarityIndex(FUZZY_SUBJECT_THRESHOLD, shingle=char_shingles)
+            aliases = list(self._aliases.items())
+            index.add_many([alias for alias, _ in aliases], [subject for _, subject in aliases])
+            self._fuzzy = index
+        match = index.find(key, exhaustive=True)
+        return match[1] if match else None
+
+    def get(self, subject, count=None, difficulty=None, topic=None):
+        """
+        Get questions for a subject.
+
+        Args:
+            subject (str): Subject name or alias
+            count (int): Maximum number of questions (None = all)
+            difficulty (str): Only questions tagged with this difficulty
+            topic (str): Only questions tagged with this topic
+
+        Returns:
+            list: Question dicts in bank order (empty if the subject is unknown)
+        """
+        name = self.resolve_subject(subject)
+        if name is None:
+            return []
+        if difficulty is not None and topic is not None:
+            questions = [q for q in self._by_difficulty[name].get(difficulty, ())
+                         if q.get('topic', name) == topic]
+        elif difficulty is not None:
+            questions = self._by_difficulty[name].get(difficulty, ())
+        elif topic is not None:
+            questions = self._by_topic[name].get(topic, ())
+        else:
+            questions = self._questions[name]
+        return list(questions[:count] if count is not None else questions)
+
+    def questions_by_difficulty(self, subject, difficulty):
+        """
+        Get the indexed sequence of a subject's questions at one difficulty without copying it.
+
+        Args:
+            subject (str): Subject name or alias
+            difficulty (str): Difficulty tag
+
+        Returns:
+            sequence: Questions supporting len() and indexing (empty if none)
+        """
+        name = self.resolve_subject(subject)
+        return self._by_difficulty[name].get(difficulty, ()) if name else ()
+
+    def subjects(self):
+        """List canonical subject names."""
+        return list(self._questions)
+
+    def is_file_backed(self, subject):
+        """Whether a subject's questions come from a bank file (parsed only when read)."""
+        name = self.resolve_subject(subject)
+        return name is not None and isinstance(self._questions[name], LazyQuestions)
+
+    def topics(self, subject):
+        """List the topics tagged for a subject (empty if unknown)."""
+        name = self.resolve_subject(subject)
+        return list(self._by_topic[name]) if name else []
+
+    def difficulty_counts(self, subject):
+        """Number of questions per difficulty for a subject (empty if unknown)."""
+        name = self.resolve_subject(subject)
+        return {k: len(v) for k, v in self._by_difficulty[name].items()} if name else {}
+
+    def __contains__(self, subject):
+        return self.resolve_subject(subject) is not None
+
+
+_bank = None
+_bank_lock = threading.Lock()
+
+
+def get_bank():
+    """
+    Get the shared bank, building its indexes on first use.
+
+    The predefined questions are always included. If QUESTION_BANK_PATH points to a JSONL
+    bank file, its subjects are added (and override predefined subjects of the same name);
+    its questions are memory-mapped and only parsed when requested.
+    """
+    global _bank
+    if _bank is None:
+        with _bank_lock:
+            if _bank is None:
+                bank = QuestionBank(PREDEFINED_QUESTIONS, SUBJECT_ALIASES)
+                path = os.getenv('QUESTION_BANK_PATH')
+                if path:
+                    try:
+                        BankFile(path).load_into(bank)
+                    except (OSError, ValueError) as e:
+                        print(f"Error loading question bank {path}: {e}")
+                _bank = bank
+    return _bank
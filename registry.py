@@ -0,0 +1,121 @@
+"""
+Component registry for the API server
+Builds QuestionGenerator and Evaluator once per API key and shares them between request threads
+"""
+
+import threading
+from collections import OrderedDict
+
+from generator import QuestionGenerator
+from evaluator import Evaluator
+
+
+class ComponentRegistry:
+    def __init__(self, max_size=32, pinned_keys=None, generation_cache=None,
+                 evaluation_cache=None, structured_output=False):
+        """
+        Initialize an empty registry.
+
+        Args:
+            max_size (int): Maximum number of per-header API keys kept alive at once
+            pinned_keys (iterable): Keys that are never evicted (e.g. the GOOGLE_API_KEY
+                from the environment). The "no key" entry is always pinned.
+            generation_cache (GenerationCache): Cache shared by every generator built here
+            evaluation_cache (EvaluationCache): Cache shared by every evaluator built here
+            structured_output (bool): Build generators/evaluators that request JSON output
+        """
+        self.max_size = max(1, int(max_size))
+        self.generation_cache = generation_cache
+        self.evaluation_cache = evaluation_cache
+        self.structured_output = structured_output
+        self._pinned_keys = set(pinned_keys or ())
+        self._pinned_keys.add(None)
+        self._pinned = {}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, api_key=None):
+        """
+        Get the (generator, evaluator) pair for an API key, building it on first use.
+
+        Args:
+            api_key (str): Google Generative AI API key, or None for predefined-only mode
+
+        Returns:
+            tuple: (QuestionGenerator, Evaluator or None)
+        """
+        api_key = api_key or None
+        components = self._lookup(api_key)
+        if components is not None:
+            return components
+
+        # Serialize construction so concurrent first requests for a key build it once
+        with self._build_lock:
+            components = self._lookup(api_key, count=False)
+            if components is not None:
+                return components
+            components = self._build(api_key)
+            self._store(api_key, components)
+            return components
+
+    def _lookup(self, api_key, count=True):
+        with self._lock:
+            if api_key in self._pinned_keys:
+                components = self._pinned.get(api_key)
+            else:
+                components = self._entries.get(api_key)
+                if components is not None:
+                    self._entries.move_to_end(api_key)
+            if count:
+                if components is not None:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            return components
+
+    def _store(self, api_key, components):
+        with self._lock:
+            if api_key in self._pinned_keys:
+                self._pinned[api_key] = components
+                return
+            self._entries[api_key] = components
+            self._entries.move_to_end(api_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _build(self, api_key):
+        # Use predefined questions if no API key (for Java, Python, ML, Database)
+        generator = QuestionGenerator(api_key=api_key, use_predefined=not api_key,
+                                      cache=self.generation_cache, structured=self.structured_output)
+
+        # Only initialize evaluator if we have API key
+        evaluator = Evaluator(api_key=api_key, cache=self.evaluation_cache,
+                              structured=self.structured_output) if api_key else None
+        return generator, evaluator
+
+    def clear(self):
+        """Drop every cached component (counters are kept)."""
+        with self._lock:
+            self._pinned.clear()
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Get registry counters.
+
+        Returns:
+            dict: size, max_size, hits, misses and evictions
+        """
+        with self._lock:
+            return {
+                'size': len(self._entries) + len(self._pinned),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,362 @@
+"""
+Upstream protection for Gemini calls
+Per-API-key token-bucket rate limiting, jittered exponential retries for transient errors,
+and a circuit breaker that fails fast while the upstream is unhealthy
+"""
+
+import asyncio
+import hashlib
+import random
+import threading
+import time
+from collections import OrderedDict
+
+# Optional import - used to recognise quota/availability errors by type
+try:
+    from google.api_core import exceptions as google_exceptions
+    TRANSIENT_ERRORS = (
+        google_exceptions.ResourceExhausted,
+        google_exceptions.TooManyRequests,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.InternalServerError,
+        google_exceptions.DeadlineExceeded,
+    )
+except ImportError:
+    TRANSIENT_ERRORS = ()
+
+# HTTP status codes worth retrying
+TRANSIENT_CODES = frozenset({429, 500, 502, 503, 504})
+
+# Defaults used for every key unless overridden (see configure())
+RATE_LIMIT = 5.0
+RATE_BURST = 10
+MAX_RETRIES = 2
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30.0
+# Guards kept for distinct API keys (least recently used dropped first)
+MAX_KEYS = 256
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the model while the circuit is open."""
+
+
+class RateLimitedError(Exception):
+    """Raised when a call would have to wait longer than its deadline for a rate-limit token."""
+
+
+def configure(rate=None, burst=None, max_retries=None, base_delay=None, max_delay=None,
+              failure_threshold=None, reset_timeout=None, max_keys=None):
+    """
+    Set the limits applied to model calls. Existing per-key state is reset.
+
+    Args:
+        rate (float): Calls per second allowed per API key (0 = unlimited)
+        burst (int): Calls a key may make back-to-back before the rate applies
+        max_retries (int): Retries after a transient error
+        base_delay (float): First retry delay in seconds (doubles each retry, with full jitter)
+        max_delay (float): Cap on a single retry delay
+        failure_threshold (int): Consecutive failures that open the circuit
+        reset_timeout (float): Seconds the circuit stays open before a trial call
+        max_keys (int): Distinct API keys tracked before the least recently used is forgotten
+    """
+    global RATE_LIMIT, RATE_BURST, MAX_RETRIES, RETRY_BASE_DELAY, RETRY_MAX_DELAY
+    global FAILURE_THRESHOLD, RESET_TIMEOUT, MAX_KEYS
+    if rate is not None:
+        RATE_LIMIT = max(0.0, float(rate))
+    if burst is not None:
+        RATE_BURST = max(1, int(burst))
+    if max_retries is not None:
+        MAX_RETRIES = max(0, int(max_retries))
+    if base_delay is not None:
+        RETRY_BASE_DELAY = max(0.0, float(base_delay))
+    if max_delay is not None:
+        RETRY_MAX_DELAY = max(0.0, float(max_delay))
+    if failure_threshold is not None:
+        FAILURE_THRESHOLD = max(1, int(failure_threshold))
+    if reset_timeout is not None:
+        RESET_TIMEOUT = max(0.0, float(reset_timeout))
+    if max_keys is not None:
+        MAX_KEYS = max(1, int(max_keys))
+    with _guards_lock:
+        _guards.clear()
+
+
+def is_transient(error):
+    """
+    Decide whether an error is worth retrying (quota, overload, server errors).
+
+    Args:
+        error (Exception): Error raised by the model call
+
+    Returns:
+        bool: True for rate-limit and availability errors
+    """
+    if TRANSIENT_ERRORS and isinstance(error, TRANSIENT_ERRORS):
+        return True
+    code = getattr(error, 'code', None)
+    if isinstance(code, int) and code in TRANSIENT_CODES:
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in ('429', 'quota', 'rate limit', '503', 'unavailable', 'overloaded'))
+
+
+def retry_delay(attempt):
+    """Full-jitter exponential backoff delay for a retry attempt (0-based)."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        """
+        Token bucket refilled continuously at `rate` tokens per second.
+
+        Args:
+            rate (float): Tokens added per second (0 = unlimited)
+            capacity (int): Maximum tokens held (the burst size)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.throttled = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, max_wait=None):
+        """
+        Take a token, waiting for one if the bucket is empty.
+
+        Args:
+            max_wait (float): Longest acceptable wait in seconds (None = no limit)
+
+        Raises:
+            RateLimitedError: If the wait would exceed max_wait
+        """
+        if not self.rate:
+            return
+        self._refill()
+        # Reserve the token now so concurrent callers queue behind each other
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return
+        wait = -self.tokens / self.rate
+        if max_wait is not None and wait > max_wait:
+            self.tokens += 1
+            self.throttled += 1
+            raise RateLimitedError(f"rate limit: next slot in {wait:.1f}s")
+        self.throttled += 1
+        await asyncio.sleep(wait)
+
+    def available(self):
+        """Tokens available right now (None if unlimited)."""
+        if not self.rate:
+            return None
+        elapsed = time.monotonic() - self.updated
+        return max(0.0, min(self.capacity, self.tokens + elapsed * self.rate))
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold, reset_timeout):
+        """
+        Closed -> open after `failure_threshold` consecutive failures; open -> half-open after
+        `reset_timeout` seconds, when one trial call decides whether to close again.
+
+        Args:
+            failure_threshold (int): Consecutive failures that open the circuit
+            reset_timeout (float): Seconds to stay open before allowing a trial call
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.rejected = 0
+        self._trial_running = False
+
+    def allow(self):
+        """Whether a call may go to the upstream now."""
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self._trial_running:
+                self.rejected += 1
+                return False
+            self._trial_running = True
+        return True
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_running = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """End a trial call that neither succeeded nor failed upstream (e.g. a bad request)."""
+        self._trial_running = False
+
+
+class KeyGuard:
+    def __init__(self):
+        """Rate limiter, circuit breaker and counters for one API key."""
+        self.bucket = TokenBucket(RATE_LIMIT, RATE_BURST)
+        self.breaker = CircuitBreaker(FAILURE_THRESHOLD, RESET_TIMEOUT)
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+
+    async def call(self, make_call, timeout=None):
+        """
+        Run a model call under the rate limit, retrying transient errors with backoff.
+
+        The timeout is one deadline for the whole call: rate-limit waits, every attempt and
+        the backoff between them all come out of it.
+
+        Args:
+            make_call: Coroutine function performing one attempt; called with the seconds left
+                before the deadline (None = no deadline)
+            timeout (float): Overall deadline in seconds (None = no deadline)
+
+        Returns:
+            The call's result
+
+        Raises:
+            CircuitOpenError: If the circuit is open (no call is made)
+            RateLimitedError: If no token is available in time
+            asyncio.TimeoutError: If the deadline passes
+            Exception: The last error once retries are exhausted or for non-transient errors
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+
+        def remaining():
+            return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError("upstream unavailable; circuit open")
+            try:
+                await self.bucket.acquire(max_wait=remaining())
+            except RateLimitedError:
+                self.breaker.release()
+                raise
+            left = remaining()
+            if left == 0:
+                self.breaker.release()
+                raise asyncio.TimeoutError()
+            self.calls += 1
+            try:
+                result = await make_call(left)
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except asyncio.TimeoutError:
+                # The deadline is spent; count it against the upstream but do not retry
+                self.failures += 1
+                self.breaker.record_failure()
+                raise
+            except Exception as e:
+                if not is_transient(e):
+                    self.breaker.release()
+                    raise
+                self.failures += 1
+                self.breaker.record_failure()
+                delay = retry_delay(attempt)
+                left = remaining()
+                # No retry that could not even start before the deadline
+                if attempt >= MAX_RETRIES or self.breaker.state == OPEN or (left is not None and delay >= left):
+                    raise
+                self.retries += 1
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+    def stats(self):
+        available = self.bucket.available()
+        return {
+            'state': self.breaker.state,
+            'consecutive_failures': self.breaker.failures,
+            'rejected': self.breaker.rejected,
+            'calls': self.calls,
+            'retries': self.retries,
+            'failures': self.failures,
+            'throttled': self.bucket.throttled,
+            'tokens': round(available, 2) if available is not None else None
+        }
+
+
+_guards = OrderedDict()
+_guards_lock = threading.Lock()
+
+
+def key_id(api_key):
+    """Short, non-reversible label for an API key (safe to show on /health)."""
+    if not api_key:
+        return 'default'
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:8]
+
+
+def get_guard(api_key=None):
+    """
+    Get the shared guard for an API key, creating it on first use.
+
+    At most MAX_KEYS guards are kept; the least recently used key's state is dropped (arbitrary
+    X-API-Key headers must not grow memory or the /health and /metrics output without bound).
+
+    Args:
+        api_key (str): Key the calls are billed to (None = the process default key)
+
+    Returns:
+        KeyGuard: Guard for that key
+    """
+    label = key_id(api_key)
+    with _guards_lock:
+        guard = _guards.get(label)
+        if guard is None:
+            guard = _guards[label] = KeyGuard()
+            while len(_guards) > MAX_KEYS:
+                _guards.popitem(last=False)
+        else:
+            _guards.move_to_end(label)
+        return guard
+
+
+def stats():
+    """
+    Get limiter and breaker state for every key seen so far.
+
+    Returns:
+        dict: Settings plus per-key state (keys are shown as short hashes)
+    """
+    with _guards_lock:
+        guards = dict(_guards)
+    return {
+        'rate_limit': RATE_LIMIT,
+        'burst': RATE_BURST,
+        'max_retries': MAX_RETRIES,
+        'failure_threshold': FAILURE_THRESHOLD,
+        'reset_timeout': RESET_TIMEOUT,
+        'max_keys': MAX_KEYS,
+        'keys': {label: guard.stats() for label, guard in guards.items()}
+    }
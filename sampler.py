@@ -0,0 +1,182 @@
+"""
+Randomized exam sampling from the question bank
+Weighted selection by difficulty mix, reproducible per-student seeds, and exclusion of
+questions a student has already seen - no model calls involved
+"""
+
+import hashlib
+import random
+
+from question_bank import DIFFICULTIES, get_bank
+
+# Same "easy, medium, and hard mixed" balance the generator prompt asks for
+DEFAULT_MIX = {'easy': 1, 'medium': 1, 'hard': 1}
+
+
+def student_seed(subject, student_id, exam_seed=None):
+    """
+    Derive a stable seed so a student's paper can be reproduced.
+
+    Args:
+        subject (str): Subject name
+        student_id (str): Student identifier
+        exam_seed: Optional per-exam value so the same student gets a new paper in a new exam
+
+    Returns:
+        int: 64-bit seed
+    """
+    payload = f"{subject.strip().lower()}\0{student_id}\0{exam_seed if exam_seed is not None else ''}"
+    return int.from_bytes(hashlib.sha256(payload.encode('utf-8')).digest()[:8], 'big')
+
+
+def allocate(count, mix, available):
+    """
+    Split a question count across difficulties.
+
+    Uses largest-remainder rounding of the mix weights, then moves any shortfall
+    (difficulties with too few questions) to the others.
+
+    Args:
+        count (int): Questions wanted
+        mix (dict): Difficulty -> weight
+        available (dict): Difficulty -> questions available
+
+    Returns:
+        dict: Difficulty -> number of questions to draw
+    """
+    weights = {d: max(0.0, float(w)) for d, w in mix.items() if available.get(d)}
+    total = sum(weights.values())
+    if not total:
+        # Requested difficulties are empty: fall back to whatever the bank has
+        weights = {d: 1.0 for d, n in available.items() if n}
+        total = sum(weights.values())
+    if not total:
+        return {}
+
+    exact = {d: count * w / total for d, w in weights.items()}
+    quotas = {d: int(x) for d, x in exact.items()}
+    for d in sorted(exact, key=lambda d: exact[d] - quotas[d], reverse=True)[:count - sum(quotas.values())]:
+        quotas[d] += 1
+
+    # Cap at availability and hand the overflow to difficulties with spare questions
+    overflow = 0
+    for d in quotas:
+        if quotas[d] > available[d]:
+            overflow += quotas[d] - available[d]
+            quotas[d] = available[d]
+    for d in sorted(available, key=lambda d: weights.get(d, 0.0), reverse=True):
+        if not overflow:
+            break
+        spare = available[d] - quotas.get(d, 0)
+        if spare > 0:
+            take = min(spare, overflow)
+            quotas[d] = quotas.get(d, 0) + take
+            overflow -= take
+    return quotas
+
+
+def _distinct_indices(n, rng):
+    """Yield distinct random indices in range(n) without building the full permutation."""
+    swapped = {}
+    for i in range(n):
+        j = rng.randrange(i, n)
+        yield swapped.get(j, j)
+        swapped[j] = swapped.get(i, i)
+
+
+class ExamSampler:
+    def __init__(self, bank=None):
+        """
+        Initialize the sampler.
+
+        Args:
+            bank (QuestionBank): Bank to sample from (default: the shared bank)
+        """
+        self.bank = bank if bank is not None else get_bank()
+
+    def sample(self, subject, count, mix=None, seed=None, exclude=()):
+        """
+        Build a random paper from the bank.
+
+        Args:
+            subject (str): Subject name or alias
+            count (int): Number of questions
+            mix (dict): Difficulty -> weight, e.g. {'easy': 2, 'medium': 2, 'hard': 1}
+                (default: equal easy/medium/hard)
+            seed: Seed for reproducible papers (see student_seed()); None = fresh randomness
+            exclude (iterable): Question texts the student has already seen
+
+        Returns:
+            list: Up to `count` question dicts (fewer if the bank runs out); empty if
+                the subject is not in the bank
+        """
+        name = self.bank.resolve_subject(subject)
+        if name is None or count < 1:
+            return []
+
+        rng = random.Random(seed)
+        exclude = set(exclude)
+        pools = {d: self.bank.questions_by_difficulty(name, d) for d in self.bank.difficulty_counts(name)}
+        available = {d: len(pool) for d, pool in pools.items()}
+        quotas = allocate(count, mix or DEFAULT_MIX, available)
+
+        paper = []
+        short = 0
+        for difficulty in sorted(quotas, key=self._difficulty_order):
+            want = quotas[difficulty] + short
+            picked = self._draw(pools[difficulty], want, rng, exclude)
+            short = want - len(picked)
+            paper.extend(picked)
+
+        # Excluded questions can leave a gap; top up from any difficulty
+        if len(paper) < count:
+            chosen = {q['question'] for q in paper}
+            for difficulty, pool in pools.items():
+                paper.extend(self._draw(pool, count - len(paper), rng, exclude | chosen))
+                chosen = {q['question'] for q in paper}
+                if len(paper) >= count:
+                    break
+
+        rng.shuffle(paper)
+        return paper[:count]
+
+    def sample_many(self, subject, count, student_ids, mix=None, exam_seed=None, exclude=None):
+        """
+        Build one reproducible paper per student.
+
+        Args:
+            subject (str): Subject name or alias
+            count (int): Questions per paper
+            student_ids (iterable): Student identifiers
+            mix (dict): Difficulty weights
+            exam_seed: Per-exam value mixed into every student's seed
+            exclude (dict): Student id -> question texts already seen
+
+        Returns:
+            dict: Student id -> list of question dicts
+        """
+        exclude = exclude or {}
+        return {
+            student_id: self.sample(subject, count, mix=mix,
+                                    seed=student_seed(subject, student_id, exam_seed),
+                                    exclude=exclude.get(student_id, ()))
+            for student_id in student_ids
+        }
+
+    @staticmethod
+    def _difficulty_order(difficulty):
+        return DIFFICULTIES.index(difficulty) if difficulty in DIFFICULTIES else len(DIFFICULTIES)
+
+    @staticmethod
+    def _draw(pool, want, rng, exclude):
+        picked = []
+        if want <= 0:
+            return picked
+        for index in _distinct_indices(len(pool), rng):
+            q = pool[index]
+            if q['question'] in exclude:
+                continue
+            picked.append(q)
+            if len(picked) >= want:
+                break
+        return picked
@@ -0,0 +1,390 @@
+"""
+Question similarity index
+MinHash signatures with LSH banding find near-duplicate questions without comparing against
+every stored question; candidates are confirmed with exact Jaccard similarity. Also used for
+fuzzy subject-name matching (character bigrams). NumPy vectorizes hashing when installed.
+"""
+
+import os
+import random
+import re
+import threading
+import zlib
+
+# Optional import - vectorized signature hashing and exhaustive scoring
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+# Question pairs at least this similar (Jaccard of their words) count as duplicates
+DUPLICATE_THRESHOLD = 0.8
+
+# 64 hashes in 16 bands of 4: pairs at similarity 0.8 share a bucket >99.9% of the time,
+# pairs at 0.5 about 64% of the time, so lookups only score a handful of candidates
+NUM_PERM = 64
+BANDS = 16
+
+# Questions generated at runtime stop being added once the shared index holds this many
+MAX_ENTRIES = int(os.getenv('SIMILARITY_MAX_ENTRIES', '100000'))
+
+_PRIME = (1 << 31) - 1
+_WORD = re.compile(r"[a-z0-9+#]+")
+
+# Words that carry no key point of an answer (used for grading terms, not for question shingles:
+# "why"/"when" or "for"/"with" change what a question asks)
+_STOPWORDS = frozenset({
+    'a', 'an', 'the', 'is', 'are', 'was', 'were', 'be', 'what', 'which', 'how', 'why', 'when',
+    'do', 'does', 'did', 'of', 'in', 'on', 'to', 'for', 'and', 'or', 'with', 'by', 'it', 'its',
+    'this', 'that', 'explain', 'describe', 'define', 'briefly', 'can', 'you', 'your', 'use', 'used'
+})
+
+
+def content_words(text):
+    """Lowercased words without stopwords, plurals folded ("lists" -> "list"), in order."""
+    return [_singular(w) for w in _WORD.findall(text.lower()) if w not in _STOPWORDS]
+
+
+def _singular(word):
+    if len(word) <= 3 or not word.endswith('s') or word.endswith('ss'):
+        return word
+    return word[:-3] + 'y' if word.endswith('ies') else word[:-1]
+
+
+def word_shingles(text):
+    """Every word of a question, plurals folded; question words and keywords are kept."""
+    return frozenset(_singular(w) for w in _WORD.findall(text.lower()))
+
+
+def char_shingles(text, n=2):
+    """Character n-grams of a short name, padded so first and last letters count."""
+    text = f" {' '.join(text.lower().split())} "
+    return frozenset(text[i:i + n] for i in range(len(text) - n + 1))
+
+
+def jaccard(a, b):
+    """Jaccard similarity of two shingle sets."""
+    if not a or not b:
+        return 1.0 if a == b else 0.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    def __init__(self, num_perm=NUM_PERM, seed=1):
+        """
+        Universal hash family (a*x + b) mod p; the same seed gives the same signatures.
+
+        Args:
+            num_perm (int): Signature length
+            seed (int): Seed for the hash coefficients
+        """
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.a = [rng.randrange(1, _PRIME) for _ in range(num_perm)]
+        self.b = [rng.randrange(0, _PRIME) for _ in range(num_perm)]
+        if np is not None:
+            self._a = np.array(self.a, dtype=np.uint64)
+            self._b = np.array(self.b, dtype=np.uint64)
+
+    @staticmethod
+    def _hashes(shingles):
+        # crc32 is stable across processes (unlike hash()), so signatures can be compared anywhere
+        return [zlib.crc32(s.encode('utf-8')) % _PRIME for s in shingles] or [0]
+
+    def signature(self, shingles):
+        """
+        MinHash signature of one shingle set.
+
+        Returns:
+            tuple or numpy.ndarray: num_perm minimum hash values
+        """
+        hashes = self._hashes(shingles)
+        if np is not None:
+            h = np.array(hashes, dtype=np.uint64)
+            # Coefficients and hashes are below 2**31, so the products fit in 64 bits
+            return ((np.outer(h, self._a) + self._b) % _PRIME).min(axis=0).astype(np.uint32)
+        return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in zip(self.a, self.b))
+
+    def signatures(self, shingle_sets):
+        """Signatures of many shingle sets (hashed in one vectorized pass with NumPy)."""
+        if np is None or not shingle_sets:
+            return [self.signature(s) for s in shingle_sets]
+        per_set = [self._hashes(s) for s in shingle_sets]
+        starts = np.cumsum([0] + [len(h) for h in per_set[:-1]])
+        h = np.fromiter((x for hashes in per_set for x in hashes), dtype=np.uint64)
+        values = (np.outer(h, self._a) + self._b) % _PRIME
+        return list(np.minimum.reduceat(values, starts, axis=0).astype(np.uint32))
+
+
+_hashers = {}
+
+
+def _get_hasher(num_perm):
+    hasher = _hashers.get(num_perm)
+    if hasher is None:
+        hasher = _hashers.setdefault(num_perm, MinHasher(num_perm))
+    return hasher
+
+
+class SimilarityIndex:
+    def __init__(self, threshold=DUPLICATE_THRESHOLD, shingle=word_shingles, num_perm=NUM_PERM, bands=BANDS,
+                 max_entries=None):
+        """
+        Near-duplicate index over short texts.
+
+        Args:
+            threshold (float): Default Jaccard similarity for a match
+            shingle: Function turning a text into its shingle set (word_shingles or char_shingles)
+            num_perm (int): MinHash signature length (must be divisible by bands)
+            bands (int): LSH bands; more bands find less similar pairs
+            max_entries (int): Stop accepting add() calls beyond this size (None = unbounded)
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.shingle = shingle
+        self.rows = num_perm // bands
+        self.max_entries = max_entries
+        self._hasher = _get_hasher(num_perm)
+        self._buckets = [{} for _ in range(bands)]
+        self._shingles = []
+        self._signatures = []
+        self._entries = []
+        self._matrix = None
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.matches = 0
+
+    def _band_keys(self, signature):
+        rows = self.rows
+        if np is not None:
+            return [signature[i:i + rows].tobytes() for i in range(0, len(signature), rows)]
+        return [signature[i:i + rows] for i in range(0, len(signature), rows)]
+
+    def add(self, text, entry=None):
+        """
+        Index a text.
+
+        Args:
+            text (str): Question text (or name) to index
+            entry: Value returned for matches (default: the text)
+
+        Returns:
+            bool: False if the index is full
+        """
+        return self.add_many([text], [entry])[0] if text is not None else False
+
+    def add_many(self, texts, entries=None):
+        """Index several texts at once (signatures are computed in one pass)."""
+        entries = entries if entries is not None else [None] * len(texts)
+        shingle_sets = [self.shingle(text) for text in texts]
+        signatures = self._hasher.signatures(shingle_sets)
+        added = []
+        with self._lock:
+            for text, entry, shingles, signature in zip(texts, entries, shingle_sets, signatures):
+                if self.max_entries is not None and len(self._entries) >= self.max_entries:
+                    added.append(False)
+                    continue
+                position = len(self._entries)
+                self._entries.append(entry if entry is not None else text)
+                self._shingles.append(shingles)
+                self._signatures.append(signature)
+                for bucket, key in zip(self._buckets, self._band_keys(signature)):
+                    bucket.setdefault(key, []).append(position)
+                added.append(True)
+            self._matrix = None
+        return added
+
+    def query(self, text, threshold=None, limit=1, where=None, exhaustive=False):
+        """
+        Find indexed texts similar to `text`.
+
+        Args:
+            text (str): Text to look up
+            threshold (float): Minimum Jaccard similarity (default: the index threshold)
+            limit (int): Maximum number of matches
+            where: Optional predicate on entries (e.g. same subject only)
+            exhaustive (bool): Score every entry instead of only LSH candidates; finds matches
+                below the banding sweet spot (meant for small indexes such as subject names)
+
+        Returns:
+            list: (score, entry) pairs, most similar first
+        """
+        threshold = self.threshold if threshold is None else threshold
+        shingles = self.shingle(text)
+        with self._lock:
+            self.queries += 1
+            if exhaustive:
+                candidates = self._exhaustive_candidates(shingles, threshold)
+            else:
+                signature = self._hasher.signature(shingles)
+                candidates = set()
+                for bucket, key in zip(self._buckets, self._band_keys(signature)):
+                    candidates.update(bucket.get(key, ()))
+            scored = []
+            for position in candidates:
+                entry = self._entries[position]
+                if where is not None and not where(entry):
+                    continue
+                score = jaccard(shingles, self._shingles[position])
+                if score >= threshold:
+                    scored.append((score, position))
+            scored.sort(key=lambda item: (-item[0], item[1]))
+            if scored:
+                self.matches += 1
+            return [(round(score, 4), self._entries[position]) for score, position in scored[:limit]]
+
+    def _exhaustive_candidates(self, shingles, threshold):
+        if np is None or not self._signatures:
+            return range(len(self._entries))
+        # Estimated similarity of every entry in one comparison; the slack covers estimator noise
+        if self._matrix is None:
+            self._matrix = np.vstack(self._signatures)
+        estimates = (self._matrix == self._hasher.signature(shingles)).mean(axis=1)
+        return np.nonzero(estimates >= threshold - 0.2)[0].tolist()
+
+    def find(self, text, threshold=None, where=None, exhaustive=False):
+        """
+        Best match for `text`.
+
+        Returns:
+            tuple: (score, entry), or None if nothing reaches the threshold
+        """
+        matches = self.query(text, threshold=threshold, limit=1, where=where, exhaustive=exhaustive)
+        return matches[0] if matches else None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Get index counters.
+
+        Returns:
+            dict: size, queries, matches and whether NumPy is used
+        """
+        with self._lock:
+            return {'size': len(self._entries), 'queries': self.queries, 'matches': self.matches,
+                    'numpy': NUMPY_AVAILABLE}
+
+
+def dedupe(items, threshold=DUPLICATE_THRESHOLD, key='question'):
+    """
+    Drop near-duplicate questions, keeping the first occurrence.
+
+    Args:
+        items (list): Question dicts
+        threshold (float): Similarity at which two questions are duplicates
+        key (str): Field holding the question text
+
+    Returns:
+        list: Question dicts without near-duplicates, in original order
+    """
+    seen = SimilarityIndex(threshold)
+    kept = []
+    for item in items:
+        text = item[key]
+        if seen.find(text) is not None:
+            continue
+        seen.add(text)
+        kept.append(item)
+    return kept
+
+
+_index = None
+# Bank file subjects already added to the shared index
+_indexed_subjects = set()
+_index_lock = threading.Lock()
+
+
+def _add_bank_subject(index, bank, subject):
+    questions = [q for q in bank.get(subject) if q.get('question')]
+    # Bank questions always fit; only generated ones are capped
+    index.max_entries = max(index.max_entries or 0, MAX_ENTRIES, len(index) + len(questions))
+    index.add_many([q['question'] for q in questions],
+                   [{'question': q['question'], 'answer': q.get('answer'), 'subject': subject,
+                     'source': 'bank'} for q in questions])
+
+
+def get_index(subject=None):
+    """
+    Get the shared index.
+
+    Built on first use from the bank's in-memory (predefined) subjects. Subjects from a
+    QUESTION_BANK_PATH file are added the first time they are asked for, so a large bank file
+    costs no startup time or memory for subjects nobody looks up.
+
+    Entries are dicts with 'question', 'answer', 'subject' and 'source' ('bank' or 'generated').
+
+    Args:
+        subject (str): Subject name or alias whose bank questions must be in the index
+    """
+    global _index
+    # Imported here: the bank imports this module for fuzzy subject matching
+    from question_bank import get_bank
+
+    bank = get_bank()
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = SimilarityIndex(max_entries=MAX_ENTRIES)
+                for name in bank.subjects():
+                    if not bank.is_file_backed(name):
+                        _add_bank_subject(index, bank, name)
+                _index = index
+    name = bank.resolve_subject(subject) if subject else None
+    if name is not None and name not in _indexed_subjects and bank.is_file_backed(name):
+        with _index_lock:
+            if name not in _indexed_subjects:
+                _add_bank_subject(_index, bank, name)
+                _indexed_subjects.add(name)
+    return _index
+
+
+def remember(subject, questions):
+    """
+    Add generated questions to the shared index, skipping ones it already holds.
+
+    Args:
+        subject (str): Subject the questions were generated for
+        questions (list): Question dicts
+    """
+    index = get_index(subject)
+    for item in questions:
+        text = item.get('question')
+        if text and index.find(text) is None:
+            index.add(text, {'question': text, 'answer': item.get('answer'), 'subject': subject,
+                             'source': 'generated'})
+
+
+def lookup(question, subject=None, threshold=None, limit=5):
+    """
+    Find bank or previously generated questions similar to `question`.
+
+    Without a subject, bank file subjects are only searched once something has asked for them.
+
+    Args:
+        question (str): Question text
+        subject (str): Only match questions of this subject (name or alias)
+        threshold (float): Minimum similarity (default DUPLICATE_THRESHOLD)
+        limit (int): Maximum number of matches
+
+    Returns:
+        list: Match dicts with 'question', 'subject', 'source' and 'score', most similar first
+    """
+    where = None
+    if subject:
+        from question_bank import get_bank
+
+        name = get_bank().resolve_subject(subject) or subject
+        key = ' '.join(name.lower().split())
+        where = lambda entry: ' '.join(entry['subject'].lower().split()) == key
+    return [{'question': entry['question'], 'subject': entry['subject'], 'source': entry['source'], 'score': score}
+            for score, entry in get_index(subject).query(question, threshold=threshold, limit=limit, where=where)]
+
+
+def stats():
+    """Shared index counters, or None if it has not been built yet."""
+    return _index.stats() if _index is not None else None
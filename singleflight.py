@@ -0,0 +1,76 @@
+"""
+Request coalescing (single-flight)
+Concurrent calls with the same key share one in-flight computation: the first caller runs
+it and every caller that arrives before it finishes receives the same result or error
+"""
+
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        """Group of keyed in-flight calls, safe to share between request threads."""
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs), or wait for the identical call already running under key.
+
+        The same result object is handed to every caller, so treat it as read-only.
+
+        Args:
+            key: Hashable identity of the call (normalized request parameters)
+            fn: Function to run if no identical call is in flight
+
+        Returns:
+            fn's result (its exception is raised in every waiting caller)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            # Later callers start a fresh call; this one's result is not cached
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        """
+        Get coalescing counters.
+
+        Returns:
+            dict: in_flight, executed (calls actually run) and coalesced (callers that shared one)
+        """
+        with self._lock:
+            return {'in_flight': len(self._calls), 'executed': self.executed, 'coalesced': self.coalesced}
@@ -0,0 +1,367 @@
+"""
+Exam results store
+Generated papers, their questions and graded submissions kept in SQLite. Writes are queued and
+applied by a background thread in batched transactions, so request handlers never wait on disk.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS exams ("
+    "id TEXT PRIMARY KEY, subject TEXT NOT NULL, include_answers INTEGER NOT NULL, "
+    "seed TEXT, student_id TEXT, created REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS questions ("
+    "exam_id TEXT NOT NULL, position INTEGER NOT NULL, question TEXT NOT NULL, answer TEXT, "
+    "PRIMARY KEY (exam_id, position))",
+    "CREATE TABLE IF NOT EXISTS submissions ("
+    "id TEXT PRIMARY KEY, exam_id TEXT, position INTEGER, student_id TEXT, question TEXT NOT NULL, "
+    "answer TEXT NOT NULL, score INTEGER, feedback TEXT, evaluation TEXT, grader TEXT, created REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS exams_subject ON exams (subject, created)",
+    "CREATE INDEX IF NOT EXISTS submissions_exam_score ON submissions (exam_id, score)",
+    "CREATE INDEX IF NOT EXISTS submissions_exam_position ON submissions (exam_id, position, score)",
+    "CREATE INDEX IF NOT EXISTS submissions_student ON submissions (student_id, created)",
+)
+
+_INSERT_EXAM = "INSERT OR REPLACE INTO exams (id, subject, include_answers, seed, student_id, created) VALUES (?, ?, ?, ?, ?, ?)"
+_INSERT_QUESTION = "INSERT OR REPLACE INTO questions (exam_id, position, question, answer) VALUES (?, ?, ?, ?)"
+_INSERT_SUBMISSION = (
+    "INSERT OR REPLACE INTO submissions (id, exam_id, position, student_id, question, answer, score, feedback, "
+    "evaluation, grader, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+_UPDATE_GRADE = "UPDATE submissions SET score = ?, feedback = ?, evaluation = ?, grader = ? WHERE id = ?"
+
+_SUBMISSION_COLUMNS = ('id', 'exam_id', 'position', 'student_id', 'question', 'answer', 'score', 'feedback',
+                       'evaluation', 'grader', 'created')
+
+
+class ResultsStore:
+    def __init__(self, path, batch_size=200, flush_interval=0.5, max_queue=10000):
+        """
+        Open (or create) a results database.
+
+        Args:
+            path (str): SQLite file path
+            batch_size (int): Most queued writes applied in one transaction
+            flush_interval (float): Longest a queued write waits for a batch to fill (seconds)
+            max_queue (int): Queued writes before record_*() calls start to wait for the writer
+        """
+        self.path = path
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        self.max_queue = max(1, int(max_queue))
+        self._lock = threading.Lock()
+        self._pid = None
+        self._db = None
+        self._queue = None
+        self._writer = None
+        self._pending_exams = None
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+        self._connect()
+
+    def _connect(self):
+        self._pid = os.getpid()
+        # The queue and writer thread are per process; the writer starts on the first write
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._writer = None
+        # Exams queued but not yet on disk, so they can be read back at once
+        self._pending_exams = {}
+        # Writes queued and writes the writer has finished with (written or failed)
+        self._enqueued = 0
+        self._done = 0
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        # WAL lets readers run while the writer thread commits a batch
+        self._db.execute("PRAGMA journal_mode=WAL")
+        for statement in _SCHEMA:
+            self._db.execute(statement)
+        self._db.commit()
+
+    @property
+    def _conn(self):
+        # A connection (and the writer thread) must not be shared across fork; reopen in the child
+        if self._pid != os.getpid():
+            self._connect()
+        return self._db
+
+    def _enqueue(self, statement, params):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._connect()
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, args=(self._queue,),
+                                                name="results-writer", daemon=True)
+                self._writer.start()
+            self._enqueued += 1
+        self._queue.put((statement, params))
+
+    def _write_loop(self, pending):
+        # The writer has its own connection, so request threads reading the store never wait on a commit
+        db = sqlite3.connect(self.path)
+        db.execute("PRAGMA synchronous=NORMAL")
+        try:
+            while True:
+                batch = [pending.get()]
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = pending.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    batch.append(item)
+                    # A flush() or close() is waiting: apply what has arrived instead of filling the batch
+                    if not isinstance(item, tuple):
+                        break
+                if not self._apply(db, batch):
+                    return
+        finally:
+            db.close()
+
+    def _apply(self, db, batch):
+        """Write one batch in a single transaction; returns False once the store is closed."""
+        writes = [item for item in batch if isinstance(item, tuple)]
+        if writes:
+            try:
+                with db:
+                    for statement, params in writes:
+                        db.execute(statement, params)
+                written = writes
+                self.batches += 1
+            except sqlite3.Error as e:
+                # One bad write must not lose the rest: retry them one at a time
+                print(f"Error writing results batch, retrying writes one by one: {e}")
+                written = []
+                for statement, params in writes:
+                    try:
+                        with db:
+                            db.execute(statement, params)
+                        written.append((statement, params))
+                    except sqlite3.Error as e:
+                        self.errors += 1
+                        print(f"Error writing result: {e}")
+            self.written += len(written)
+            with self._lock:
+                self._done += len(writes)
+                # Exams that failed to write stay readable from memory
+                for statement, params in written:
+                    if statement is _INSERT_EXAM:
+                        self._pending_exams.pop(params[0], None)
+        running = True
+        for item in batch:
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is None:
+                running = False
+        return running
+
+    def flush(self, timeout=5):
+        """
+        Wait until every write queued so far is on disk.
+
+        Returns:
+            bool: False if the writer did not catch up within `timeout` seconds
+        """
+        with self._lock:
+            if self._writer is None or self._pid != os.getpid() or self._done == self._enqueued:
+                return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=5):
+        """Write everything still queued and stop the writer thread."""
+        if self._writer is not None and self._pid == os.getpid() and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout)
+
+    def record_exam(self, subject, questions, include_answers=True, seed=None, student_id=None):
+        """
+        Queue a generated paper for storage.
+
+        Args:
+            subject (str): Subject name
+            questions (list): Question dicts ('question' and optionally 'answer')
+            include_answers (bool): Whether the paper was generated with answers
+            seed: Sampling seed the paper was drawn with, if any
+            student_id: Student the paper was drawn for, if any
+
+        Returns:
+            str: New exam id (readable with get_exam() straight away)
+        """
+        exam_id = uuid.uuid4().hex
+        created = time.time()
+        exam = {
+            'id': exam_id, 'subject': subject, 'include_answers': bool(include_answers),
+            'seed': None if seed is None else str(seed), 'student_id': None if student_id is None else str(student_id),
+            'created': created,
+            'questions': [{'position': i, 'question': q.get('question', ''), 'answer': q.get('answer')}
+                          for i, q in enumerate(questions)]
+        }
+        with self._lock:
+            if self._pid != os.getpid():
+                self._connect()
+            self._pending_exams[exam_id] = exam
+        self._enqueue(_INSERT_EXAM, (exam_id, subject, int(bool(include_answers)), exam['seed'],
+                                     exam['student_id'], created))
+        for q in exam['questions']:
+            self._enqueue(_INSERT_QUESTION, (exam_id, q['position'], q['question'], q['answer']))
+        return exam_id
+
+    def record_submission(self, question, answer, score, feedback=None, evaluation=None, grader=None,
+                          exam_id=None, position=None, student_id=None):
+        """
+        Queue a graded answer for storage.
+
+        Args:
+            question (str): The exam question
+            answer (str): Student's answer
+            score (int): Score (None if it could not be graded)
+            feedback (str): Feedback text
+            evaluation (str): Full evaluation text
+            grader (str): 'local', 'local_estimate' or 'model'
+            exam_id (str): Exam the answer belongs to, if any
+            position (int): Question index within the exam
+            student_id: Student who answered
+
+        Returns:
+            str: New submission id
+        """
+        submission_id = uuid.uuid4().hex
+        self._enqueue(_INSERT_SUBMISSION, (
+            submission_id, None if exam_id is None else str(exam_id), position, None if student_id is None else str(student_id), question, answer,
+            score, feedback, evaluation, grader, time.time()
+        ))
+        return submission_id
+
+    def update_grade(self, submission_id, score, feedback, evaluation, grader):
+        """Queue a new grade for a stored submission (e.g. after a regrade)."""
+        self._enqueue(_UPDATE_GRADE, (score, feedback, evaluation, grader, submission_id))
+
+    def get_exam(self, exam_id):
+        """
+        Get a stored paper with its questions.
+
+        Returns:
+            dict: id, subject, include_answers, seed, student_id, created and questions
+                (each with position, question and answer), or None if unknown
+        """
+        with self._lock:
+            pending = self._pending_exams.get(exam_id)
+            if pending is not None:
+                return dict(pending, questions=[dict(q) for q in pending['questions']])
+            row = self._conn.execute(
+                "SELECT id, subject, include_answers, seed, student_id, created FROM exams WHERE id = ?",
+                (exam_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            questions = self._conn.execute(
+                "SELECT position, question, answer FROM questions WHERE exam_id = ? ORDER BY position",
+                (exam_id,)
+            ).fetchall()
+        return {
+            'id': row[0], 'subject': row[1], 'include_answers': bool(row[2]), 'seed': row[3],
+            'student_id': row[4], 'created': row[5],
+            'questions': [{'position': p, 'question': q, 'answer': a} for p, q, a in questions]
+        }
+
+    def list_exams(self, subject=None, limit=50):
+        """
+        List stored papers, newest first.
+
+        Args:
+            subject (str): Only papers for this subject
+            limit (int): Maximum number of papers
+
+        Returns:
+            list: Dicts with id, subject, student_id, created and question count
+        """
+        self.flush()
+        sql = ("SELECT e.id, e.subject, e.student_id, e.created, "
+               "(SELECT COUNT(*) FROM questions q WHERE q.exam_id = e.id) FROM exams e")
+        params = []
+        if subject:
+            sql += " WHERE e.subject = ?"
+            params.append(subject)
+        sql += " ORDER BY e.created DESC LIMIT ?"
+        params.append(int(limit))
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [{'id': r[0], 'subject': r[1], 'student_id': r[2], 'created': r[3], 'num_questions': r[4]}
+                for r in rows]
+
+    def submissions(self, exam_id=None, student_id=None, limit=1000):
+        """
+        Get stored submissions, oldest first.
+
+        Args:
+            exam_id (str): Only answers to this exam
+            student_id: Only answers by this student
+            limit (int): Maximum number of submissions
+
+        Returns:
+            list: Submission dicts
+        """
+        self.flush()
+        conditions = []
+        params = []
+        if exam_id is not None:
+            conditions.append("exam_id = ?")
+            params.append(exam_id)
+        if student_id is not None:
+            conditions.append("student_id = ?")
+            params.append(str(student_id))
+        sql = f"SELECT {', '.join(_SUBMISSION_COLUMNS)} FROM submissions"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY created LIMIT ?"
+        params.append(int(limit))
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(zip(_SUBMISSION_COLUMNS, row)) for row in rows]
+
+    def score_distribution(self, exam_id):
+        """
+        Summarize the scores recorded for an exam.
+
+        Returns:
+            dict: count, mean, min, max, histogram (score -> count) and per_question
+                (position, count, mean) over graded submissions
+        """
+        self.flush()
+        with self._lock:
+            histogram = self._conn.execute(
+                "SELECT score, COUNT(*) FROM submissions WHERE exam_id = ? AND score IS NOT NULL "
+                "GROUP BY score ORDER BY score", (exam_id,)
+            ).fetchall()
+            per_question = self._conn.execute(
+                "SELECT position, COUNT(*), AVG(score) FROM submissions WHERE exam_id = ? AND score IS NOT NULL "
+                "GROUP BY position ORDER BY position", (exam_id,)
+            ).fetchall()
+        count = sum(n for _, n in histogram)
+        return {
+            'count': count,
+            'mean': round(sum(score * n for score, n in histogram) / count, 2) if count else None,
+            'min': histogram[0][0] if histogram else None,
+            'max': histogram[-1][0] if histogram else None,
+            'histogram': {str(score): n for score, n in histogram},
+            'per_question': [{'position': p, 'count': n, 'mean': round(mean, 2)} for p, n, mean in per_question]
+        }
+
+    def stats(self):
+        """
+        Get writer counters.
+
+        Returns:
+            dict: queued (writes not yet applied), written, batches and errors
+        """
+        return {'queued': self._queue.qsize(), 'written': self.written, 'batches': self.batches,
+                'errors': self.errors}
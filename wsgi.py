@@ -0,0 +1,24 @@
+"""
+Production entry point for the API server
+
+WSGI (gunicorn, waitress, ...):
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+ASGI (uvicorn, hypercorn) - needs asgiref, which ships with flask[async]:
+    uvicorn wsgi:asgi_app --workers 1
+"""
+
+from api_server import app, preload
+
+# Build the question bank indexes at import, i.e. once in the gunicorn master when
+# preload_app is on, so forked workers share them instead of each building its own
+preload()
+
+application = app
+
+# Optional import - only needed to serve the app from an ASGI server
+try:
+    from asgiref.wsgi import WsgiToAsgi
+    asgi_app = WsgiToAsgi(app)
+except ImportError:
+    asgi_app = None